@@ -1,10 +1,122 @@
-from openai import OpenAI
+import asyncio
+import hashlib
+import json
+from time import perf_counter, monotonic
 from config import Config
 from personnages import get_character_by_id
+from ratelimit import ConcurrencyLimiter
+from resilience import CircuitBreaker, backoff_delays
+import metrics
 
-client = OpenAI(api_key=Config.OPENAI_API_KEY)
+_client = None
 
-def generate_summary(answers, objectifs):
+def get_client():
+    """Client asynchrone partagé, créé au premier appel (le SDK openai est long à importer)
+
+    Un seul pool de connexions HTTP borné pour tout le worker, les appels GPT ne bloquent
+    pas la boucle d'événements.
+    """
+    global _client
+    if _client is None:
+        import httpx
+        from openai import AsyncOpenAI
+        timeout = httpx.Timeout(Config.OPENAI_TIMEOUT, connect=Config.OPENAI_CONNECT_TIMEOUT)
+        _client = AsyncOpenAI(
+            api_key=Config.OPENAI_API_KEY,
+            base_url=Config.OPENAI_BASE_URL,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=Config.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=timeout,
+            ),
+            timeout=timeout,
+            # Nouvelles tentatives gérées ici (create_completion), sous une échéance globale
+            max_retries=0,
+        )
+    return _client
+
+def __getattr__(name):
+    # ai_service.client reste accessible (et remplaçable dans les tests)
+    if name == 'client':
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Appels GPT simultanés du worker ; au-delà, file d'attente bornée puis rejet (LLMBusy -> 429)
+llm_limiter = ConcurrencyLimiter(
+    Config.LLM_CONCURRENCY,
+    Config.LLM_MAX_WAITING,
+    Config.LLM_QUEUE_TIMEOUT,
+    Config.LLM_RETRY_AFTER
+)
+
+# Au-delà de BREAKER_FAILURE_RATIO d'échecs récents, les appels échouent aussitôt (CircuitOpen)
+llm_breaker = CircuitBreaker(
+    Config.BREAKER_FAILURE_RATIO,
+    Config.BREAKER_MIN_CALLS,
+    Config.BREAKER_WINDOW,
+    Config.BREAKER_COOLDOWN
+)
+
+def is_transient(exc) -> bool:
+    """Panne passagère du service : délai dépassé, erreur réseau, 429 ou 5xx d'OpenAI"""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    import openai
+    return isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+async def create_completion(kind, **params):
+    """Appel borné par LLM_DEADLINE, retenté après une attente aléatoire sur panne passagère"""
+    deadline = monotonic() + Config.LLM_DEADLINE
+    delays = backoff_delays(Config.LLM_MAX_RETRIES, Config.LLM_RETRY_BASE, Config.LLM_RETRY_MAX)
+    while True:
+        try:
+            response = await asyncio.wait_for(
+                get_client().chat.completions.create(model=Config.OPENAI_MODEL, **params),
+                deadline - monotonic()
+            )
+        except Exception as exc:
+            transient = is_transient(exc)
+            llm_breaker.record(failed=transient)
+            delay = next(delays, None)
+            if not transient or delay is None or monotonic() + delay >= deadline:
+                raise
+            metrics.LLM_RETRIES.labels(kind).inc()
+            await asyncio.sleep(delay)
+            # Disjoncteur ouvert entre-temps : inutile d'insister
+            llm_breaker.check()
+        else:
+            llm_breaker.record(failed=False)
+            return response
+
+# À incrémenter à chaque modification d'un prompt : invalide les résumés en cache
+PROMPT_VERSION = 1
+
+async def close_client():
+    if _client is not None:
+        await _client.close()
+
+def summary_fingerprint(answers, objectifs) -> str:
+    """Empreinte de tout ce qui détermine un résumé (entrées, modèle, version du prompt)"""
+    payload = json.dumps({
+        "answers": answers,
+        "objectifs": list(objectifs),
+        "model": Config.OPENAI_MODEL,
+        "prompt_version": PROMPT_VERSION,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def evaluation_fingerprint(reports_history) -> str:
+    """Empreinte de l'historique envoyé au prompt d'évaluation (le conseiller est stocké à part)"""
+    payload = json.dumps({
+        "history": list(reports_history),
+        "model": Config.OPENAI_MODEL,
+        "prompt_version": PROMPT_VERSION,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def summary_messages(answers, objectifs):
     prompt = f"""
     Les objectifs du moment:
     {objectifs}
@@ -23,17 +135,12 @@ def generate_summary(answers, objectifs):
     
     Générez un résumé concis et empathique de cette journée.
     """
-    
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "Vous êtes un assistant empathique qui analyse des journaux quotidiens."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content
+    return [
+        {"role": "system", "content": "Vous êtes un assistant empathique qui analyse des journaux quotidiens."},
+        {"role": "user", "content": prompt}
+    ]
 
-def generate_evaluation(reports_history, id=0):
+def evaluation_messages(reports_history, id=0):
     prompt = f"""
     Voici mes résumés des derniers jours :
     {reports_history}
@@ -42,12 +149,88 @@ def generate_evaluation(reports_history, id=0):
     """
 
     perso = get_character_by_id(id)
+    return [
+        {"role": "system", "content": perso['role']},
+        {"role": "user", "content": prompt}
+    ]
+
+async def complete(kind, messages, persona="none", **kwargs):
+    """Appel OpenAI instrumenté (latence, jetons, erreurs par type d'appel et personnage)"""
+    llm_breaker.check()
+    async with llm_limiter.slot():
+        start = perf_counter()
+        try:
+            response = await create_completion(kind, messages=messages, **kwargs)
+        except Exception:
+            metrics.LLM_ERRORS.labels(kind, persona).inc()
+            raise
+        finally:
+            metrics.LLM_LATENCY.labels(kind, persona).observe(perf_counter() - start)
+    metrics.record_usage(kind, persona, response.usage)
+    return response.choices[0].message.content
+
+async def generate_summary(answers, objectifs):
+    return await complete("summary", summary_messages(answers, objectifs))
+
+async def generate_evaluation(reports_history, id=0):
+    return await complete("evaluation", evaluation_messages(reports_history, id), persona=str(id))
+
+def digest_messages(texts, level):
+    periode = {"week": "d'une semaine", "month": "d'un mois"}[level]
+    prompt = f"""
+    Voici les résumés {periode} de mon journal :
+    {texts}
     
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": perso['role']},
-            {"role": "user", "content": prompt}
-        ]
+    Condensez-les en un bilan de cinq phrases au plus : humeur dominante, faits marquants et progrès sur les objectifs.
+    """
+    return [
+        {"role": "system", "content": "Vous êtes un assistant empathique qui condense des journaux quotidiens."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def generate_digest(texts, level):
+    return await complete(
+        "digest_" + level,
+        digest_messages(texts, level),
+        max_tokens=Config.DIGEST_MAX_TOKENS
     )
-    return response.choices[0].message.content
\ No newline at end of file
+
+async def stream_completion(kind, messages, persona="none"):
+    """Produit les morceaux de texte au fil de la génération (la place est gardée jusqu'à la fin du flux)"""
+    llm_breaker.check()
+    await llm_limiter.acquire()
+    start = perf_counter()
+    first_token = True
+    stream = None
+    try:
+        # Seule l'ouverture du flux est retentée : des morceaux déjà envoyés ne se reprennent pas
+        stream = await create_completion(
+            kind,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        # Fermeture du flux HTTP même si le consommateur abandonne (déconnexion du client)
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage:
+                    metrics.record_usage(kind, persona, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token:
+                        metrics.LLM_FIRST_TOKEN.labels(kind, persona).observe(perf_counter() - start)
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+    except Exception as exc:
+        metrics.LLM_ERRORS.labels(kind, persona).inc()
+        if stream is not None and is_transient(exc):
+            llm_breaker.record(failed=True)
+        raise
+    finally:
+        llm_limiter.release()
+        metrics.LLM_LATENCY.labels(kind, persona).observe(perf_counter() - start)
+
+def stream_summary(answers, objectifs):
+    return stream_completion("summary", summary_messages(answers, objectifs))
+
+def stream_evaluation(reports_history, id=0):
+    return stream_completion("evaluation", evaluation_messages(reports_history, id), persona=str(id))
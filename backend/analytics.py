@@ -0,0 +1,202 @@
+import json
+from datetime import date, timedelta
+from typing import Optional
+import numpy as np
+from sqlalchemy import select, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Report, MoodSeries
+
+# Analyse des humeurs sans appel GPT : une série compacte par utilisateur (un float32 par jour
+# depuis le premier rapport, NaN les jours sans rapport) plus les sommes nécessaires aux moyennes.
+# Chaque rapport modifie une case de la série ; l'historique n'est relu qu'à la construction.
+
+# Humeurs proposées par le formulaire, de la plus basse à la plus haute
+MOOD_SCORES = {"Triste": 1.0, "Frustré": 2.0, "Fatigué": 3.0, "Excité": 4.0, "Heureux": 5.0}
+ROLLING_WINDOWS = (7, 30)
+
+
+def mood_score(answers) -> Optional[float]:
+    if isinstance(answers, str):
+        try:
+            answers = json.loads(answers)
+        except ValueError:
+            return None
+    mood = answers.get("mood") if isinstance(answers, dict) else None
+    if isinstance(mood, str):
+        return MOOD_SCORES.get(mood)
+    if isinstance(mood, (int, float)) and not isinstance(mood, bool):
+        return float(mood)
+    return None
+
+def empty_days(count: int) -> np.ndarray:
+    return np.full(count, np.nan, dtype=np.float32)
+
+def set_day(series: MoodSeries, day: date, score: float):
+    """Place le score d'un jour dans la série et met à jour les sommes, sans relire l'historique"""
+    moods = np.frombuffer(series.moods, dtype=np.float32)
+    offset = (day - series.start_date).days
+    if offset < 0:
+        moods = np.concatenate([empty_days(-offset), moods])
+        series.start_date = day
+        offset = 0
+    elif offset >= len(moods):
+        moods = np.concatenate([moods, empty_days(offset - len(moods) + 1)])
+    else:
+        moods = moods.copy()
+
+    previous = float(moods[offset])
+    if not np.isnan(previous):
+        # Rapport du même jour remplacé
+        series.count -= 1
+        series.total -= previous
+        series.total_sq -= previous * previous
+    moods[offset] = score
+    series.count += 1
+    series.total += score
+    series.total_sq += score * score
+    series.moods = moods.tobytes()
+
+async def build_series(db, user_id: int) -> Optional[MoodSeries]:
+    result = await db.execute(
+        select(Report.date, Report.answers)
+        .filter(Report.user_id == user_id)
+        .order_by(Report.date, Report.id)
+    )
+    scored = [(day, mood_score(answers)) for day, answers in result.all()]
+    scored = [(day, score) for day, score in scored if score is not None]
+    if not scored:
+        return None
+
+    start = scored[0][0]
+    moods = empty_days((scored[-1][0] - start).days + 1)
+    # Plusieurs rapports le même jour : le dernier l'emporte
+    for day, score in scored:
+        moods[(day - start).days] = score
+    known = moods[~np.isnan(moods)].astype(np.float64)
+    return MoodSeries(
+        user_id=user_id,
+        start_date=start,
+        moods=moods.tobytes(),
+        count=int(known.size),
+        total=float(known.sum()),
+        total_sq=float((known * known).sum())
+    )
+
+async def insert_series(db, series: MoodSeries) -> bool:
+    """INSERT ... ON CONFLICT DO NOTHING : False si la série a été créée entre-temps par une autre requête"""
+    dialect = postgresql if db.get_bind().dialect.name == 'postgresql' else sqlite
+    result = await db.execute(
+        dialect.insert(MoodSeries.__table__).on_conflict_do_nothing(index_elements=['user_id']),
+        {column.name: getattr(series, column.name) for column in MoodSeries.__table__.columns}
+    )
+    return result.rowcount == 1
+
+async def rebuild_series(db, user_id: int) -> Optional[MoodSeries]:
+    # Après un import en masse : une seule relecture complète
+    await db.execute(delete(MoodSeries).where(MoodSeries.user_id == user_id))
+    series = await build_series(db, user_id)
+    if series is not None:
+        db.add(series)
+    return series
+
+async def load_series(db, user_id: int) -> Optional[MoodSeries]:
+    series = (await db.execute(
+        select(MoodSeries).filter_by(user_id=user_id)
+    )).scalar_one_or_none()
+    if series is None:
+        # Utilisateur antérieur à la série : construite une fois depuis l'historique
+        series = await build_series(db, user_id)
+        if series is not None and not await insert_series(db, series):
+            series = (await db.execute(select(MoodSeries).filter_by(user_id=user_id))).scalar_one()
+    return series
+
+async def record_mood(db, user_id: int, day: date, answers: dict):
+    """À appeler dans la transaction qui insère le rapport (déjà ajouté à la session)"""
+    score = mood_score(answers)
+    if score is None:
+        return
+    series = (await db.execute(
+        select(MoodSeries).filter_by(user_id=user_id).with_for_update()
+    )).scalar_one_or_none()
+    if series is None:
+        # Première série : construite depuis l'historique, rapport en cours compris
+        if await insert_series(db, await build_series(db, user_id)):
+            return
+        # Premier rapport concurrent du même utilisateur : sa série est relue puis complétée
+        series = (await db.execute(
+            select(MoodSeries).filter_by(user_id=user_id).with_for_update()
+        )).scalar_one()
+    set_day(series, day, score)
+
+
+def rounded(values) -> list:
+    return [None if np.isnan(value) else round(float(value), 2) for value in values]
+
+def rolling_mean(moods: np.ndarray, known: np.ndarray, window: int) -> np.ndarray:
+    # Sommes cumulées : chaque fenêtre coûte O(1), les jours sans rapport sont ignorés
+    sums = np.concatenate([[0.0], np.cumsum(np.where(known, moods, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(known)])
+    end = np.arange(1, moods.size + 1)
+    begin = np.maximum(end - window, 0)
+    window_counts = counts[end] - counts[begin]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(window_counts > 0, (sums[end] - sums[begin]) / window_counts, np.nan)
+
+def streaks(known: np.ndarray) -> dict:
+    edges = np.diff(np.concatenate([[0], known.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    # La série en cours reste ouverte tant que le rapport du jour n'est pas encore rempli
+    current = int(lengths[-1]) if lengths.size and ends[-1] >= known.size - 1 else 0
+    return {"current": current, "longest": int(lengths.max()) if lengths.size else 0}
+
+def mood_stats(series: Optional[MoodSeries], today: date, days: int) -> dict:
+    window_start = today - timedelta(days=days - 1)
+    stats = {
+        "from": window_start.isoformat(),
+        "to": today.isoformat(),
+        "summary": {"count": 0, "mean": None, "std": None},
+        "series": {"mood": [None] * days, **{f"rolling_{w}": [None] * days for w in ROLLING_WINDOWS}},
+        "streaks": {"current": 0, "longest": 0},
+        "weekdays": [{"weekday": weekday, "mean": None, "count": 0} for weekday in range(7)],
+        "volatility": None,
+    }
+    if series is None or series.count == 0:
+        return stats
+
+    # Moyenne et écart-type globaux directement depuis les sommes
+    mean = series.total / series.count
+    variance = max(series.total_sq / series.count - mean * mean, 0.0)
+    stats["summary"] = {"count": series.count, "mean": round(mean, 2), "std": round(variance ** 0.5, 2)}
+
+    # Série alignée du premier jour connu (ou du début de la fenêtre) jusqu'à aujourd'hui
+    start = min(series.start_date, window_start)
+    stored = np.frombuffer(series.moods, dtype=np.float32).astype(np.float64)
+    lead = (series.start_date - start).days
+    moods = np.full((today - start).days + 1, np.nan)
+    stored = stored[:max(moods.size - lead, 0)]
+    moods[lead:lead + stored.size] = stored
+    known = ~np.isnan(moods)
+
+    window = slice(moods.size - days, None)
+    stats["series"]["mood"] = rounded(moods[window])
+    for w in ROLLING_WINDOWS:
+        stats["series"][f"rolling_{w}"] = rounded(rolling_mean(moods, known, w)[window])
+    stats["streaks"] = streaks(known)
+
+    weekdays = (start.weekday() + np.arange(moods.size)) % 7
+    counts = np.bincount(weekdays[known], minlength=7)
+    sums = np.bincount(weekdays[known], weights=moods[known], minlength=7)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    stats["weekdays"] = [
+        {"weekday": weekday, "mean": rounded([means[weekday]])[0], "count": int(counts[weekday])}
+        for weekday in range(7)
+    ]
+
+    # Volatilité : écart-type des variations d'un jour sur l'autre dans la fenêtre
+    changes = np.diff(moods[window])
+    changes = changes[~np.isnan(changes)]
+    if changes.size > 1:
+        stats["volatility"] = round(float(changes.std()), 2)
+    return stats
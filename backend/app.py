@@ -1,20 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime, date, timedelta
+from typing import Optional, List
 from pydantic import BaseModel
 import json
-from flask import Flask, request, jsonify
+import hashlib
+import base64
+import time
+from sqlalchemy import select, delete, insert, update, bindparam, func, tuple_, case, String
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import User, Report, Evaluation, Goal, Base, db_session
+from models import (
+    User, Report, Evaluation, Goal, Job, db_session, dispose_engines,
+    get_db, get_primary_db, AsyncSessionLocal
+)
 from database import init_db
-from ai_service import generate_summary, generate_evaluation
+from ai_service import (
+    generate_summary, generate_evaluation, stream_summary, stream_evaluation,
+    summary_fingerprint, evaluation_fingerprint, close_client, llm_limiter, llm_breaker
+)
 from config import Config
+from passwords import PasswordHashingBusy
+from cache import token_cache, user_cache, summary_cache, idempotency_cache, SingleFlight
+from jobs import job_queue, JobQueueFull
+from digests import refresh_digests, build_history
+from compression import CompressionMiddleware
+from ratelimit import RateLimited, LLMBusy, TokenBucketLimiter
+from resilience import CircuitOpen
+from evaluations import save_evaluation, find_evaluation, latest_report_id
+from transfer import FORMATS, InvalidRecord, export_records, import_records
+from search import index_report, index_missing, search_reports
+import metrics
+import passwords
 
 app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=Config.COMPRESSION_MIN_SIZE)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Quota de générations GPT par utilisateur
+generation_limiter = TokenBucketLimiter(Config.GENERATION_BURST, Config.GENERATION_RATE)
+# Soumissions de rapports identiques en cours, partagées entre requêtes concurrentes
+report_flights = SingleFlight()
 
 # Configuration CORS
 app.add_middleware(
@@ -26,11 +55,43 @@ app.add_middleware(
 )
 
 
+# Pool de hachage saturé : on préfère refuser vite que d'empiler les connexions
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(JobQueueFull)
+async def job_queue_full_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many pending jobs, please retry"},
+        headers={"Retry-After": "5"}
+    )
+
+# Quota utilisateur épuisé ou appels GPT saturés : 429 avec le délai conseillé
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request, exc):
+    metrics.RATE_LIMITED.labels("llm_queue" if isinstance(exc, LLMBusy) else "user_quota").inc()
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many requests, please retry later"},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))}
+    )
+
+# OpenAI en panne (disjoncteur ouvert) et pas de repli possible
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "AI service unavailable, please retry later"},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))}
+    )
+
 # Configuration sécurité
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-    deprecated="auto"
-)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Modèles Pydantic
@@ -62,44 +123,127 @@ class GoalUpdate(BaseModel):
     title: Optional[str] = None
     status: Optional[str] = None
 
+class GoalOperation(BaseModel):
+    op: str  # 'create', 'update' ou 'delete'
+    id: Optional[int] = None
+    title: Optional[str] = None
+    status: Optional[str] = None
+
+class GoalBatch(BaseModel):
+    operations: List[GoalOperation]
+
 # Fonctions utilitaires
+def respond_async(prefer: Optional[str]) -> bool:
+    # Mode tâche de fond demandé par le client (RFC 7240 : Prefer: respond-async)
+    return bool(prefer) and "respond-async" in prefer.lower()
+
+def accepted(job_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job_id, "status": "pending"},
+        headers={"Location": f"/jobs/{job_id}"}
+    )
+
+def sse(data: dict, event: Optional[str] = None) -> str:
+    # Un message Server-Sent Events
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def event_stream(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def make_etag(*versions) -> str:
+    # ETag fort calculé à partir des (id, version) des lignes, avant toute sérialisation
+    return '"' + hashlib.sha1(repr(versions).encode()).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # Suffixe ajouté par CompressionMiddleware à la représentation compressée
+        for suffix in ('-gzip"', '-br"'):
+            if candidate.endswith(suffix):
+                candidate = candidate[:-len(suffix)] + '"'
+        if candidate == etag:
+            return True
+    return False
+
+def conditional_response(request: Request, etag: str, build_content):
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=build_content(), headers=headers)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now() + Config.JWT_ACCESS_TOKEN_EXPIRES
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, Config.JWT_SECRET_KEY, algorithm="HS256")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    # Jeton déjà vu : pas de nouveau décodage tant qu'il n'a pas expiré
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    user_id = token_cache.get(token_key)
+    if user_id is None:
+        try:
+            payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=["HS256"])
+            user_id = payload.get("sub")
+            if user_id is None:
+                raise credentials_exception
+            user_id = int(user_id)
+        except (JWTError, ValueError):
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = User.get(int(user_id))
+        if "exp" in payload:
+            token_cache.set(token_key, user_id, ttl=payload["exp"] - time.time())
+
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        user = await User.get(db, user_id)
+        if user is None:
+            raise credentials_exception
+        # Détaché de la session : un rollback de la requête ne doit pas expirer l'objet partagé en cache
+        db.expunge(user)
+        user_cache.set(user_id, user)
     return user
 
+def charge_generation(user_id: int):
+    """Consomme un jeton du quota de générations, juste avant un appel GPT
+
+    Les réponses déjà connues (Idempotency-Key, rapport ou résumé existant, évaluation enregistrée)
+    et le repli quand OpenAI est indisponible ne coûtent rien : le disjoncteur est vérifié d'abord.
+    """
+    llm_breaker.fail_fast()
+    generation_limiter.consume(user_id)
+
 # Routes
 @app.post("/register", response_model=dict)
-async def register(user: UserCreate):
-    # Hasher le mot de passe avec la nouvelle configuration
-    # hashed_password = pwd_context.hash(user.password)
-    if User.create(user.username, user.password):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    if await User.create(db, user.username, user.password):
         return {"message": "User created successfully", "user": user.username}
     raise HTTPException(status_code=409, detail="Username already exists")
 
 @app.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = User.get_by_username(form_data.username)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db)
+):
+    user = await User.get_by_username(db, form_data.username)
     
     if not user:
         raise HTTPException(
@@ -109,12 +253,14 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     
     try:
-        if not User.verify_password(form_data.password, user.password_hash):
+        if not await user.check_password(db, form_data.password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+    except PasswordHashingBusy:
+        raise
     except Exception as e:
         print(f"Password verification error: {e}")
         raise HTTPException(
@@ -140,94 +286,331 @@ async def verify_token(current_user: User = Depends(get_current_user)):
         }
     }
 
+async def find_today_report(user_id: int, today: date, answers: dict):
+    # Rapport identique déjà enregistré aujourd'hui (nouvel essai du client)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Report)
+            .filter_by(user_id=user_id, date=today, answers=json.dumps(answers, sort_keys=True))
+            .limit(1)
+        )
+        return result.scalars().first()
+
+async def insert_report(user_id: int, today: date, answers: dict, summary: str):
+    async with AsyncSessionLocal() as db:
+        new_report = Report(
+            user_id=user_id,
+            date=today,
+            answers=json.dumps(answers, sort_keys=True),
+            summary=summary
+        )
+
+        try:
+            db.add(new_report)
+            # Série des humeurs, vecteur de similarité et index plein texte mis à jour dans la même transaction que le rapport
+            from analytics import record_mood  # NumPy chargé au premier rapport, pas au démarrage
+            from similarity import record_report
+            await record_mood(db, user_id, today, answers)
+            await record_report(db, new_report)
+            await index_report(db, new_report)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=str(e)
+            )
+
+    await schedule_digest_refresh(user_id)
+    return {
+        "message": "Report submitted successfully",
+        "summary": summary
+    }
+
+async def schedule_digest_refresh(user_id: int):
+    # Les résumés hebdomadaires/mensuels se construisent en tâche de fond
+    try:
+        await job_queue.submit(user_id, "digest", {})
+    except JobQueueFull:
+        pass  # rattrapé au prochain rapport
+    except Exception as e:
+        print(f"Digest scheduling error: {e}")
+
+async def store_report(user_id: int, today: date, answers: dict, goal_titles: list, fingerprint: str,
+                       charge_quota: bool = False):
+    # Sessions propres : le travail fusionné survit à la requête qui l'a lancé
+    existing = await find_today_report(user_id, today, answers)
+    if existing:
+        return {
+            "message": "Report submitted successfully",
+            "summary": existing.summary
+        }
+
+    summary = summary_cache.get(fingerprint)
+    if summary is None:
+        if charge_quota:
+            charge_generation(user_id)
+        summary = await generate_summary(answers, goal_titles)
+        summary_cache.set(fingerprint, summary)
+
+    return await insert_report(user_id, today, answers, summary)
+
+async def active_goal_titles(user_id: int):
+    # Récupérer les objectifs actifs
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Goal).filter_by(user_id=user_id, status='active')
+        )
+        return sorted(goal.title for goal in result.scalars().all())
+
+async def submit_report_for(user_id: int, answers: dict, idempotency_key: Optional[str] = None,
+                            charge_quota: bool = False):
+    # charge_quota : requête synchrone ; une tâche de fond a été décomptée à sa création
+    today = date.today()
+    goal_titles = await active_goal_titles(user_id)
+    fingerprint = summary_fingerprint(answers, goal_titles)
+
+    # Les soumissions identiques concurrentes partagent un seul appel GPT et une seule ligne
+    if idempotency_key:
+        flight_key = ("idempotency", user_id, idempotency_key)
+    else:
+        flight_key = ("report", user_id, today, fingerprint)
+    return await report_flights.do(
+        flight_key, store_report,
+        user_id, today, answers, goal_titles, fingerprint, charge_quota
+    )
+
 @app.post("/submit-report")
 async def submit_report(
+    report: ReportCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+    prefer: Optional[str] = Header(None)
+):
+    if idempotency_key:
+        cached_response = idempotency_cache.get((current_user.id, idempotency_key))
+        if cached_response is not None:
+            return accepted(cached_response["job_id"]) if "job_id" in cached_response else cached_response
+
+    if respond_async(prefer):
+        charge_generation(current_user.id)
+        job_id = await job_queue.submit(current_user.id, "report", {"answers": report.answers})
+        response = {"job_id": job_id}
+    else:
+        response = await submit_report_for(current_user.id, report.answers, idempotency_key, charge_quota=True)
+
+    if idempotency_key:
+        idempotency_cache.set((current_user.id, idempotency_key), response)
+    return accepted(response["job_id"]) if "job_id" in response else response
+
+@app.post("/submit-report/stream")
+async def submit_report_stream(
     report: ReportCreate,
     current_user: User = Depends(get_current_user)
 ):
-    today = datetime.now().strftime('%Y-%m-%d')
+    user_id = current_user.id
+    answers = report.answers
+    today = date.today()
+    goal_titles = await active_goal_titles(user_id)
+    fingerprint = summary_fingerprint(answers, goal_titles)
+    existing = await find_today_report(user_id, today, answers)
+    cached_summary = summary_cache.get(fingerprint) if not existing else None
+    if not existing and cached_summary is None:
+        # Le flux répond 200 avant le premier appel GPT : quota et saturation se signalent avant
+        llm_limiter.check()
+        charge_generation(user_id)
 
-    # Récupérer les objectifs actifs
-    goals = db_session.query(Goal).filter_by(
-        user_id=current_user.id, 
-        status='active'
-    ).all()
-    
-    summary = generate_summary(report.answers, [goal.title for goal in goals])
-    
-    new_report = Report(
-        user_id=current_user.id,
-        date=today,
-        answers=json.dumps(report.answers),
-        summary=summary
-    )
-    
+    async def events():
+        try:
+            if existing:
+                yield sse({"delta": existing.summary})
+                yield sse({"message": "Report submitted successfully", "summary": existing.summary}, event="done")
+                return
+
+            summary = cached_summary
+            if summary is not None:
+                yield sse({"delta": summary})
+            else:
+                chunks = []
+                async for delta in stream_summary(answers, goal_titles):
+                    chunks.append(delta)
+                    yield sse({"delta": delta})
+                summary = "".join(chunks)
+                summary_cache.set(fingerprint, summary)
+
+            # Enregistré seulement une fois le flux complet : une déconnexion n'écrit rien
+            yield sse(await insert_report(user_id, today, answers, summary), event="done")
+        except Exception as e:
+            yield sse({"detail": str(getattr(e, 'detail', e))}, event="error")
+
+    return event_stream(events())
+
+async def replace_evaluation(user_id: int, evaluation: str, advisor: int, fingerprint: str, last_report_id):
     try:
-        db_session.add(new_report)
-        db_session.commit()
-        return {
-            "message": "Report submitted successfully",
-            "summary": summary
-        }
+        await save_evaluation(user_id, evaluation, advisor, fingerprint, last_report_id)
     except Exception as e:
-        db_session.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
+    return {
+        "message": "Evaluation created successfully",
+        "evaluation": evaluation
+    }
+
+async def replay(content: str, response: dict):
+    # Réponse déjà connue servie en un seul fragment, au format du flux
+    yield sse({"delta": content})
+    yield sse(response, event="done")
+
+def stored_response(stored):
+    # Évaluation déjà produite pour cet historique (à la demande ou pendant la nuit)
+    content, source = stored
+    return {
+        "message": "Evaluation created successfully",
+        "evaluation": content,
+        "cached": True,
+        "precomputed": source == 'precomputed'
+    }
+
+async def fallback_evaluation(user_id: int, advisor: int):
+    """Dernière évaluation enregistrée (du même conseiller de préférence), servie quand OpenAI est indisponible"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Evaluation.date, Evaluation.content)
+            .where(Evaluation.user_id == user_id)
+            .order_by(case((Evaluation.advisor == advisor, 0), else_=1), Evaluation.date.desc(), Evaluation.id.desc())
+            .limit(1)
+        )
+        row = result.first()
+    if row is None:
+        return None
+    return {
+        "message": "AI service unavailable, last evaluation returned",
+        "evaluation": row.content,
+        "date": row.date.isoformat(),
+        "stale": True
+    }
+
+async def store_evaluation(user_id: int, advisor: int, charge_quota: bool = False):
+    # Lu avant l'historique : un rapport arrivé pendant la génération rendra l'évaluation périmée
+    last_report_id = await latest_report_id(user_id)
+    history = await build_history(user_id)
+    fingerprint = evaluation_fingerprint(history)
+    # Même conseiller, même historique : pas de nouvel appel GPT
+    stored = await find_evaluation(user_id, advisor, fingerprint)
+    if stored is not None:
+        return stored_response(stored)
+    if charge_quota:
+        charge_generation(user_id)
+    evaluation = await generate_evaluation(history, advisor)
+    return await replace_evaluation(user_id, evaluation, advisor, fingerprint, last_report_id)
 
 @app.post("/create-advise", response_model=dict)
 async def create_advise(
+    advise: AdviseCreate,
+    current_user: User = Depends(get_current_user),
+    prefer: Optional[str] = Header(None)
+):
+    try:
+        if respond_async(prefer):
+            # Pas de tâche de fond vouée à l'échec : le repli est servi tout de suite
+            charge_generation(current_user.id)
+            job_id = await job_queue.submit(current_user.id, "evaluation", {"advisor": advise.advisor})
+            return accepted(job_id)
+        return await store_evaluation(current_user.id, advise.advisor, charge_quota=True)
+    except CircuitOpen:
+        fallback = await fallback_evaluation(current_user.id, advise.advisor)
+        if fallback is None:
+            raise
+        return fallback
+
+@app.post("/create-advise/stream")
+async def create_advise_stream(
     advise: AdviseCreate,
     current_user: User = Depends(get_current_user)
 ):
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    # Récupérer les 10 derniers rapports
-    reports = db_session.query(Report)\
-        .filter_by(user_id=current_user.id)\
-        .order_by(Report.date.desc())\
-        .limit(10)\
-        .all()
-    
-    evaluation = generate_evaluation(
-        [f"{r.summary}{r.date}" for r in reports], 
-        advise.advisor
-    )
-    
-    # Supprimer l'ancienne évaluation et créer la nouvelle
-    db_session.query(Evaluation).filter_by(user_id=current_user.id).delete()
-    
-    new_evaluation = Evaluation(
-        user_id=current_user.id,
-        date=today,
-        content=evaluation
-    )
-    
+    user_id = current_user.id
+    last_report_id = await latest_report_id(user_id)
+    history = await build_history(user_id)
+    fingerprint = evaluation_fingerprint(history)
+    stored = await find_evaluation(user_id, advise.advisor, fingerprint)
+    if stored is not None:
+        return event_stream(replay(stored[0], stored_response(stored)))
+
+    llm_limiter.check()
     try:
-        db_session.add(new_evaluation)
-        db_session.commit()
-        return {
-            "message": "Evaluation created successfully",
-            "evaluation": evaluation
-        }
-    except Exception as e:
-        db_session.rollback()
+        charge_generation(user_id)
+    except CircuitOpen:
+        fallback = await fallback_evaluation(user_id, advise.advisor)
+        if fallback is None:
+            raise
+        return event_stream(replay(fallback["evaluation"], fallback))
+
+    async def events():
+        try:
+            chunks = []
+            async for delta in stream_evaluation(history, advise.advisor):
+                chunks.append(delta)
+                yield sse({"delta": delta})
+            # Enregistré seulement une fois le flux complet : une déconnexion n'écrit rien
+            yield sse(await replace_evaluation(user_id, "".join(chunks), advise.advisor, fingerprint, last_report_id), event="done")
+        except CircuitOpen as e:
+            fallback = await fallback_evaluation(user_id, advise.advisor)
+            if fallback is None:
+                yield sse({"detail": str(e)}, event="error")
+            else:
+                yield sse({"delta": fallback["evaluation"]})
+                yield sse(fallback, event="done")
+        except Exception as e:
+            yield sse({"detail": str(getattr(e, 'detail', e))}, event="error")
+
+    return event_stream(events())
+
+# Les tâches de fond réutilisent exactement le chemin synchrone
+job_queue.register("report", submit_report_for)
+job_queue.register("evaluation", store_evaluation)
+job_queue.register("digest", refresh_digests)
+
+@app.get("/jobs/{job_id}", response_model=dict)
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    job = await db.get(Job, job_id)
+    if not job or job.user_id != current_user.id:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
         )
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error
+    }
 
 @app.get("/get-today-report", response_model=dict)
-async def get_today_report(current_user: User = Depends(get_current_user)):
-    today = datetime.now().strftime('%Y-%m-%d')
+async def get_today_report(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    today = date.today()
     
     # Modification de la requête pour faire un LEFT JOIN correct
-    report = db_session.query(Report, Evaluation)\
-        .outerjoin(Evaluation, Report.user_id == Evaluation.user_id)\
-        .filter(Report.user_id == current_user.id)\
-        .filter(Report.date == today)\
-        .first()
+    result = await db.execute(
+        select(Report, Evaluation)
+        .outerjoin(Evaluation, Report.user_id == Evaluation.user_id)
+        .filter(Report.user_id == current_user.id)
+        .filter(Report.date == today)
+        # Une évaluation par conseiller : la dernière servie
+        .order_by(Evaluation.last_used_at.desc().nulls_last(), Evaluation.id.desc())
+        .limit(1)
+    )
+    report = result.first()
     
     if not report:
         raise HTTPException(
@@ -237,18 +620,214 @@ async def get_today_report(current_user: User = Depends(get_current_user)):
     
     # Déballage des résultats
     report_obj, evaluation_obj = report
+    etag = make_etag(
+        "report", report_obj.id, report_obj.version,
+        evaluation_obj and (evaluation_obj.id, evaluation_obj.version)
+    )
     
-    return {
-        "date": report_obj.date,
+    return conditional_response(request, etag, lambda: {
+        "date": report_obj.date.strftime('%Y-%m-%d'),
         "answers": json.loads(report_obj.answers) if hasattr(report_obj, 'answers') else None,
         "summary": report_obj.summary,
         "evaluation": evaluation_obj.content if evaluation_obj else None
+    })
+
+REPORT_FIELDS = {"summary": Report.summary, "answers": Report.answers}
+
+def encode_cursor(report_date: date, report_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{report_date.isoformat()}|{report_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        report_date, report_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(report_date), int(report_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+@app.get("/reports", response_model=dict)
+async def list_reports(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: str = "summary",
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Projection : seules les colonnes demandées sont lues (answers est volumineux)
+    requested = [name for name in fields.split(",") if name]
+    unknown = set(requested) - set(REPORT_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+
+    query = select(Report.id, Report.date, *[REPORT_FIELDS[name] for name in requested])\
+        .filter(Report.user_id == current_user.id)\
+        .order_by(Report.date.desc(), Report.id.desc())\
+        .limit(limit + 1)
+    if start:
+        query = query.filter(Report.date >= start)
+    if end:
+        query = query.filter(Report.date <= end)
+    # Pagination par clé (date, id) : coût constant quelle que soit la profondeur
+    if cursor:
+        query = query.filter(tuple_(Report.date, Report.id) < tuple_(*decode_cursor(cursor)))
+
+    rows = (await db.execute(query)).all()
+    items = []
+    for row in rows[:limit]:
+        item = {"id": row.id, "date": row.date.strftime('%Y-%m-%d')}
+        for name in requested:
+            value = getattr(row, name)
+            item[name] = json.loads(value) if name == "answers" and value else value
+        items.append(item)
+
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(last.date, last.id) if last else None
     }
 
+@app.get("/reports/similar", response_model=dict)
+async def similar_reports(
+    k: int = Query(5, ge=1, le=50),
+    day: Optional[date] = Query(None, alias="date"),
+    q: Optional[str] = Query(None, max_length=2000),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_primary_db)  # vecteurs manquants enregistrés à la première recherche
+):
+    # Jours proches du rapport du jour (ou d'une date, ou d'un texte libre), sans appel GPT
+    from similarity import load_index, embed
+    index = await load_index(db, current_user.id)
+    if db.new or db.dirty:
+        await db.commit()
+
+    if q:
+        query, exclude = embed(q), None
+    else:
+        report_id = await db.scalar(
+            select(Report.id)
+            .filter_by(user_id=current_user.id, date=day or date.today())
+            .order_by(Report.id.desc())
+            .limit(1)
+        )
+        if report_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No report found for this day"
+            )
+        query, exclude = index.vector(report_id), report_id
+
+    matches = index.search(query, k, exclude)
+    rows = {}
+    if matches:
+        result = await db.execute(
+            select(Report.id, Report.date, Report.summary)
+            .where(Report.id.in_([report_id for report_id, _ in matches]))
+        )
+        rows = {row.id: row for row in result.all()}
+    return {"items": [
+        {
+            "id": report_id,
+            "date": rows[report_id].date.isoformat(),
+            "summary": rows[report_id].summary,
+            "score": round(score, 3)
+        }
+        for report_id, score in matches if report_id in rows
+    ]}
+
+@app.get("/search", response_model=dict)
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_primary_db)  # rapports non indexés ajoutés avant la recherche
+):
+    # Recherche plein texte dans les résumés et les réponses : tous les termes, classés par pertinence
+    if await index_missing(db, current_user.id):
+        await db.commit()
+    items = await search_reports(db, current_user.id, q, limit)
+    return {"items": [
+        {**item, "date": item["date"].isoformat(), "score": round(item["score"], 3)}
+        for item in items
+    ]}
+
+@app.get("/analytics/mood", response_model=dict)
+async def get_mood_analytics(
+    days: int = Query(90, ge=7, le=366),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_primary_db)  # la série peut être construite à la première lecture
+):
+    # Une seule ligne lue, calculs NumPy en mémoire : aucun appel GPT ni parcours de l'historique
+    from analytics import load_series, mood_stats
+    series = await load_series(db, current_user.id)
+    # Série éventuellement insérée à cette lecture (sinon simple fin de la transaction de lecture)
+    await db.commit()
+    return mood_stats(series, date.today(), days)
+
+def check_format(format: str):
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format: {format}"
+        )
+
+@app.get("/export")
+async def export_data(
+    format: str = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    check_format(format)
+    # Réponse en flux (chunked) : la mémoire reste bornée à un paquet de lignes
+    return StreamingResponse(
+        export_records(current_user.id, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="journal.{format}"'}
+    )
+
+@app.post("/import", response_model=dict)
+async def import_data(
+    request: Request,
+    format: str = "ndjson",
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    check_format(format)
+    try:
+        # Import tout ou rien : une ligne invalide annule l'ensemble
+        counts = await import_records(db, current_user.id, format, request.stream())
+        if counts["report"]:
+            from analytics import rebuild_series
+            await rebuild_series(db, current_user.id)
+            await index_missing(db, current_user.id)
+        await db.commit()
+    except InvalidRecord as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+    if counts["report"]:
+        await schedule_digest_refresh(current_user.id)
+    return {"imported": counts}
+
 @app.post("/add-goal", response_model=dict)
 async def add_goal(
     goal: GoalCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     title = goal.objective.get('title')
     if not title:
@@ -264,8 +843,8 @@ async def add_goal(
     )
     
     try:
-        db_session.add(new_goal)
-        db_session.commit()
+        db.add(new_goal)
+        await db.commit()
         
         return {
             "message": "Goal added successfully",
@@ -276,7 +855,7 @@ async def add_goal(
             }
         }
     except Exception as e:
-        db_session.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -284,30 +863,39 @@ async def add_goal(
 
 @app.get("/get-goals", response_model=list)
 async def get_goals(
+    request: Request,
     status: str = "active",
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    goals = db_session.query(Goal)\
-        .filter_by(user_id=current_user.id)\
-        .filter_by(status=status)\
-        .all()
+    result = await db.execute(
+        select(Goal)
+        .filter_by(user_id=current_user.id)
+        .filter_by(status=status)
+        .order_by(Goal.id)
+    )
+    goals = result.scalars().all()
+    etag = make_etag("goals", status, [(goal.id, goal.version) for goal in goals])
     
-    return [{
+    return conditional_response(request, etag, lambda: [{
         "id": goal.id,
         "title": goal.title,
         "status": goal.status,
-    } for goal in goals]
+    } for goal in goals])
 
 @app.put("/update-goal/{goal_id}", response_model=dict)
 async def update_goal(
     goal_id: int,
     goal: GoalUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_goal = db_session.query(Goal)\
-        .filter_by(id=goal_id)\
-        .filter_by(user_id=current_user.id)\
-        .first()
+    result = await db.execute(
+        select(Goal)
+        .filter_by(id=goal_id)
+        .filter_by(user_id=current_user.id)
+    )
+    db_goal = result.scalars().first()
     
     if not db_goal:
         raise HTTPException(
@@ -321,7 +909,7 @@ async def update_goal(
     try:
         db_goal.title = title
         db_goal.status = status
-        db_session.commit()
+        await db.commit()
         
         return {
             "message": "Goal updated successfully",
@@ -332,21 +920,115 @@ async def update_goal(
             }
         }
     except Exception as e:
-        db_session.rollback()
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@app.post("/goals/batch", response_model=dict)
+async def batch_goals(
+    batch: GoalBatch,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if len(batch.operations) > Config.GOALS_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {Config.GOALS_BATCH_MAX} operations per batch"
+        )
+
+    # Vérification de propriété en une seule requête IN
+    ids = {op.id for op in batch.operations if op.op in ('update', 'delete') and op.id is not None}
+    owned = {}
+    if ids:
+        result = await db.execute(
+            select(Goal.id, Goal.title, Goal.status)
+            .filter(Goal.user_id == current_user.id, Goal.id.in_(ids))
+        )
+        owned = {row.id: {"id": row.id, "title": row.title, "status": row.status} for row in result}
+
+    results = [None] * len(batch.operations)
+    creates, updates, deletes = [], [], []
+    for index, op in enumerate(batch.operations):
+        if op.op == 'create':
+            if not op.title:
+                results[index] = {"op": op.op, "status": "error", "detail": "Goal title is required"}
+                continue
+            creates.append((index, {
+                "user_id": current_user.id,
+                "title": op.title,
+                "status": op.status or 'active',
+                "version": 1
+            }))
+        elif op.op in ('update', 'delete'):
+            if op.id not in owned:
+                results[index] = {"op": op.op, "status": "error", "detail": "Goal not found"}
+                continue
+            if op.op == 'update':
+                goal = owned[op.id]
+                goal["title"] = op.title or goal["title"]
+                goal["status"] = op.status or goal["status"]
+                # Chaîne vide : valeur conservée, comme /update-goal
+                updates.append({"b_id": op.id, "b_title": op.title or None, "b_status": op.status or None})
+                results[index] = {"op": op.op, "status": "updated", "goal": dict(goal)}
+            else:
+                # Les opérations suivantes sur ce même objectif échoueront
+                del owned[op.id]
+                deletes.append(op.id)
+                results[index] = {"op": op.op, "status": "deleted", "id": op.id}
+        else:
+            results[index] = {"op": op.op, "status": "error", "detail": "Unknown operation"}
+
+    goals = Goal.__table__
+    try:
+        # Une seule transaction : insertion groupée, UPDATE en executemany, DELETE ... IN
+        if creates:
+            result = await db.execute(
+                insert(goals).returning(goals.c.id, sort_by_parameter_order=True),
+                [values for _, values in creates]
+            )
+            for (index, values), goal_id in zip(creates, result.scalars().all()):
+                results[index] = {"op": "create", "status": "created", "goal": {
+                    "id": goal_id,
+                    "title": values["title"],
+                    "status": values["status"]
+                }}
+        if updates:
+            await db.execute(
+                update(goals)
+                .where(goals.c.id == bindparam('b_id'))
+                .values(
+                    title=func.coalesce(bindparam('b_title', type_=String), goals.c.title),
+                    status=func.coalesce(bindparam('b_status', type_=String), goals.c.status),
+                    version=goals.c.version + 1
+                ),
+                updates
+            )
+        if deletes:
+            await db.execute(delete(goals).where(goals.c.id.in_(deletes)))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
+    return {"results": results}
+
 @app.delete("/delete-goal/{goal_id}", response_model=dict)
 async def delete_goal(
     goal_id: int,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    db_goal = db_session.query(Goal)\
-        .filter_by(id=goal_id)\
-        .filter_by(user_id=current_user.id)\
-        .first()
+    result = await db.execute(
+        select(Goal)
+        .filter_by(id=goal_id)
+        .filter_by(user_id=current_user.id)
+    )
+    db_goal = result.scalars().first()
     
     if not db_goal:
         raise HTTPException(
@@ -355,19 +1037,52 @@ async def delete_goal(
         )
     
     try:
-        db_session.delete(db_goal)
-        db_session.commit()
+        await db.delete(db_goal)
+        await db.commit()
         return {"message": "Goal deleted successfully"}
     except Exception as e:
-        db_session.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
+metrics.register_cache("token", token_cache)
+metrics.register_cache("user", user_cache)
+metrics.register_cache("summary", summary_cache)
+metrics.register_gauge("job_queue_depth", "Tâches de génération en attente", job_queue.depth)
+metrics.register_gauge("password_hash_pending", "Hachages bcrypt en cours ou en attente", passwords.pending)
+metrics.register_gauge("llm_queue_depth", "Appels GPT en attente d'une place", llm_limiter.waiting)
+metrics.register_gauge("llm_in_flight", "Appels GPT en cours", llm_limiter.in_flight)
+metrics.register_gauge("llm_circuit_state", "Disjoncteur OpenAI : 0 fermé, 1 semi-ouvert, 2 ouvert", llm_breaker.state_code)
+
+@app.get("/health")
+async def health():
+    # État visible sans authentification : disjoncteur et file d'attente des appels GPT
+    return {
+        "status": "degraded" if llm_breaker.state != "closed" else "ok",
+        "llm": {
+            "circuit": llm_breaker.snapshot(),
+            "waiting": llm_limiter.waiting(),
+            "in_flight": llm_limiter.in_flight(),
+        }
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.on_event("startup")
+async def startup_event():
+    await job_queue.recover()
+
 @app.on_event("shutdown")
 async def shutdown_event():
+    await job_queue.stop()
     db_session.remove()
+    await dispose_engines()
+    await close_client()
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,135 @@
+"""Serveur local compatible OpenAI (/v1/chat/completions) pour les tests de charge.
+
+    python -m bench.fake_openai --port 8100 --latency 0.8 --stream-interval 0.02 --error-rate 0.01
+
+Aucun appel réseau externe : la latence, le débit de tokens et les erreurs sont simulés.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeSettings:
+    latency: float = 0.5  # délai avant la réponse / le premier token (secondes)
+    jitter: float = 0.2  # variation relative de la latence (+/-)
+    tokens: int = 60  # tokens par réponse
+    stream_interval: float = 0.01  # délai entre deux tokens en streaming
+    error_rate: float = 0.0  # proportion de réponses en erreur
+    error_status: int = 500  # 500, 503 ou 429
+
+    def delay(self) -> float:
+        return max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+WORDS = "La journée a été calme et productive, avec du temps pour soi et pour les autres .".split()
+
+def completion_text(tokens: int) -> list:
+    return [WORDS[i % len(WORDS)] + " " for i in range(tokens)]
+
+def prompt_tokens(messages) -> int:
+    # Approximation suffisante pour les métriques : ~4 caractères par token
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4
+
+def create_app(settings: FakeSettings) -> FastAPI:
+    app = FastAPI()
+    app.state.settings = settings
+    app.state.calls = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "fake")
+        pieces = completion_text(settings.tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens(body.get("messages", [])),
+            "completion_tokens": len(pieces),
+            "total_tokens": prompt_tokens(body.get("messages", [])) + len(pieces),
+        }
+
+        await asyncio.sleep(settings.delay())
+        if random.random() < settings.error_rate:
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "server_error", "code": None}},
+                status_code=settings.error_status,
+                headers={"Retry-After": "1"} if settings.error_status == 429 else None
+            )
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces).strip()},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        def chunk(delta, finish_reason=None, **extra):
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                **extra,
+            }) + "\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                await asyncio.sleep(settings.stream_interval)
+                yield chunk({"content": piece})
+            yield chunk({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": app.state.calls}
+
+    return app
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeSettings()
+    parser.add_argument("--latency", type=float, default=defaults.latency)
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+    parser.add_argument("--tokens", type=int, default=defaults.tokens)
+    parser.add_argument("--stream-interval", type=float, default=defaults.stream_interval)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-status", type=int, default=defaults.error_status)
+
+def settings_from(args) -> FakeSettings:
+    return FakeSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens=args.tokens,
+        stream_interval=args.stream_interval,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(settings_from(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,293 @@
+"""Test de charge de l'API contre un faux serveur OpenAI local.
+
+    python -m bench.loadtest --concurrency 50 --duration 30 --mix token=1,submit=2,advise=1,goals=6
+    python -m bench.loadtest --latency 1.5 --error-rate 0.05 --baseline bench/results/baseline.json
+
+Démarre bench.fake_openai et l'application (uvicorn) sur une copie jetable de la base,
+enchaîne les requêtes depuis --concurrency clients, puis écrit un résumé JSON
+(latences p50/p95/p99 et débit par opération) et les mesures brutes en CSV dans --output.
+Avec --baseline, le code de sortie vaut 1 si le p95 ou le débit régresse au-delà de --tolerance.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime
+import httpx
+import numpy as np
+from bench.fake_openai import add_arguments
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "token=1,submit=2,advise=1,goals=6"
+MOODS = ["Heureux", "Triste", "Fatigué", "Frustré", "Excité"]
+
+Sample = namedtuple("Sample", "op status latency started")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        op, _, weight = item.partition("=")
+        if op not in OPERATIONS:
+            raise SystemExit(f"Opération inconnue : {op} (parmi {', '.join(OPERATIONS)})")
+        weights[op] = float(weight or 1)
+    return weights
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Le processus {process.args} s'est arrêté (code {process.returncode})")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} ne répond pas après {timeout}s")
+
+
+class Servers:
+    """Faux OpenAI + application sur une base temporaire, arrêtés à la sortie"""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = []
+        self.tmpdir = tempfile.mkdtemp(prefix="loadtest-")
+
+    def start(self, command, env, probe):
+        process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+        self.processes.append(process)
+        wait_until_up(probe, process)
+
+    def __enter__(self):
+        args = self.args
+        fake_port, app_port = free_port(), free_port()
+        self.start([
+            sys.executable, "-m", "bench.fake_openai", "--port", str(fake_port),
+            "--latency", str(args.latency), "--jitter", str(args.jitter), "--tokens", str(args.tokens),
+            "--stream-interval", str(args.stream_interval),
+            "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+        ], os.environ.copy(), f"http://127.0.0.1:{fake_port}/stats")
+        self.fake_url = f"http://127.0.0.1:{fake_port}"
+
+        env = {
+            **os.environ,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.tmpdir, 'bench.sqlite')}",
+            "OPENAI_BASE_URL": f"{self.fake_url}/v1",
+            "OPENAI_API_KEY": "bench",
+            "JWT_KEY": os.environ.get("JWT_KEY", "bench"),
+            # Quota par utilisateur levé par défaut : on mesure le service, pas les 429
+            "GENERATION_BURST": str(args.generation_burst),
+            "GENERATION_RATE": str(args.generation_rate),
+        }
+        env.pop("ASYNC_DATABASE_URI", None)
+        subprocess.run([sys.executable, "migrations.py"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+        self.start(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(app_port), "--log-level", "warning"],
+            env, f"http://127.0.0.1:{app_port}/metrics"
+        )
+        self.app_url = f"http://127.0.0.1:{app_port}"
+        return self
+
+    def __exit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+# Opérations : (client, utilisateur) -> réponse
+async def op_token(client, user):
+    return await client.post("/token", data={"username": user["username"], "password": user["password"]})
+
+async def op_submit(client, user):
+    answers = {
+        "mood": random.choice(MOODS),
+        "q1": f"Journée numéro {random.randint(1, 10**6)}",
+        "q2": "Rien de particulier",
+        "q3": "Demain, se coucher plus tôt",
+    }
+    return await client.post("/submit-report", json={"answers": answers}, headers=user["headers"])
+
+async def op_advise(client, user):
+    return await client.post("/create-advise", json={"advisor": random.randint(0, 9)}, headers=user["headers"])
+
+async def op_advise_stream(client, user):
+    async with client.stream("POST", "/create-advise/stream", json={"advisor": random.randint(0, 9)},
+                             headers=user["headers"]) as response:
+        async for _ in response.aiter_bytes():
+            pass
+        return response
+
+async def op_goals(client, user):
+    return await client.get("/get-goals", headers=user["headers"])
+
+OPERATIONS = {
+    "token": op_token,
+    "submit": op_submit,
+    "advise": op_advise,
+    "advise-stream": op_advise_stream,
+    "goals": op_goals,
+}
+
+
+async def create_users(client, count: int) -> list:
+    run = random.randint(0, 10**9)
+    users = []
+    for i in range(count):
+        user = {"username": f"bench-{run}-{i}", "password": "bench-password"}
+        response = await client.post("/register", json=user)
+        response.raise_for_status()
+        token = (await op_token(client, user)).json()["access_token"]
+        user["headers"] = {"Authorization": f"Bearer {token}"}
+        # Quelques objectifs pour que /get-goals et les prompts aient du contenu
+        for title in ("Courir", "Lire", "Méditer"):
+            await client.post("/add-goal", json={"objective": {"title": title}}, headers=user["headers"])
+        users.append(user)
+    return users
+
+async def drive(base_url: str, args, weights: dict) -> tuple:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        users = await create_users(client, args.users)
+        ops, op_weights = list(weights), list(weights.values())
+        samples = []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        remaining = [args.requests] if args.requests else None
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                if remaining is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                op = random.choices(ops, op_weights)[0]
+                begin = time.perf_counter()
+                try:
+                    status = (await OPERATIONS[op](client, random.choice(users))).status_code
+                except httpx.HTTPError:
+                    status = 0
+                samples.append(Sample(op, status, time.perf_counter() - begin, begin - started))
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        return samples, time.perf_counter() - started
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Latences (ms) et débit par opération, plus le total"""
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample.op, []).append(sample)
+    groups["all"] = samples
+
+    results = {}
+    for op, group in sorted(groups.items()):
+        latencies = np.array([sample.latency for sample in group]) * 1000
+        errors = sum(1 for sample in group if not 200 <= sample.status < 400)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(group) else (0, 0, 0)
+        results[op] = {
+            "count": len(group),
+            "errors": errors,
+            "error_rate": round(errors / len(group), 4) if group else 0,
+            "throughput": round(len(group) / elapsed, 2) if elapsed else 0,
+            "mean_ms": round(float(latencies.mean()), 2) if len(group) else 0,
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(latencies.max()), 2) if len(group) else 0,
+            "statuses": {str(status): sum(1 for s in group if s.status == status) for status in sorted({s.status for s in group})},
+        }
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for op, current in results.items():
+        previous = baseline.get(op)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{op}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{op}: débit {previous['throughput']} -> {current['throughput']} req/s")
+    return regressions
+
+def print_table(results: dict):
+    print(f"{'opération':<14}{'req':>8}{'err':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for op, r in results.items():
+        print(f"{op:<14}{r['count']:>8}{r['errors']:>7}{r['throughput']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+
+def write_results(output: str, config: dict, results: dict, samples: list) -> str:
+    os.makedirs(output, exist_ok=True)
+    stem = os.path.join(output, f"loadtest-{datetime.now():%Y%m%d-%H%M%S}")
+    with open(stem + ".json", "w") as f:
+        json.dump({"config": config, "results": results}, f, indent=2, ensure_ascii=False)
+    with open(stem + ".csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(Sample._fields)
+        writer.writerows((s.op, s.status, round(s.latency, 6), round(s.started, 6)) for s in samples)
+    return stem
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="durée maximale (secondes)")
+    parser.add_argument("--requests", type=int, default=0, help="nombre total de requêtes (0 : limité par la durée)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"poids par opération parmi {', '.join(OPERATIONS)}")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--target", help="URL d'une application déjà démarrée (pas de serveurs locaux)")
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "bench", "results"))
+    parser.add_argument("--baseline", help="résumé JSON de référence")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="régression tolérée (0.2 = 20 %%)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--generation-burst", type=float, default=1e9,
+                        help="GENERATION_BURST de l'application locale (défaut : sans limite)")
+    parser.add_argument("--generation-rate", type=float, default=1e9,
+                        help="GENERATION_RATE de l'application locale, jetons/s (défaut : sans limite)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    weights = parse_mix(args.mix)
+    if args.target:
+        samples, elapsed = asyncio.run(drive(args.target, args, weights))
+        fake_calls = None
+    else:
+        with Servers(args) as servers:
+            samples, elapsed = asyncio.run(drive(servers.app_url, args, weights))
+            fake_calls = httpx.get(f"{servers.fake_url}/stats").json()["calls"]
+
+    results = summarize(samples, elapsed)
+    config = {**vars(args), "elapsed": round(elapsed, 3), "openai_calls": fake_calls}
+    print_table(results)
+    stem = write_results(args.output, config, results, samples)
+    print(f"Résultats : {stem}.json / {stem}.csv")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from config import Config
+
+_MISSING = object()
+
+class SharedStore:
+    """Table SQLite commune aux workers d'une même machine (second niveau des TTLCache)
+
+    Accès locaux de quelques microsecondes, en WAL pour des lectures concurrentes ; une
+    connexion par processus et par thread, ouverte à la demande (sûr après fork).
+    Les valeurs sont sérialisées avec pickle : le fichier ne doit être accessible qu'à l'application.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # un cache peut perdre ses dernières écritures
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, namespace: str, key):
+        """(valeur, secondes restantes) ou None"""
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, repr(key))
+        ).fetchone()
+        if row is None:
+            return None
+        remaining = row[1] - time.time()
+        return (pickle.loads(row[0]), remaining) if remaining > 0 else None
+
+    def set(self, namespace: str, key, value, ttl: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, repr(key), pickle.dumps(value), time.time() + ttl)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, namespace: str, key):
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, repr(key)))
+
+    def clear(self, namespace: str):
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+# Partagé entre les workers gunicorn si SHARED_CACHE_PATH est défini
+shared_store = SharedStore(Config.SHARED_CACHE_PATH) if Config.SHARED_CACHE_PATH else None
+
+class TTLCache:
+    """Cache LRU en mémoire avec expiration par entrée et compteurs de hits/misses
+
+    Avec `shared` (un espace de noms), les entrées sont aussi écrites dans shared_store :
+    un miss local relit le magasin commun avant de compter comme miss.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, shared: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.shared = shared if shared_store is not None else None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            if self.shared is None:
+                self.misses += 1
+                return default
+
+        found = shared_store.get(self.shared, key)
+        if found is None:
+            self.misses += 1
+            return default
+        value, remaining = found
+        self.hits += 1
+        self._set_local(key, value, remaining)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._set_local(key, value, ttl)
+        if self.shared is not None:
+            shared_store.set(self.shared, key, value, ttl)
+
+    def _set_local(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.shared is not None:
+            shared_store.delete(self.shared, key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.shared is not None:
+            shared_store.clear(self.shared)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+# Jetons JWT déjà décodés (clé : sha256 du jeton, bornés par leur exp) -> id utilisateur
+token_cache = TTLCache(Config.TOKEN_CACHE_SIZE, Config.JWT_ACCESS_TOKEN_EXPIRES.total_seconds())
+# Utilisateurs authentifiés (clé : id)
+user_cache = TTLCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL, shared="user")
+
+# Résumés générés par GPT, adressés par leur contenu
+summary_cache = TTLCache(Config.SUMMARY_CACHE_SIZE, Config.SUMMARY_CACHE_TTL, shared="summary")
+# Réponses déjà envoyées pour un couple (utilisateur, Idempotency-Key) : partagées pour qu'un
+# rejeu arrivant sur un autre worker soit reconnu
+idempotency_cache = TTLCache(Config.SUMMARY_CACHE_SIZE, Config.IDEMPOTENCY_TTL, shared="idempotency")
+
+class SingleFlight:
+    """Fusionne les appels concurrents portant la même clé en une seule exécution"""
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, fn, *args):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # shield : l'abandon d'un client n'annule pas le travail des autres
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._tasks)
+
+def invalidate_user(user_id: int):
+    """À appeler après toute modification d'un utilisateur"""
+    user_cache.invalidate(user_id)
@@ -0,0 +1,89 @@
+import gzip
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seul
+    brotli = None
+
+# Types compressibles ; les flux (text/event-stream) et réponses en plusieurs morceaux ne sont pas touchés
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv", "application/x-ndjson")
+
+def accepted_encodings(accept_encoding: str) -> set:
+    encodings = set()
+    for item in accept_encoding.split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            encodings.add(name.lower())
+    return encodings
+
+def negotiate(accept_encoding: str):
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in encodings:
+        return "br"
+    if "gzip" in encodings:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+class CompressionMiddleware:
+    """Compression br/gzip négociée des réponses d'un seul tenant au-delà d'un seuil"""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            passthrough = (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            if not passthrough:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                # ETag fort : une représentation compressée est un autre jeu d'octets
+                etag = headers.get("etag")
+                if etag and etag.endswith('"') and not etag.startswith("W/"):
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                message = {**message, "body": body}
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
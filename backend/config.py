@@ -1,21 +1,109 @@
 import os
 from dotenv import load_dotenv
 from datetime import timedelta
-from database import init_db
 
 load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'votre-clé-secrète')
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
+    # URL asynchrone optionnelle, dérivée de SQLALCHEMY_DATABASE_URI si absente
+    ASYNC_DATABASE_URI = os.getenv('ASYNC_DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool des moteurs à connexions persistantes (Postgres, SQLite fichier en synchrone), voir engines.py
     SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_size': 5,
-        'max_overflow': 2,
-        'pool_timeout': 30,
-        'pool_recycle': 1800,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '2')),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
     }
+    # Postgres : vérification des connexions du pool et durée maximale d'une requête (ms, 0 = aucune)
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '30000'))
+    # SQLite : pragmas appliqués à chaque connexion
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+    # Réplique en lecture optionnelle pour les GET ; après une écriture, l'utilisateur relit
+    # le primaire pendant REPLICA_STICKY_SECONDS (retard de réplication)
+    DATABASE_REPLICA_URI = os.getenv('DATABASE_REPLICA_URI')
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '5'))
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4')
+    # Serveur compatible OpenAI (ex. bench/fake_openai.py pour les tests de charge)
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+    # Pool HTTP partagé vers OpenAI et délais (en secondes)
+    OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '50'))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20'))
     FRONTEND_URL = os.getenv('FRONTEND_URL')
+    # Taille minimale (octets) d'une réponse compressée en gzip/brotli
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+    # Hachage des mots de passe : coût bcrypt et pool de threads borné
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    # Nombre maximum d'opérations dans un appel à /goals/batch
+    GOALS_BATCH_MAX = int(os.getenv('GOALS_BATCH_MAX', '200'))
+    # Export en flux (lignes lues par paquet) et import par lots insérés en executemany
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '500'))
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+    # Historique des évaluations : mois résumés conservés, jours bruts et taille d'un résumé
+    DIGEST_MONTHS = int(os.getenv('DIGEST_MONTHS', '6'))
+    DIGEST_MAX_DAYS = int(os.getenv('DIGEST_MAX_DAYS', '10'))
+    DIGEST_MAX_TOKENS = int(os.getenv('DIGEST_MAX_TOKENS', '300'))
+    # Génération en arrière-plan : nombre de workers et taille maximale de la file
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '8'))
+    JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '500'))
+    # Tâches terminées conservées (heures) pour /jobs/{id} ; purge et reprise des tâches abandonnées au plus
+    # une fois par intervalle (secondes)
+    JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', '24'))
+    JOB_PURGE_INTERVAL = float(os.getenv('JOB_PURGE_INTERVAL', '3600'))
+    # Tâche « running » sans battement depuis ce délai (secondes) : worker arrêté, reprise par un autre
+    JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '300'))
+    # Appels GPT simultanés par worker, file d'attente bornée (taille, secondes) et Retry-After du rejet
+    LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '16'))
+    LLM_MAX_WAITING = int(os.getenv('LLM_MAX_WAITING', '64'))
+    LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '30'))
+    LLM_RETRY_AFTER = int(os.getenv('LLM_RETRY_AFTER', '5'))
+    # Échéance d'un appel GPT, nouvelles tentatives comprises, et attente aléatoire entre deux essais
+    LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '60'))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+    LLM_RETRY_BASE = float(os.getenv('LLM_RETRY_BASE', '0.5'))
+    LLM_RETRY_MAX = float(os.getenv('LLM_RETRY_MAX', '4'))
+    # Disjoncteur : ouvert si la part d'échecs sur la fenêtre (secondes) dépasse le seuil, puis pause
+    BREAKER_FAILURE_RATIO = float(os.getenv('BREAKER_FAILURE_RATIO', '0.5'))
+    BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '10'))
+    BREAKER_WINDOW = float(os.getenv('BREAKER_WINDOW', '60'))
+    BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '30'))
+    # Quota de générations par utilisateur : rafale autorisée puis recharge (jetons par seconde)
+    GENERATION_BURST = float(os.getenv('GENERATION_BURST', '5'))
+    GENERATION_RATE = float(os.getenv('GENERATION_RATE', str(1 / 60)))
+    # Précalcul des évaluations (precompute.py) : fenêtre horaire locale, lots, concurrence et utilisateurs actifs
+    PRECOMPUTE_WINDOW = os.getenv('PRECOMPUTE_WINDOW', '01:00-06:00')
+    PRECOMPUTE_BATCH_SIZE = int(os.getenv('PRECOMPUTE_BATCH_SIZE', '50'))
+    PRECOMPUTE_CONCURRENCY = int(os.getenv('PRECOMPUTE_CONCURRENCY', '4'))
+    PRECOMPUTE_ACTIVE_DAYS = int(os.getenv('PRECOMPUTE_ACTIVE_DAYS', '14'))
+    # Évaluations conservées par utilisateur (une par conseiller, les moins récemment servies partent d'abord)
+    EVALUATION_CACHE_PER_USER = int(os.getenv('EVALUATION_CACHE_PER_USER', '4'))
+    # Recherche de jours similaires : taille des vecteurs hachés et matrices gardées en mémoire par worker
+    SIMILARITY_DIMENSIONS = int(os.getenv('SIMILARITY_DIMENSIONS', '512'))
+    SIMILARITY_CACHE_USERS = int(os.getenv('SIMILARITY_CACHE_USERS', '200'))
+    SIMILARITY_CACHE_TTL = float(os.getenv('SIMILARITY_CACHE_TTL', '3600'))
+    # Recherche plein texte : nombre de mots des extraits renvoyés par /search
+    SEARCH_SNIPPET_WORDS = int(os.getenv('SEARCH_SNIPPET_WORDS', '20'))
     JWT_SECRET_KEY = os.getenv('JWT_KEY')
-    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)  # Durée de validité du token
\ No newline at end of file
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)  # Durée de validité du token
+    # Cache en mémoire des jetons décodés et des utilisateurs authentifiés
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+    # Résumés déjà générés (clé : empreinte des réponses, objectifs, modèle et prompt)
+    SUMMARY_CACHE_SIZE = int(os.getenv('SUMMARY_CACHE_SIZE', '1000'))
+    SUMMARY_CACHE_TTL = float(os.getenv('SUMMARY_CACHE_TTL', '86400'))
+    # Fichier SQLite commun aux workers d'une machine, second niveau des caches (désactivé si vide)
+    SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH')
+    # Durée de conservation des réponses rejouables via l'en-tête Idempotency-Key
+    IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '86400'))
\ No newline at end of file
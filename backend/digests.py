@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from datetime import date, timedelta
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from models import Report, Digest, AsyncSessionLocal
+from ai_service import generate_digest
+from cache import SingleFlight
+from config import Config
+
+# Historique hiérarchique : jours de la semaine en cours -> semaines du mois en cours -> mois précédents.
+# Une semaine appartient au mois de son lundi, ce qui rend les trois niveaux disjoints.
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def next_month(day: date) -> date:
+    return (month_start(day) + timedelta(days=32)).replace(day=1)
+
+def months_before(day: date, count: int) -> date:
+    index = day.year * 12 + day.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+def group_by(rows, key):
+    groups = OrderedDict()
+    for row in rows:
+        groups.setdefault(key(row), []).append(row)
+    return groups
+
+digest_flights = SingleFlight()
+
+async def save_digest(user_id: int, level: str, period_start: date, texts: list) -> bool:
+    # Période déjà résumée par un autre worker : pas d'appel GPT
+    async with AsyncSessionLocal() as db:
+        existing = await db.scalar(
+            select(Digest.id).filter_by(user_id=user_id, level=level, period_start=period_start).limit(1)
+        )
+    if existing is not None:
+        return False
+    # Génération hors session : aucune connexion n'est tenue pendant l'appel GPT
+    content = await generate_digest(texts, level)
+    async with AsyncSessionLocal() as db:
+        db.add(Digest(
+            user_id=user_id,
+            level=level,
+            period_start=period_start,
+            content=content,
+            source_count=len(texts)
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Enregistrée entre-temps par un autre worker
+            await db.rollback()
+            return False
+    return True
+
+async def refresh_digests(user_id: int, today: date = None):
+    """Construit les résumés manquants des semaines et mois terminés, sans relire l'historique déjà résumé"""
+    # Rapports soumis coup sur coup : une seule construction à la fois par utilisateur dans ce worker
+    return await digest_flights.do(user_id, build_digests, user_id, today)
+
+async def build_digests(user_id: int, today: date = None):
+    this_week = week_start(today or date.today())
+    this_month = month_start(this_week)
+    # Rien avant le plus ancien mois que build_history peut lire : ni semaine ni mois résumés au-delà
+    oldest = months_before(this_month, Config.DIGEST_MONTHS)
+    first_week = oldest + timedelta(days=-oldest.weekday() % 7)
+    built = {"weeks": 0, "months": 0}
+
+    async with AsyncSessionLocal() as db:
+        last_week = await db.scalar(
+            select(func.max(Digest.period_start)).filter_by(user_id=user_id, level='week')
+        )
+        if last_week:
+            first_week = max(first_week, last_week + timedelta(days=7))
+        query = select(Report.date, Report.summary)\
+            .filter(Report.user_id == user_id, Report.date >= first_week, Report.date < this_week)\
+            .order_by(Report.date)
+        reports = (await db.execute(query)).all()
+
+    for start, rows in group_by(reports, lambda r: week_start(r.date)).items():
+        if await save_digest(user_id, 'week', start, [f"{r.summary}{r.date}" for r in rows]):
+            built["weeks"] += 1
+
+    async with AsyncSessionLocal() as db:
+        last_month = await db.scalar(
+            select(func.max(Digest.period_start)).filter_by(user_id=user_id, level='month')
+        )
+        query = select(Digest.period_start, Digest.content)\
+            .filter(Digest.user_id == user_id, Digest.level == 'week',
+                    Digest.period_start >= oldest, Digest.period_start < this_month)\
+            .order_by(Digest.period_start)
+        if last_month:
+            query = query.filter(Digest.period_start >= next_month(last_month))
+        weeks = (await db.execute(query)).all()
+
+    for start, rows in group_by(weeks, lambda w: month_start(w.period_start)).items():
+        if await save_digest(user_id, 'month', start, [w.content for w in rows]):
+            built["months"] += 1
+
+    return built
+
+async def build_history(user_id: int, today: date = None):
+    """Historique de taille bornée pour generate_evaluation, quelle que soit l'ancienneté du journal"""
+    this_week = week_start(today or date.today())
+    this_month = month_start(this_week)
+
+    async with AsyncSessionLocal() as db:
+        months = (await db.execute(
+            select(Digest)
+            .filter(Digest.user_id == user_id, Digest.level == 'month', Digest.period_start < this_month)
+            .order_by(Digest.period_start.desc())
+            .limit(Config.DIGEST_MONTHS)
+        )).scalars().all()
+
+        weeks = (await db.execute(
+            select(Digest)
+            .filter(Digest.user_id == user_id, Digest.level == 'week', Digest.period_start >= this_month)
+            .order_by(Digest.period_start)
+        )).scalars().all()
+
+        # Jours pas encore couverts par un résumé hebdomadaire
+        last_week = await db.scalar(
+            select(func.max(Digest.period_start)).filter_by(user_id=user_id, level='week')
+        )
+        query = select(Report).filter_by(user_id=user_id).order_by(Report.date.desc()).limit(Config.DIGEST_MAX_DAYS)
+        if last_week:
+            query = query.filter(Report.date >= last_week + timedelta(days=7))
+        days = (await db.execute(query)).scalars().all()
+
+    return [f"Mois de {d.period_start:%Y-%m} : {d.content}" for d in reversed(months)] \
+        + [f"Semaine du {d.period_start:%Y-%m-%d} : {d.content}" for d in weeks] \
+        + [f"{r.summary}{r.date}" for r in reversed(days)]
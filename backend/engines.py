@@ -0,0 +1,85 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine
+from config import Config
+from metrics import instrument_engine, timed_pool, register_pool
+
+# Fabrique des moteurs SQLAlchemy : pool et réglages choisis selon le dialecte, à partir de Config.
+#   SQLite   : WAL, synchronous=NORMAL, mmap et busy_timeout à chaque connexion
+#   Postgres : pool dimensionné, pre-ping et statement_timeout côté serveur
+
+def to_async_url(url: str) -> str:
+    """Convertit une URL synchrone vers son driver asyncio (aiosqlite / asyncpg)"""
+    if url.startswith('sqlite:'):
+        return 'sqlite+aiosqlite:' + url[len('sqlite:'):]
+    for prefix in ('postgres://', 'postgresql://', 'postgresql+psycopg2://'):
+        if url.startswith(prefix):
+            return 'postgresql+asyncpg://' + url[len(prefix):]
+    return url
+
+def is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def sqlite_pragmas() -> dict:
+    return {
+        'journal_mode': Config.SQLITE_JOURNAL_MODE,
+        'synchronous': Config.SQLITE_SYNCHRONOUS,
+        'mmap_size': Config.SQLITE_MMAP_SIZE,
+        'busy_timeout': Config.SQLITE_BUSY_TIMEOUT,
+    }
+
+def set_sqlite_pragmas(engine):
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def engine_options(url, is_async: bool) -> dict:
+    """Arguments de create_engine pour ce dialecte"""
+    if url.get_backend_name() == 'sqlite':
+        if is_memory_sqlite(url):
+            # Base en mémoire : une seule connexion partagée, sinon chaque connexion voit une base vide
+            return {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+        if is_async:
+            # Une connexion SQLite s'ouvre pour presque rien : pas de pool (ni de threads aiosqlite persistants)
+            return {'poolclass': NullPool}
+        return {'poolclass': QueuePool, **Config.SQLALCHEMY_ENGINE_OPTIONS}
+
+    options = {
+        'poolclass': AsyncAdaptedQueuePool if is_async else QueuePool,
+        'pool_pre_ping': Config.DB_POOL_PRE_PING,
+        **Config.SQLALCHEMY_ENGINE_OPTIONS,
+    }
+    if url.get_backend_name() == 'postgresql' and Config.DB_STATEMENT_TIMEOUT:
+        timeout = str(Config.DB_STATEMENT_TIMEOUT)
+        options['connect_args'] = (
+            {'server_settings': {'statement_timeout': timeout}} if is_async
+            else {'options': f'-c statement_timeout={timeout}'}
+        )
+    return options
+
+_engines = []
+
+def dispose_after_fork():
+    """Dans un worker forké : abandonne les connexions héritées du processus maître sans les fermer"""
+    for engine in _engines:
+        engine.dispose(close=False)
+
+def build_engine(url: str, name: str, is_async: bool = False):
+    """Crée, instrumente et enregistre (métriques du pool) un moteur synchrone ou asynchrone"""
+    parsed = make_url(url)
+    options = engine_options(parsed, is_async)
+    options['poolclass'] = timed_pool(options['poolclass'], name)
+    engine = (create_async_engine if is_async else create_engine)(url, **options)
+    sync_engine = engine.sync_engine if is_async else engine
+    if parsed.get_backend_name() == 'sqlite' and not is_memory_sqlite(parsed):
+        set_sqlite_pragmas(sync_engine)
+    instrument_engine(engine)
+    register_pool(name, engine)
+    _engines.append(sync_engine)
+    return engine
@@ -0,0 +1,62 @@
+from datetime import date, datetime
+from sqlalchemy import select, delete, update, func
+from models import Report, Evaluation, AsyncSessionLocal
+from config import Config
+
+# Évaluations conservées par (utilisateur, conseiller) avec l'empreinte de l'historique envoyé au
+# prompt : une même demande, sans nouveau rapport, est resservie sans appel GPT. Au-delà de
+# EVALUATION_CACHE_PER_USER, les évaluations les moins récemment servies sont supprimées.
+
+async def latest_report_id(user_id: int):
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(func.max(Report.id)).where(Report.user_id == user_id))
+
+async def find_evaluation(user_id: int, advisor: int, fingerprint: str):
+    """(contenu, origine) de l'évaluation déjà produite pour cet historique, marquée comme servie"""
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(Evaluation.id, Evaluation.content, Evaluation.source)
+            .where(
+                Evaluation.user_id == user_id,
+                Evaluation.advisor == advisor,
+                Evaluation.fingerprint == fingerprint
+            )
+            .limit(1)
+        )).first()
+        if row is None:
+            return None
+        await db.execute(
+            update(Evaluation).where(Evaluation.id == row.id).values(last_used_at=datetime.utcnow())
+        )
+        await db.commit()
+        return row.content, row.source
+
+async def save_evaluation(user_id: int, content: str, advisor: int, fingerprint: str,
+                          last_report_id, source: str = 'live'):
+    # Remplace l'évaluation du même conseiller : un historique ne fait que s'allonger
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            delete(Evaluation).where(Evaluation.user_id == user_id, Evaluation.advisor == advisor)
+        )
+        db.add(Evaluation(
+            user_id=user_id,
+            date=date.today(),
+            content=content,
+            advisor=advisor,
+            fingerprint=fingerprint,
+            last_report_id=last_report_id,
+            source=source,
+            created_at=now,
+            last_used_at=now
+        ))
+        await db.flush()
+        evicted = (await db.execute(
+            select(Evaluation.id)
+            .where(Evaluation.user_id == user_id)
+            .order_by(Evaluation.last_used_at.desc().nulls_last(), Evaluation.id.desc())
+            .offset(Config.EVALUATION_CACHE_PER_USER)
+        )).scalars().all()
+        if evicted:
+            await db.execute(delete(Evaluation).where(Evaluation.id.in_(evicted)))
+        await db.commit()
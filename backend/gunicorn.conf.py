@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+import tempfile
+
+# Serveur de production multi-processus : gunicorn -c gunicorn.conf.py app:app
+#
+#   kill -HUP <maître>    redémarre les workers un par un (requêtes en cours terminées)
+#   kill -USR2 <maître>   nouveau maître avec le nouveau code, puis kill -TERM de l'ancien
+#
+# Avec preload_app, le code est importé une fois dans le maître puis partagé par fork ;
+# un simple HUP ne recharge donc pas le code, USR2 si.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# Workers asynchrones : un par cœur suffit, les attentes GPT / base ne bloquent pas la boucle
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))  # génération GPT en streaming comprise
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+# Recyclage périodique des workers, décalé pour ne pas tous les redémarrer ensemble
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')  # '-' pour stdout
+
+# Métriques Prometheus agrégées sur tous les workers : répertoire neuf à chaque démarrage
+# du maître (défini avant l'import de l'application, conservé lors d'un HUP)
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='prometheus-')
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def post_fork(server, worker):
+    # Les pools de connexions ne se partagent pas entre processus
+    from engines import dispose_after_fork
+    dispose_after_fork()
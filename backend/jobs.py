@@ -0,0 +1,190 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, update
+from models import Job, AsyncSessionLocal
+from config import Config
+
+class JobQueueFull(Exception):
+    """Trop de tâches en attente : la requête doit être rejetée (503)"""
+
+class JobQueue:
+    """File de générations persistée en base et exécutée par un pool borné de workers asyncio"""
+
+    def __init__(self, concurrency: int, max_pending: int):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.handlers = {}
+        self._loop = None
+        self._queue = None
+        self._workers = []
+        self._maintained_at = None
+
+    def register(self, kind: str, handler):
+        """handler(user_id, **payload) -> dict, résultat stocké en JSON"""
+        self.handlers[kind] = handler
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_workers(self):
+        # Démarrage paresseux sur la boucle courante (un worker uvicorn = une boucle)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, user_id: int, kind: str, payload: dict) -> str:
+        if self.depth() >= self.max_pending:
+            raise JobQueueFull()
+        job = Job(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            kind=kind,
+            status='pending',
+            payload=json.dumps(payload)
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(job)
+            await db.commit()
+        self._ensure_workers()
+        self._queue.put_nowait(job.id)
+        return job.id
+
+    async def purge(self) -> int:
+        """Supprime les tâches terminées depuis plus de JOB_RETENTION_HOURS (résultats plus consultables)"""
+        cutoff = datetime.utcnow() - timedelta(hours=Config.JOB_RETENTION_HOURS)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(Job).where(Job.status.in_(('done', 'failed')), Job.updated_at < cutoff)
+            )
+            await db.commit()
+        return result.rowcount
+
+    async def _maintain_if_due(self):
+        # Entretien au plus une fois par JOB_PURGE_INTERVAL : purge et reprise des tâches abandonnées
+        if self._maintained_at is not None and time.monotonic() - self._maintained_at < Config.JOB_PURGE_INTERVAL:
+            return
+        self._maintained_at = time.monotonic()
+        try:
+            await self.purge()
+            stale = await self.requeue_stale()
+        except Exception as e:
+            print(f"Job maintenance error: {e}")
+            return
+        if stale:
+            self._ensure_workers()
+            for job_id in stale:
+                self._queue.put_nowait(job_id)
+
+    async def requeue_stale(self) -> list:
+        """Repasse en attente les tâches « running » dont le worker ne donne plus signe de vie (arrêt, plantage)"""
+        stale_before = datetime.utcnow() - timedelta(seconds=Config.JOB_STALE_AFTER)
+        async with AsyncSessionLocal() as db:
+            job_ids = (await db.execute(
+                select(Job.id).filter(Job.status == 'running', Job.updated_at < stale_before)
+            )).scalars().all()
+            if job_ids:
+                # Mêmes conditions : une tâche reprise entre-temps par un autre worker n'est pas touchée
+                await db.execute(
+                    update(Job)
+                    .where(Job.id.in_(job_ids), Job.status == 'running', Job.updated_at < stale_before)
+                    .values(status='pending', updated_at=datetime.utcnow())
+                )
+                await db.commit()
+        return job_ids
+
+    async def recover(self):
+        """Remet en file les tâches en attente et celles interrompues par l'arrêt d'un worker
+
+        Chaque worker gunicorn en fait autant à son démarrage : la réservation atomique de _run
+        garantit qu'une tâche n'est exécutée qu'une fois, et une tâche en cours sur un worker
+        vivant (battement récent) n'est pas reprise.
+        """
+        await self._maintain_if_due()
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(Job.id)
+                    .filter(Job.status == 'pending')
+                    .order_by(Job.created_at)
+                )
+                job_ids = result.scalars().all()
+        except Exception as e:
+            print(f"Job recovery error: {e}")
+            return
+        if job_ids:
+            self._ensure_workers()
+            for job_id in job_ids:
+                self._queue.put_nowait(job_id)
+
+    async def stop(self, timeout: float = 10):
+        # Laisse les tâches en file se terminer ; celles qui restent seront reprises au démarrage
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._loop = None
+        self._queue = None
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Job {job_id} error: {e}")
+            finally:
+                self._queue.task_done()
+            await self._maintain_if_due()
+
+    async def _heartbeat(self, job_id: str):
+        # Tâche longue : updated_at rafraîchi pour qu'aucun autre worker ne la croie abandonnée
+        while True:
+            await asyncio.sleep(Config.JOB_STALE_AFTER / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.status == 'running')
+                        .values(updated_at=datetime.utcnow())
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"Job {job_id} heartbeat error: {e}")
+
+    async def _run(self, job_id: str):
+        async with AsyncSessionLocal() as db:
+            # Réservation atomique : une tâche mise en file par plusieurs workers ne s'exécute qu'une fois
+            claimed = await db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == 'pending')
+                .values(status='running', updated_at=datetime.utcnow())
+            )
+            await db.commit()
+            if claimed.rowcount != 1:
+                return
+            job = await db.get(Job, job_id)
+
+            heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+            try:
+                result = await self.handlers[job.kind](job.user_id, **json.loads(job.payload))
+                job.status = 'done'
+                job.result = json.dumps(result)
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(getattr(e, 'detail', e))
+            finally:
+                heartbeat.cancel()
+            job.updated_at = datetime.utcnow()
+            await db.commit()
+
+job_queue = JobQueue(Config.JOB_WORKERS, Config.JOB_MAX_PENDING)
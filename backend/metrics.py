@@ -0,0 +1,167 @@
+import os
+from contextvars import ContextVar
+from time import perf_counter
+from prometheus_client import Counter, Histogram, REGISTRY, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, multiprocess
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from sqlalchemy import event
+
+# Métriques Prometheus : quelques opérations en mémoire par requête, rien de bloquant
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latence des requêtes HTTP par route",
+    ["method", "route", "status"]
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Nombre de requêtes SQL par requête HTTP",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Temps passé en SQL par requête HTTP",
+    ["route"]
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Attente pour obtenir une connexion du pool",
+    ["pool"], buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds", "Durée des appels OpenAI",
+    ["kind", "persona"], buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+)
+LLM_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Délai avant le premier morceau d'un appel en flux",
+    ["kind", "persona"], buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens", "Jetons de prompt consommés", ["kind", "persona"])
+LLM_COMPLETION_TOKENS = Counter("llm_completion_tokens", "Jetons générés", ["kind", "persona"])
+LLM_ERRORS = Counter("llm_errors", "Appels OpenAI en erreur", ["kind", "persona"])
+LLM_RETRIES = Counter("llm_retries", "Nouvelles tentatives d'appels OpenAI", ["kind"])
+RATE_LIMITED = Counter("rate_limited_requests", "Requêtes rejetées en 429", ["reason"])
+
+# [nombre de requêtes SQL, secondes] de la requête HTTP en cours
+_request_db = ContextVar("request_db", default=None)
+
+def record_usage(kind: str, persona: str, usage):
+    if usage is None:
+        return
+    LLM_PROMPT_TOKENS.labels(kind, persona).inc(usage.prompt_tokens or 0)
+    LLM_COMPLETION_TOKENS.labels(kind, persona).inc(usage.completion_tokens or 0)
+
+class MetricsMiddleware:
+    """Middleware ASGI : latence par route et coût SQL de chaque requête"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        db_stats = [0, 0.0]
+        token = _request_db.set(db_stats)
+        status_code = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Gabarit de la route (/jobs/{job_id}) : cardinalité bornée
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], path, str(status_code[0])).observe(perf_counter() - start)
+            REQUEST_DB_QUERIES.labels(path).observe(db_stats[0])
+            REQUEST_DB_SECONDS.labels(path).observe(db_stats[1])
+            _request_db.reset(token)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["query_start"].pop()
+    db_stats = _request_db.get()
+    if db_stats is not None:
+        db_stats[0] += 1
+        db_stats[1] += elapsed
+
+def instrument_engine(engine):
+    # Fonctionne aussi pour un AsyncEngine via son moteur synchrone sous-jacent
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+_timed_pools = {}
+
+def timed_pool(poolclass, name: str):
+    """Sous-classe du pool qui mesure l'attente de chaque checkout (conservée par dispose/recreate)"""
+    key = (poolclass, name)
+    if key not in _timed_pools:
+        def _do_get(self):
+            start = perf_counter()
+            try:
+                return poolclass._do_get(self)
+            finally:
+                POOL_CHECKOUT_WAIT.labels(name).observe(perf_counter() - start)
+        _timed_pools[key] = type(f"Timed{poolclass.__name__}", (poolclass,), {"_do_get": _do_get})
+    return _timed_pools[key]
+
+class _StatsCollector:
+    """Valeurs lues au moment du scrape (pools, caches, files) : aucun coût sur le chemin chaud"""
+
+    def __init__(self):
+        self.pools = {}
+        self.caches = {}
+        self.gauges = {}
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connexions actuellement empruntées", labels=["pool"])
+        capacity = GaugeMetricFamily("db_pool_capacity", "Connexions maximum (taille + débordement)", labels=["pool"])
+        for name, engine in self.pools.items():
+            pool = getattr(engine, "sync_engine", engine).pool
+            if hasattr(pool, "checkedout"):
+                checked_out.add_metric([name], pool.checkedout())
+                capacity.add_metric([name], pool.size() + max(pool._max_overflow, 0))
+        yield checked_out
+        yield capacity
+
+        hits = CounterMetricFamily("cache_hits", "Hits des caches en mémoire", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Misses des caches en mémoire", labels=["cache"])
+        size = GaugeMetricFamily("cache_entries", "Entrées des caches en mémoire", labels=["cache"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            size.add_metric([name], stats["size"])
+        yield hits
+        yield misses
+        yield size
+
+        for name, (documentation, fn) in self.gauges.items():
+            gauge = GaugeMetricFamily(name, documentation)
+            gauge.add_metric([], fn())
+            yield gauge
+
+_stats = _StatsCollector()
+REGISTRY.register(_stats)
+
+def register_pool(name: str, engine):
+    _stats.pools[name] = engine
+
+def register_cache(name: str, cache):
+    _stats.caches[name] = cache
+
+def register_gauge(name: str, documentation: str, fn):
+    _stats.gauges[name] = (documentation, fn)
+
+def render():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Plusieurs workers (voir gunicorn.conf.py) : compteurs et histogrammes agrégés depuis
+        # les fichiers de tous les processus ; pools, caches et files restent ceux du worker qui répond
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_stats)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,250 @@
+from datetime import datetime
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, Text, Date, DateTime, Float, LargeBinary, ForeignKey,
+    UniqueConstraint, Index, inspect, text
+)
+
+# Migrations versionnées du schéma : chaque fonction est figée une fois livrée,
+# toute évolution passe par une nouvelle version. La version courante est
+# enregistrée dans la table schema_version.
+#
+#   python migrations.py        applique les migrations manquantes
+
+MIGRATIONS = []
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+@migration(1, "schéma initial")
+def initial_schema(conn):
+    # Schéma de référence : ne crée que les tables absentes (bases existantes conservées)
+    metadata = MetaData()
+    # AUTOINCREMENT comme l'ancien schéma SQL brut : les id supprimés ne sont jamais réattribués
+    Table('users', metadata,
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('username', String(80), unique=True, nullable=False),
+        Column('password_hash', String(128)),
+        sqlite_autoincrement=True)
+    Table('reports', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+        Column('date', Date, nullable=False),
+        Column('answers', Text),
+        Column('summary', Text, nullable=False),
+        sqlite_autoincrement=True)
+    Table('evaluations', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+        Column('date', Date, nullable=False),
+        Column('content', Text, nullable=False),
+        sqlite_autoincrement=True)
+    Table('goals', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+        Column('title', String(200), nullable=False),
+        Column('status', String(20), default='active'),
+        sqlite_autoincrement=True)
+    Table('jobs', metadata,
+        Column('id', String(32), primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+        Column('kind', String(20), nullable=False),
+        Column('status', String(20), nullable=False),
+        Column('payload', Text, nullable=False),
+        Column('result', Text),
+        Column('error', Text),
+        Column('created_at', DateTime, nullable=False),
+        Column('updated_at', DateTime, nullable=False))
+    Table('digests', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+        Column('level', String(10), nullable=False),
+        Column('period_start', Date, nullable=False),
+        Column('content', Text, nullable=False),
+        Column('source_count', Integer, nullable=False),
+        Column('created_at', DateTime, nullable=False),
+        UniqueConstraint('user_id', 'level', 'period_start'))
+    metadata.create_all(conn, checkfirst=True)
+
+@migration(2, "dates des rapports, évaluations et résumés en DATE")
+def unify_date_columns(conn):
+    # Les anciennes lignes mélangent 'YYYY-MM-DD' (SQL brut) et 'YYYY-MM-DD HH:MM:SS' (ORM DateTime)
+    columns = (('reports', 'date'), ('evaluations', 'date'), ('digests', 'period_start'))
+    if conn.dialect.name == 'sqlite':
+        # SQLite : le type Date stocke 'YYYY-MM-DD', il suffit de tronquer
+        for table, column in columns:
+            conn.execute(text(f"UPDATE {table} SET {column} = substr({column}, 1, 10) WHERE length({column}) > 10"))
+    else:
+        for table, column in columns:
+            conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE DATE USING {column}::date"
+            ))
+
+@migration(3, "index composites des requêtes par utilisateur")
+def add_indexes(conn):
+    metadata = MetaData()
+    tables = {name: Table(name, metadata, autoload_with=conn) for name in ('reports', 'goals', 'evaluations', 'jobs')}
+    indexes = (
+        Index('ix_reports_user_date', tables['reports'].c.user_id, tables['reports'].c.date),
+        Index('ix_goals_user_status', tables['goals'].c.user_id, tables['goals'].c.status),
+        Index('ix_evaluations_user', tables['evaluations'].c.user_id),
+        Index('ix_jobs_status_created', tables['jobs'].c.status, tables['jobs'].c.created_at),
+    )
+    existing = {
+        table: {index['name'] for index in inspect(conn).get_indexes(table)}
+        for table in tables
+    }
+    for index in indexes:
+        if index.name not in existing[index.table.name]:
+            index.create(conn)
+
+@migration(4, "versions de ligne pour les ETag")
+def add_row_versions(conn):
+    for table in ('reports', 'evaluations', 'goals'):
+        columns = {column['name'] for column in inspect(conn).get_columns(table)}
+        if 'version' not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+@migration(5, "index de pagination des rapports par (date, id)")
+def add_report_keyset_index(conn):
+    # SQLite inclut déjà le rowid (id) dans ix_reports_user_date ; Postgres a besoin de la colonne
+    if conn.dialect.name != 'sqlite':
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_reports_user_date_id ON reports (user_id, date, id)"))
+
+@migration(6, "série des humeurs par utilisateur")
+def add_mood_series(conn):
+    # Remplie à la première lecture ou au prochain rapport de chaque utilisateur
+    metadata = MetaData()
+    Table('users', metadata, autoload_with=conn)
+    Table('mood_series', metadata,
+        Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
+        Column('start_date', Date, nullable=False),
+        Column('moods', LargeBinary, nullable=False),
+        Column('count', Integer, nullable=False),
+        Column('total', Float, nullable=False),
+        Column('total_sq', Float, nullable=False))
+    metadata.create_all(conn, checkfirst=True)
+
+@migration(7, "évaluations précalculées hors des heures de pointe")
+def add_precomputed_evaluations(conn):
+    # Conseiller et dernier rapport pris en compte : une évaluation reste servie tant qu'ils n'ont pas changé
+    columns = {column['name'] for column in inspect(conn).get_columns('evaluations')}
+    for name, ddl in (
+        ('advisor', 'INTEGER'),
+        ('last_report_id', 'INTEGER'),
+        ('source', "VARCHAR(20) NOT NULL DEFAULT 'live'"),
+        ('created_at', 'TIMESTAMP'),
+    ):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE evaluations ADD COLUMN {name} {ddl}"))
+    # Point de reprise des passes de précalcul (python precompute.py)
+    metadata = MetaData()
+    Table('precompute_runs', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('started_at', DateTime, nullable=False),
+        Column('finished_at', DateTime),
+        Column('cursor', Integer, nullable=False),
+        Column('processed', Integer, nullable=False),
+        Column('failed', Integer, nullable=False))
+    metadata.create_all(conn, checkfirst=True)
+
+@migration(8, "évaluations conservées par conseiller et empreinte de l'historique")
+def add_evaluation_cache(conn):
+    columns = {column['name'] for column in inspect(conn).get_columns('evaluations')}
+    for name, ddl in (('fingerprint', 'VARCHAR(64)'), ('last_used_at', 'TIMESTAMP')):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE evaluations ADD COLUMN {name} {ddl}"))
+    conn.execute(text("UPDATE evaluations SET last_used_at = created_at WHERE last_used_at IS NULL"))
+    # Remplace ix_evaluations_user, dont il couvre les recherches par user_id seul
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_evaluations_user_advisor ON evaluations (user_id, advisor)"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_evaluations_user"))
+
+@migration(9, "vecteurs des rapports pour la recherche de jours similaires")
+def add_report_vectors(conn):
+    # Remplie à chaque rapport, et à la première recherche pour l'historique existant
+    metadata = MetaData()
+    Table('users', metadata, autoload_with=conn)
+    Table('reports', metadata, autoload_with=conn)
+    Table('report_vectors', metadata,
+        Column('report_id', Integer, ForeignKey('reports.id'), primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+        Column('vector', LargeBinary, nullable=False),
+        Index('ix_report_vectors_user', 'user_id', 'report_id'))
+    metadata.create_all(conn, checkfirst=True)
+
+@migration(10, "index plein texte des rapports")
+def add_report_search(conn):
+    # Rempli à chaque rapport, et à la première recherche pour l'historique existant (search.index_missing)
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS report_search ("
+            "report_id INTEGER PRIMARY KEY REFERENCES reports (id) ON DELETE CASCADE, "
+            "user_id INTEGER NOT NULL REFERENCES users (id), "
+            "body TEXT NOT NULL, "
+            "document tsvector GENERATED ALWAYS AS (to_tsvector('french'::regconfig, body)) STORED)"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_report_search_document ON report_search USING GIN (document)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_report_search_user ON report_search (user_id)"))
+        return
+    # rowid = id du rapport ; `owner` (u<user_id>) restreint la recherche dans l'index lui-même
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5("
+        "owner, stems, body UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS reports_search_delete AFTER DELETE ON reports "
+        "BEGIN DELETE FROM report_search WHERE rowid = old.id; END"
+    ))
+
+@migration(11, "vecteurs supprimés avec leur rapport")
+def cascade_report_vectors(conn):
+    # Les vecteurs des rapports déjà supprimés sont purgés, puis suppression en cascade comme report_search
+    conn.execute(text("DELETE FROM report_vectors WHERE report_id NOT IN (SELECT id FROM reports)"))
+    if conn.dialect.name == 'postgresql':
+        for foreign_key in inspect(conn).get_foreign_keys('report_vectors'):
+            if foreign_key['referred_table'] == 'reports' and foreign_key['name']:
+                conn.execute(text(f'ALTER TABLE report_vectors DROP CONSTRAINT "{foreign_key["name"]}"'))
+        conn.execute(text(
+            "ALTER TABLE report_vectors ADD CONSTRAINT report_vectors_report_id_fkey "
+            "FOREIGN KEY (report_id) REFERENCES reports (id) ON DELETE CASCADE"
+        ))
+        return
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS reports_vectors_delete AFTER DELETE ON reports "
+        "BEGIN DELETE FROM report_vectors WHERE report_id = old.id; END"
+    ))
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def upgrade(bind=None):
+    """Applique les migrations manquantes, chacune dans sa propre transaction"""
+    if bind is None:
+        from models import engine as bind
+
+    with bind.begin() as conn:
+        if not inspect(conn).has_table('schema_version'):
+            conn.execute(text(
+                "CREATE TABLE schema_version ("
+                "version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+            ))
+
+    applied = []
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        with bind.begin() as conn:
+            if version <= current_version(conn):
+                continue
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.utcnow()}
+            )
+            applied.append(version)
+    return applied
+
+if __name__ == "__main__":
+    print(f"Migrations appliquées : {upgrade() or 'aucune'}")
@@ -1,39 +1,110 @@
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import UserMixin
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship, declarative_base, scoped_session, sessionmaker
-from datetime import datetime
-from passlib.context import CryptContext
+import hashlib
+import threading
+from fastapi import Request
+from sqlalchemy import select, Column, Integer, String, Text, Date, DateTime, Float, LargeBinary, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.orm import relationship, declarative_base, scoped_session, sessionmaker, Session
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession, AsyncEngine
+from datetime import datetime, date
 from config import Config
-
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-    deprecated="auto"
-)
+from passwords import hash_password, verify_and_update, PasswordHashingBusy
+from cache import TTLCache, invalidate_user
+from engines import build_engine, to_async_url
 
 Base = declarative_base()
 
-# Configuration de SQLAlchemy avec l'URL de la base de données depuis Config
-engine = create_engine(
-    Config.SQLALCHEMY_DATABASE_URI,
-    # Configuration du pool de connexions pour SQLite
-    pool_size=5,
-    max_overflow=2,
-    pool_timeout=30,
-    pool_recycle=1800
-    # Suppression de connect_args qui n'est pas compatible avec SQLite
-)
-
-db_session = scoped_session(sessionmaker(bind=engine))
+# Moteurs créés par engines.py (pool et réglages adaptés au dialecte, voir Config) au premier
+# usage et non à l'import : importer les modèles n'ouvre ni pool ni fichier de base
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _engine(name: str, factory):
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _engines[name] = factory()
+    return engine
+
+def get_engine():
+    return _engine('sync', lambda: build_engine(Config.SQLALCHEMY_DATABASE_URI, 'sync'))
+
+def get_async_engine() -> AsyncEngine:
+    # Moteur asynchrone des routes FastAPI : les requêtes SQL ne bloquent pas la boucle d'événements
+    url = Config.ASYNC_DATABASE_URI or to_async_url(Config.SQLALCHEMY_DATABASE_URI)
+    return _engine('async', lambda: build_engine(url, 'async', is_async=True))
+
+def get_replica_engine() -> AsyncEngine:
+    # Réplique en lecture optionnelle ; sans elle, les lectures restent sur le primaire
+    if not Config.DATABASE_REPLICA_URI:
+        return get_async_engine()
+    return _engine('replica', lambda: build_engine(to_async_url(Config.DATABASE_REPLICA_URI), 'replica', is_async=True))
+
+async def dispose_engines():
+    for engine in list(_engines.values()):
+        if isinstance(engine, AsyncEngine):
+            await engine.dispose()
+        else:
+            engine.dispose()
+
+def __getattr__(name):
+    # Compatibilité : models.engine / models.async_engine créent le moteur à la demande
+    if name == 'engine':
+        return get_engine()
+    if name == 'async_engine':
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Sessions liées au moteur au moment de la première requête SQL (get_bind)
+class _SyncSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        return get_engine()
+
+class _PrimarySession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        return get_async_engine().sync_engine
+
+class _ReplicaSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        return get_replica_engine().sync_engine
+
+db_session = scoped_session(sessionmaker(class_=_SyncSession))
 Base.query = db_session.query_property()  # Ajoute la propriété query à tous les modèles
 
+AsyncSessionLocal = async_sessionmaker(sync_session_class=_PrimarySession, expire_on_commit=False)
+ReplicaSessionLocal = async_sessionmaker(sync_session_class=_ReplicaSession, expire_on_commit=False)
+# Auteurs d'écritures récentes (clé : sha256 de l'en-tête Authorization), partagés entre les workers
+# par shared_store : un GET servi par un autre worker que le POST lit aussi le primaire
+recent_writers = TTLCache(maxsize=Config.TOKEN_CACHE_SIZE, ttl=Config.REPLICA_STICKY_SECONDS, shared="writer")
+
+def reads_from_replica(request: Request) -> bool:
+    if not Config.DATABASE_REPLICA_URI:
+        return False
+    writer = hashlib.sha256(request.headers.get("authorization", "").encode()).hexdigest()
+    if request.method not in ("GET", "HEAD"):
+        recent_writers.set(writer, True)
+        return False
+    return recent_writers.get(writer) is None
+
+async def get_db(request: Request):
+    """Dépendance FastAPI : une AsyncSession par requête, sur la réplique pour les GET"""
+    session_factory = ReplicaSessionLocal if reads_from_replica(request) else AsyncSessionLocal
+    async with session_factory() as session:
+        yield session
+
+async def get_primary_db():
+    """Dépendance FastAPI : session sur le primaire, pour les GET qui écrivent"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
 def init_db():
     # Import ici pour éviter les imports circulaires
     import models
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
 
-class User(Base, UserMixin):
+class User(Base):
     __tablename__ = 'users'
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String(80), unique=True, nullable=False)
@@ -57,61 +128,146 @@ class User(Base, UserMixin):
         return str(self.id)
 
     @staticmethod
-    def get(user_id):
-        return db_session.query(User).get(user_id)
+    async def get(db: AsyncSession, user_id):
+        return await db.get(User, user_id)
 
     @staticmethod
-    def get_by_username(username):
-        return db_session.query(User).filter_by(username=username).first()
+    async def get_by_username(db: AsyncSession, username):
+        result = await db.execute(select(User).filter_by(username=username))
+        return result.scalars().first()
 
     @staticmethod
-    def create(username: str, password: str) -> bool:
+    async def create(db: AsyncSession, username: str, password: str) -> bool:
         try:
-            existing_user = User.get_by_username(username)
+            existing_user = await User.get_by_username(db, username)
             if existing_user:
                 return False
                 
-            user = User(username, pwd_context.hash(password))
-            db_session.add(user)
-            db_session.commit()
+            user = User(username, await hash_password(password))
+            db.add(user)
+            await db.commit()
             return True
+        except PasswordHashingBusy:
+            raise
         except Exception as e:
             print(f"Error creating user: {e}")
-            db_session.rollback()
+            await db.rollback()
             return False
 
-    @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
+    async def check_password(self, db: AsyncSession, plain_password: str) -> bool:
+        """Vérifie le mot de passe et ré-hache de façon transparente si le coût bcrypt a changé"""
         try:
-            return pwd_context.verify(plain_password, hashed_password)
+            valid, new_hash = await verify_and_update(plain_password, self.password_hash)
+        except PasswordHashingBusy:
+            raise
         except Exception as e:
             print(f"Password verification error: {e}")
             return False
+        if valid and new_hash:
+            self.password_hash = new_hash
+            await db.commit()
+            invalidate_user(self.id)
+        return valid
+
+# Les index et types doivent rester alignés sur migrations.py
 
 class Report(Base):
     __tablename__ = 'reports'
+    __table_args__ = (Index('ix_reports_user_date', 'user_id', 'date'), {'sqlite_autoincrement': True})
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    date = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date = Column(Date, nullable=False, default=date.today)
     answers = Column(Text)
     summary = Column(Text, nullable=False)
+    # Version de ligne : incrémentée à chaque UPDATE, sert aux ETag
+    version = Column(Integer, nullable=False)
+    __mapper_args__ = {'version_id_col': version}
 
 class Evaluation(Base):
     __tablename__ = 'evaluations'
+    __table_args__ = (Index('ix_evaluations_user_advisor', 'user_id', 'advisor'), {'sqlite_autoincrement': True})
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    date = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date = Column(Date, nullable=False, default=date.today)
     content = Column(Text, nullable=False)
+    version = Column(Integer, nullable=False)
+    advisor = Column(Integer)
+    last_report_id = Column(Integer)  # dernier rapport inclus dans l'historique évalué
+    fingerprint = Column(String(64))  # empreinte de l'historique envoyé au prompt
+    source = Column(String(20), nullable=False, default='live')  # 'live' ou 'precomputed'
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)  # dernière fois servie (éviction LRU)
+    __mapper_args__ = {'version_id_col': version}
 
 class Goal(Base):
     __tablename__ = 'goals'
+    __table_args__ = (Index('ix_goals_user_status', 'user_id', 'status'), {'sqlite_autoincrement': True})
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     title = Column(String(200), nullable=False)
     status = Column(String(20), default='active')  # 'active' ou 'completed'
+    version = Column(Integer, nullable=False)
+    __mapper_args__ = {'version_id_col': version}
     
     # Relation avec l'utilisateur
-    user = relationship('User', backref='goals')
\ No newline at end of file
+    user = relationship('User', backref='goals')
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    __table_args__ = (Index('ix_jobs_status_created', 'status', 'created_at'),)
+    
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    kind = Column(String(20), nullable=False)  # 'report', 'evaluation' ou 'digest'
+    status = Column(String(20), nullable=False, default='pending')  # 'pending', 'running', 'done', 'failed'
+    payload = Column(Text, nullable=False)
+    result = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class PrecomputeRun(Base):
+    __tablename__ = 'precompute_runs'
+
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    cursor = Column(Integer, nullable=False, default=0)  # dernier user_id traité
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+
+class Digest(Base):
+    __tablename__ = 'digests'
+    __table_args__ = (UniqueConstraint('user_id', 'level', 'period_start'),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    level = Column(String(10), nullable=False)  # 'week' ou 'month'
+    period_start = Column(Date, nullable=False)
+    content = Column(Text, nullable=False)
+    source_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ReportVector(Base):
+    __tablename__ = 'report_vectors'
+    __table_args__ = (Index('ix_report_vectors_user', 'user_id', 'report_id'),)
+
+    # Vecteur de recherche de similarité d'un rapport (voir similarity.py)
+    report_id = Column(Integer, ForeignKey('reports.id', ondelete='CASCADE'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # float32 x SIMILARITY_DIMENSIONS
+
+class MoodSeries(Base):
+    __tablename__ = 'mood_series'
+    
+    # Une ligne par utilisateur, mise à jour à chaque rapport (voir analytics.py)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    start_date = Column(Date, nullable=False)
+    moods = Column(LargeBinary, nullable=False)  # float32 par jour depuis start_date, NaN sans rapport
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    total_sq = Column(Float, nullable=False)
@@ -0,0 +1,47 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from config import Config
+
+# Coût bcrypt configurable : min = max = coût courant, ainsi tout hash produit avec
+# un autre coût est signalé par verify_and_update et ré-haché à la connexion
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=Config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=Config.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=Config.BCRYPT_ROUNDS
+)
+
+# bcrypt libère le GIL : un petit pool de threads dédié suffit à sortir le calcul
+# de la boucle d'événements sans concurrencer le pool par défaut d'asyncio
+_executor = ThreadPoolExecutor(
+    max_workers=Config.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="bcrypt"
+)
+_pending = 0
+
+class PasswordHashingBusy(Exception):
+    """Trop de hachages en attente : la requête doit être rejetée (503)"""
+
+def pending():
+    """Nombre de hachages en cours ou en file d'attente"""
+    return _pending
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= Config.PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHashingBusy()
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+async def verify_and_update(password: str, hashed_password: str):
+    """Retourne (valide, nouveau_hash) ; nouveau_hash vaut None si le coût n'a pas changé"""
+    return await _run(pwd_context.verify_and_update, password, hashed_password)
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select, func, and_
+from models import Report, Evaluation, PrecomputeRun, AsyncSessionLocal
+from ai_service import generate_evaluation, evaluation_fingerprint
+from digests import build_history
+from evaluations import save_evaluation
+from resilience import CircuitOpen
+from config import Config
+
+# Précalcul nocturne des évaluations : les demandes de conseil se concentrent le soir,
+# le serveur est inoccupé la nuit. Une passe traite, par lots et avec une concurrence bornée,
+# les utilisateurs actifs dont un rapport est plus récent que l'évaluation de leur dernier
+# conseiller consulté ; la position (dernier user_id traité) est enregistrée après chaque lot
+# pour reprendre après un arrêt. /create-advise retrouve ensuite l'évaluation par son empreinte.
+#
+#   python precompute.py            à lancer par cron pendant PRECOMPUTE_WINDOW
+#   python precompute.py --force    hors de la fenêtre (essai, rattrapage)
+
+def in_window(now: time, window: str = None) -> bool:
+    """Heure dans la fenêtre "HH:MM-HH:MM" (éventuellement à cheval sur minuit)"""
+    start, end = (time.fromisoformat(part.strip()) for part in (window or Config.PRECOMPUTE_WINDOW).split("-"))
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+async def candidates(after_user_id: int, limit: int):
+    """(user_id, conseiller, dernier rapport) des utilisateurs actifs dont la dernière évaluation servie est dépassée"""
+    active_since = date.today() - timedelta(days=Config.PRECOMPUTE_ACTIVE_DAYS)
+    last_reports = (
+        select(
+            Report.user_id,
+            func.max(Report.id).label("last_report_id"),
+            func.max(Report.date).label("last_date")
+        )
+        .group_by(Report.user_id)
+        .subquery()
+    )
+    # Conseiller inconnu (évaluation antérieure au précalcul) : rien à deviner
+    last_used = (
+        select(Evaluation.user_id, func.max(Evaluation.last_used_at).label("last_used_at"))
+        .where(Evaluation.advisor.is_not(None))
+        .group_by(Evaluation.user_id)
+        .subquery()
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Evaluation.user_id, Evaluation.advisor, last_reports.c.last_report_id)
+            .join(last_used, and_(
+                last_used.c.user_id == Evaluation.user_id,
+                last_used.c.last_used_at == Evaluation.last_used_at
+            ))
+            .join(last_reports, last_reports.c.user_id == Evaluation.user_id)
+            .where(
+                Evaluation.user_id > after_user_id,
+                func.coalesce(Evaluation.last_report_id, 0) < last_reports.c.last_report_id,
+                last_reports.c.last_date >= active_since
+            )
+            .order_by(Evaluation.user_id)
+            .limit(limit)
+        )
+        return result.all()
+
+async def precompute_user(user_id: int, advisor: int, last_report_id: int):
+    history = await build_history(user_id)
+    content = await generate_evaluation(history, advisor)
+    await save_evaluation(
+        user_id, content, advisor, evaluation_fingerprint(history), last_report_id, source='precomputed'
+    )
+
+async def resume_or_start():
+    async with AsyncSessionLocal() as db:
+        run = await db.scalar(
+            select(PrecomputeRun)
+            .where(PrecomputeRun.finished_at.is_(None))
+            .order_by(PrecomputeRun.id.desc())
+            .limit(1)
+        )
+        if run is None:
+            run = PrecomputeRun(cursor=0, processed=0, failed=0)
+            db.add(run)
+            await db.commit()
+        return run.id, run.cursor
+
+async def checkpoint(run_id: int, cursor: int, processed: int, failed: int, finished: bool = False):
+    async with AsyncSessionLocal() as db:
+        run = await db.get(PrecomputeRun, run_id)
+        run.cursor = cursor
+        run.processed += processed
+        run.failed += failed
+        if finished:
+            run.finished_at = datetime.utcnow()
+        await db.commit()
+
+async def run(batch_size: int = None, concurrency: int = None, force: bool = False, clock=datetime.now) -> dict:
+    """Traite les candidats lot par lot jusqu'à épuisement, fin de fenêtre ou disjoncteur ouvert"""
+    batch_size = batch_size or Config.PRECOMPUTE_BATCH_SIZE
+    semaphore = asyncio.Semaphore(concurrency or Config.PRECOMPUTE_CONCURRENCY)
+    run_id, cursor = await resume_or_start()
+    totals = {"run": run_id, "processed": 0, "failed": 0, "finished": False}
+
+    async def process(user_id, advisor, last_report_id):
+        async with semaphore:
+            try:
+                await precompute_user(user_id, advisor, last_report_id)
+                return True
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                print(f"Precompute error for user {user_id}: {e}")
+                return False
+
+    while force or in_window(clock().time()):
+        batch = await candidates(cursor, batch_size)
+        if not batch:
+            await checkpoint(run_id, cursor, 0, 0, finished=True)
+            totals["finished"] = True
+            break
+        results = await asyncio.gather(*[process(*row) for row in batch], return_exceptions=True)
+        if any(isinstance(result, CircuitOpen) for result in results):
+            # OpenAI indisponible : le lot sera repris à la prochaine exécution
+            print("Precompute stopped: AI service unavailable")
+            break
+        done = sum(1 for result in results if result is True)
+        cursor = batch[-1].user_id
+        await checkpoint(run_id, cursor, done, len(batch) - done)
+        totals["processed"] += done
+        totals["failed"] += len(batch) - done
+    return totals
+
+async def main(args):
+    from models import dispose_engines
+    from ai_service import close_client
+    try:
+        return await run(args.batch_size, args.concurrency, args.force)
+    finally:
+        await close_client()
+        await dispose_engines()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Précalcul des évaluations pendant les heures creuses")
+    parser.add_argument("--batch-size", type=int, help="utilisateurs par lot (PRECOMPUTE_BATCH_SIZE)")
+    parser.add_argument("--concurrency", type=int, help="générations simultanées (PRECOMPUTE_CONCURRENCY)")
+    parser.add_argument("--force", action="store_true", help="ignorer la fenêtre PRECOMPUTE_WINDOW")
+    print(f"Précalcul : {asyncio.run(main(parser.parse_args()))}")
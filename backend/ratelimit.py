@@ -0,0 +1,105 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from cache import TTLCache
+
+# Protection des appels GPT :
+#   ConcurrencyLimiter : nombre d'appels simultanés borné, file d'attente bornée elle aussi
+#   TokenBucketLimiter : quota de générations par utilisateur (rafale + débit de recharge)
+# Les deux lèvent une exception portant le délai à renvoyer dans Retry-After (429).
+
+class RateLimited(Exception):
+    """Quota de l'utilisateur épuisé"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class LLMBusy(RateLimited):
+    """File d'attente des appels GPT pleine, ou attente trop longue"""
+
+
+class ConcurrencyLimiter:
+    """Sémaphore équitable (FIFO) dont la file d'attente est bornée en taille et en durée"""
+
+    def __init__(self, limit: int, max_waiting: int, timeout: float, retry_after: float):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters = deque()
+
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def in_flight(self) -> int:
+        return self.active
+
+    def check(self):
+        """Refuse d'avance une requête qui serait rejetée faute de place dans la file"""
+        if self.active >= self.limit and len(self._waiters) >= self.max_waiting:
+            raise LLMBusy(self.retry_after)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        self.check()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except BaseException as exc:
+            if future.done() and not future.cancelled():
+                # Place transmise juste avant l'abandon : on la rend au suivant
+                self.release()
+            else:
+                future.cancel()
+                self._waiters.remove(future)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise LLMBusy(self.retry_after) from None
+            raise
+
+    def release(self):
+        # La place passe directement au plus ancien en attente (active ne bouge pas)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class TokenBucketLimiter:
+    """Seau à jetons par clé : `capacity` requêtes d'affilée, puis `rate` par seconde
+
+    État en mémoire du worker ; un seau plein est équivalent à un seau absent, d'où
+    l'expiration des entrées après le temps de recharge complète.
+    """
+
+    def __init__(self, capacity: float, rate: float, maxsize: int = 10000):
+        self.capacity = capacity
+        self.rate = rate
+        self._buckets = TTLCache(maxsize, capacity / rate)
+
+    def consume(self, key, tokens: float = 1):
+        now = time.monotonic()
+        level, updated = self._buckets.get(key, (self.capacity, now))
+        level = min(self.capacity, level + (now - updated) * self.rate)
+        if level < tokens:
+            raise RateLimited(math.ceil((tokens - level) / self.rate))
+        self._buckets.set(key, (level - tokens, now))
+
+    def reset(self):
+        self._buckets.clear()
@@ -0,0 +1,106 @@
+import random
+import time
+from collections import deque
+
+# Disjoncteur et délais de nouvelle tentative pour un service externe (OpenAI).
+#   fermé      : les appels passent, les issues récentes sont comptées sur une fenêtre glissante
+#   ouvert     : taux d'échec dépassé, tout appel échoue aussitôt (CircuitOpen) pendant `cooldown`
+#   semi-ouvert : après le délai, un seul appel d'essai décide de la réouverture ou de la fermeture
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATES = (CLOSED, HALF_OPEN, OPEN)
+
+
+class CircuitOpen(Exception):
+    """Service considéré en panne : l'appel n'est pas tenté"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, failure_ratio: float, min_calls: int, window: float, cooldown: float):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._trial_at = None  # début de l'appel d'essai en cours (état semi-ouvert)
+        self._outcomes = deque()  # (instant, échec)
+
+    def _prune(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def check(self):
+        """Lève CircuitOpen si l'appel ne doit pas être tenté"""
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        remaining = self.opened_at + self.cooldown - now
+        if self.state == OPEN and remaining <= 0:
+            self.state = HALF_OPEN
+            self._trial_at = None
+        # Un essai abandonné sans issue (annulation) n'empêche pas d'en lancer un autre plus tard
+        if self.state == HALF_OPEN and (self._trial_at is None or now - self._trial_at > self.cooldown):
+            self._trial_at = now
+            return
+        raise CircuitOpen(max(remaining, 1.0))
+
+    def fail_fast(self):
+        """Lève CircuitOpen pendant la pause, sans réserver l'appel d'essai (contrairement à check)"""
+        remaining = self.opened_at + self.cooldown - time.monotonic()
+        if self.state == OPEN and remaining > 0:
+            raise CircuitOpen(remaining)
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._trial_at = None
+            if failed:
+                self._open(now)
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append((now, failed))
+        self._prune(now)
+        failures = sum(1 for _, failure in self._outcomes if failure)
+        if (
+            self.state == CLOSED
+            and len(self._outcomes) >= self.min_calls
+            and failures >= self.failure_ratio * len(self._outcomes)
+        ):
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+        self._outcomes.clear()
+
+    def state_code(self) -> int:
+        """État numérique pour les métriques : 0 fermé, 1 semi-ouvert, 2 ouvert"""
+        return STATES.index(self.state)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        self._prune(now)
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": sum(1 for _, failure in self._outcomes if failure),
+            "retry_after": max(0.0, self.opened_at + self.cooldown - now) if self.state == OPEN else 0.0,
+        }
+
+    def reset(self):
+        self.state = CLOSED
+        self._trial_at = None
+        self._outcomes.clear()
+
+
+def backoff_delays(retries: int, base: float, cap: float):
+    """Délais avant chaque nouvelle tentative : exponentiels, plafonnés, tirés au hasard ("full jitter")"""
+    for attempt in range(retries):
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
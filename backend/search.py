@@ -0,0 +1,162 @@
+import html
+import json
+import re
+import unicodedata
+from sqlalchemy import Integer, Date, Text, Float, text
+from config import Config
+
+# Recherche plein texte dans les résumés et les réponses des rapports.
+#   PostgreSQL : table report_search dont la colonne `document` (tsvector, configuration 'french',
+#                index GIN) est calculée par la base ; classement ts_rank_cd, extraits ts_headline.
+#   SQLite     : table virtuelle FTS5. FTS5 n'a pas de racinisation française (porter est anglais) et
+#                SQLite ne permet pas d'enregistrer un tokenizer depuis Python : les racines sont
+#                calculées ici (stem) et indexées dans la colonne `stems`, les requêtes cherchent ces
+#                racines exactement (pas en préfixe : « mer » ne doit pas trouver « merci ») ; classement bm25, extraits surlignés côté Python.
+# L'entrée d'index est écrite dans la transaction qui insère le rapport (index_report) ; les rapports
+# antérieurs ou importés sont indexés par index_missing.
+
+TOKEN = re.compile(r"[^\W\d_]{3,}")
+STOPWORDS = frozenset("""
+    les des une est pas que qui pour dans sur avec par mais plus son ses aux ces cette été être
+    avoir fait comme tout tous très bien aussi sans sous mon mes ton tes nous vous ils elles leur
+    leurs était ont sont suis avez avons rien peu encore alors donc car puis même entre après
+""".split())
+
+# Racinisation légère : pluriel puis suffixe le plus long laissant au moins 3 lettres
+SUFFIXES = sorted("""
+    issement atrice ateur ation ement ment euse ite ive able ible iste isme ance ence ante ant
+    aient ait ai ion iez on ent ee er ez eu if e
+""".split(), key=len, reverse=True)
+MIN_ROOT = 3
+
+SNIPPET_MARK = ("<mark>", "</mark>")
+
+
+def tokens(text: str):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+def report_text(summary: str, answers) -> str:
+    if isinstance(answers, str):
+        try:
+            answers = json.loads(answers)
+        except ValueError:
+            answers = {}
+    parts = [summary or ""]
+    if isinstance(answers, dict):
+        parts += [str(value) for value in answers.values() if isinstance(value, str)]
+    return "\n".join(parts)
+
+def fold(word: str) -> str:
+    return "".join(
+        char for char in unicodedata.normalize("NFD", word.lower()) if not unicodedata.combining(char)
+    )
+
+def stem(word: str) -> str:
+    word = fold(word)
+    if len(word) > MIN_ROOT and word[-1] in "sx":
+        word = word[:-1]
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_ROOT:
+            return word[:-len(suffix)]
+    return word
+
+def stems(text: str):
+    return [stem(token) for token in tokens(text)]
+
+def query_terms(query: str):
+    return list(dict.fromkeys(stems(query)))
+
+def dialect(db) -> str:
+    return db.get_bind().dialect.name
+
+
+def highlight(body: str, terms, words: int = None) -> str:
+    """Extrait de `words` mots autour du premier terme trouvé, HTML échappé, termes entre <mark>"""
+    words = words or Config.SEARCH_SNIPPET_WORDS
+    found = list(re.finditer(r"\w+", body))
+    if not found:
+        return ""
+    hits = [
+        position for position, match in enumerate(found)
+        if len(match.group()) >= MIN_ROOT and stem(match.group()) in terms
+    ]
+    start = max(0, hits[0] - words // 3) if hits else 0
+    end = min(len(found), start + words)
+    pieces, cursor = [], found[start].start()
+    for position in range(start, end):
+        match = found[position]
+        pieces.append(html.escape(body[cursor:match.start()]))
+        word = html.escape(match.group())
+        pieces.append(f"{SNIPPET_MARK[0]}{word}{SNIPPET_MARK[1]}" if position in hits else word)
+        cursor = match.end()
+    snippet = " ".join("".join(pieces).split())
+    return ("… " if start > 0 else "") + snippet + (" …" if end < len(found) else "")
+
+
+def index_statement(db):
+    if dialect(db) == "postgresql":
+        return text("INSERT INTO report_search (report_id, user_id, body) VALUES (:id, :user_id, :body)")
+    return text("INSERT INTO report_search (rowid, owner, stems, body) VALUES (:id, :owner, :stems, :body)")
+
+def index_params(report_id: int, user_id: int, summary: str, answers) -> dict:
+    body = report_text(summary, answers)
+    return {"id": report_id, "user_id": user_id, "owner": f"u{user_id}", "stems": " ".join(stems(body)), "body": body}
+
+async def index_report(db, report):
+    """À appeler dans la transaction qui insère le rapport : son entrée d'index est écrite avec lui"""
+    await db.flush()
+    await db.execute(index_statement(db), index_params(report.id, report.user_id, report.summary, report.answers))
+
+async def index_missing(db, user_id: int) -> int:
+    """Indexe les rapports de l'utilisateur absents de l'index (commit à l'appelant)"""
+    key = "s.report_id" if dialect(db) == "postgresql" else "s.rowid"
+    result = await db.execute(
+        text(
+            "SELECT r.id, r.summary, r.answers FROM reports r "
+            f"WHERE r.user_id = :user_id AND NOT EXISTS (SELECT 1 FROM report_search s WHERE {key} = r.id)"
+        ),
+        {"user_id": user_id}
+    )
+    rows = [index_params(report_id, user_id, summary, answers) for report_id, summary, answers in result.all()]
+    if rows:
+        await db.execute(index_statement(db), rows)
+    return len(rows)
+
+def headline_options() -> str:
+    words = Config.SEARCH_SNIPPET_WORDS
+    return f"StartSel={SNIPPET_MARK[0]}, StopSel={SNIPPET_MARK[1]}, MinWords={max(1, words // 2)}, MaxWords={words}"
+
+RESULT_COLUMNS = {"id": Integer, "date": Date, "snippet": Text, "score": Float}
+
+async def search_reports(db, user_id: int, query: str, limit: int):
+    """[{id, date, snippet, score}] des rapports correspondant à tous les termes, les plus pertinents d'abord"""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    if dialect(db) == "postgresql":
+        result = await db.execute(
+            text(
+                "SELECT r.id, r.date, ts_headline('french', "
+                "replace(replace(replace(s.body, '&', '&amp;'), '<', '&lt;'), '>', '&gt;'), q, :options) AS snippet, "
+                "ts_rank_cd(s.document, q) AS score "
+                "FROM report_search s JOIN reports r ON r.id = s.report_id, "
+                "plainto_tsquery('french', :query) q "
+                "WHERE s.user_id = :user_id AND s.document @@ q "
+                "ORDER BY score DESC, r.date DESC LIMIT :limit"
+            ).columns(**RESULT_COLUMNS),
+            {"user_id": user_id, "query": query, "limit": limit, "options": headline_options()}
+        )
+        return [row._asdict() for row in result.all()]
+
+    # Termes entre guillemets : aucun opérateur FTS5 ne peut venir de la saisie
+    match = "owner:u{} AND stems:({})".format(user_id, " AND ".join(f'"{term}"' for term in terms))
+    result = await db.execute(
+        text(
+            "SELECT r.id, r.date, report_search.body AS snippet, -bm25(report_search, 0.0, 1.0) AS score "
+            "FROM report_search JOIN reports r ON r.id = report_search.rowid "
+            "WHERE report_search MATCH :match "
+            "ORDER BY bm25(report_search, 0.0, 1.0), r.date DESC LIMIT :limit"
+        ).columns(**RESULT_COLUMNS),
+        {"match": match, "limit": limit}
+    )
+    return [dict(row._asdict(), snippet=highlight(row.snippet, terms)) for row in result.all()]
@@ -0,0 +1,140 @@
+import math
+import zlib
+from collections import Counter
+import numpy as np
+from sqlalchemy import select, func
+from models import Report, ReportVector
+from cache import TTLCache
+from config import Config
+from search import tokens, report_text
+
+# Recherche des « jours comme aujourd'hui » sans appel externe : chaque rapport (résumé et réponses)
+# devient un vecteur float32 de fréquences de termes hachées (hashing trick), enregistré avec le
+# rapport. La pondération IDF est calculée à la requête sur le corpus de l'utilisateur, puis le
+# cosinus est évalué d'un coup sur toute la matrice (NumPy). Chaque worker garde en mémoire la
+# matrice des utilisateurs récents et n'y ajoute que les rapports arrivés depuis (reconstruite si un
+# rapport a été supprimé).
+
+def embed(text: str, dimensions: int = None) -> np.ndarray:
+    """Fréquences sous-linéaires (1 + log tf) hachées dans `dimensions` cases, signe tiré du hash"""
+    dimensions = dimensions or Config.SIMILARITY_DIMENSIONS
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token, count in Counter(tokens(text)).items():
+        digest = zlib.crc32(token.encode())
+        sign = 1.0 if digest & 0x80000000 else -1.0
+        vector[digest % dimensions] += sign * (1.0 + math.log(count))
+    return vector
+
+def embed_report(summary: str, answers) -> np.ndarray:
+    return embed(report_text(summary, answers))
+
+
+class UserIndex:
+    """Matrice (rapports x dimensions) d'un utilisateur, normalisée paresseusement après chaque ajout"""
+
+    def __init__(self, dimensions: int):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.counts = np.empty((0, dimensions), dtype=np.float32)
+        self._weights = None
+        self._unit = None
+
+    @property
+    def max_id(self) -> int:
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def append(self, ids, vectors):
+        # Deux requêtes concurrentes peuvent lire les mêmes rapports : chacun n'est ajouté qu'une fois
+        ids = np.asarray(ids, dtype=np.int64)
+        fresh = ids > self.max_id
+        if not fresh.any():
+            return
+        self.ids = np.concatenate([self.ids, ids[fresh]])
+        self.counts = np.vstack([self.counts, np.asarray(vectors, dtype=np.float32)[fresh]])
+        self._weights = self._unit = None
+
+    def vector(self, report_id: int):
+        position = np.searchsorted(self.ids, report_id)
+        if position < len(self.ids) and self.ids[position] == report_id:
+            return self.counts[position]
+        return None
+
+    def _prepare(self):
+        if self._unit is None:
+            document_freq = np.count_nonzero(self.counts, axis=0)
+            self._weights = (np.log((1 + len(self.ids)) / (1 + document_freq)) + 1).astype(np.float32)
+            weighted = self.counts * self._weights
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            self._unit = weighted / np.where(norms == 0, 1, norms)
+        return self._weights, self._unit
+
+    def search(self, query: np.ndarray, k: int, exclude: int = None):
+        """[(report_id, score)] des k rapports les plus proches (cosinus TF-IDF), score décroissant"""
+        if query is None or not len(self.ids):
+            return []
+        weights, unit = self._prepare()
+        query = query * weights
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = unit @ (query / norm)
+        if exclude is not None:
+            scores[self.ids == exclude] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i]) and scores[i] > 0]
+
+
+indexes = TTLCache(Config.SIMILARITY_CACHE_USERS, Config.SIMILARITY_CACHE_TTL)
+
+def vector_row(report_id: int, user_id: int, summary: str, answers) -> ReportVector:
+    return ReportVector(report_id=report_id, user_id=user_id, vector=embed_report(summary, answers).tobytes())
+
+async def record_report(db, report: Report):
+    """À appeler dans la transaction qui insère le rapport : son vecteur est enregistré (ou remplacé) avec lui"""
+    await db.flush()
+    await db.merge(vector_row(report.id, report.user_id, report.summary, report.answers))
+
+async def read_reports(db, user_id: int, index: UserIndex):
+    # Seuls les rapports postérieurs à la matrice en mémoire sont lus ; ceux qui n'ont pas encore de
+    # vecteur (antérieurs à la recherche, importés) sont vectorisés et ajoutés à la session (commit à l'appelant)
+    result = await db.execute(
+        select(Report.id, Report.summary, Report.answers, ReportVector.vector)
+        .outerjoin(ReportVector, ReportVector.report_id == Report.id)
+        .where(Report.user_id == user_id, Report.id > index.max_id)
+        .order_by(Report.id)
+    )
+    ids, vectors = [], []
+    expected_size = Config.SIMILARITY_DIMENSIONS * 4
+    for report_id, summary, answers, blob in result.all():
+        if blob is not None and len(blob) == expected_size:
+            vector = np.frombuffer(blob, dtype=np.float32)
+        else:
+            row = vector_row(report_id, user_id, summary, answers)
+            if blob is None:
+                db.add(row)
+            else:
+                # Vecteur d'une autre taille (SIMILARITY_DIMENSIONS modifié) : remplacé
+                await db.merge(row)
+            vector = np.frombuffer(row.vector, dtype=np.float32)
+        ids.append(report_id)
+        vectors.append(vector)
+    index.append(ids, np.array(vectors, dtype=np.float32).reshape(len(vectors), Config.SIMILARITY_DIMENSIONS))
+
+async def load_index(db, user_id: int) -> UserIndex:
+    # La matrice en mémoire n'est complétée que si le nombre et le dernier id des rapports le permettent :
+    # un rapport supprimé, ou inséré sous le dernier id, la fait reconstruire. Un id n'est jamais
+    # réattribué (AUTOINCREMENT sous SQLite, séquence sous PostgreSQL) : un rapport de la matrice ne
+    # peut pas avoir été remplacé par un autre de même id.
+    count, last_id = (await db.execute(
+        select(func.count(Report.id), func.max(Report.id)).where(Report.user_id == user_id)
+    )).one()
+    index = indexes.get(user_id)
+    if index is None or index.counts.shape[1] != Config.SIMILARITY_DIMENSIONS or index.max_id > (last_id or 0):
+        index = UserIndex(Config.SIMILARITY_DIMENSIONS)
+    await read_reports(db, user_id, index)
+    if len(index.ids) != count:
+        index = UserIndex(Config.SIMILARITY_DIMENSIONS)
+        await read_reports(db, user_id, index)
+    indexes.set(user_id, index)
+    return index
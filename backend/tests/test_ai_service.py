@@ -1,20 +1,55 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
 import os
 import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from ai_service import generate_summary, generate_evaluation
+from ai_service import generate_summary, generate_evaluation, stream_evaluation, llm_breaker
+from resilience import CircuitOpen
+from metrics import REGISTRY
 
-class TestAIService(unittest.TestCase):
-    @patch('ai_service.client.chat.completions.create')
-    def test_generate_summary(self, mock_create):
+class FakeStream:
+    """Imite l'AsyncStream d'OpenAI : itérable asynchrone et gestionnaire de contexte"""
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.closed = True
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = delta
+            chunk.usage = None
+            yield chunk
+        # Dernier morceau : consommation de jetons, sans choix
+        chunk = MagicMock()
+        chunk.choices = []
+        chunk.usage.prompt_tokens = 30
+        chunk.usage.completion_tokens = 2
+        yield chunk
+
+class TestAIService(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        llm_breaker.reset()
+
+    @patch('ai_service.client.chat.completions.create', new_callable=AsyncMock)
+    async def test_generate_summary(self, mock_create):
         """Test la génération de résumé"""
         # Configuration du mock
         mock_response = MagicMock()
         mock_response.choices[0].message.content = "Résumé test"
+        mock_response.usage.prompt_tokens = 120
+        mock_response.usage.completion_tokens = 40
         mock_create.return_value = mock_response
+        labels = {"kind": "summary", "persona": "none"}
+        tokens_before = REGISTRY.get_sample_value("llm_prompt_tokens_total", labels) or 0
 
         # Données de test
         test_answers = {
@@ -26,7 +61,7 @@ class TestAIService(unittest.TestCase):
         test_objectifs = ["Apprendre Python", "Faire du sport"]
 
         # Test de la fonction
-        result = generate_summary(test_answers, test_objectifs)
+        result = await generate_summary(test_answers, test_objectifs)
 
         # Vérifications
         self.assertEqual(result, "Résumé test")
@@ -40,12 +75,16 @@ class TestAIService(unittest.TestCase):
         self.assertIn("user", call_args['messages'][1]['role'])
         self.assertIn(test_answers["q1"], call_args['messages'][1]['content'])
 
-    @patch('ai_service.client.chat.completions.create')
-    def test_generate_evaluation(self, mock_create):
+        # Vérification des métriques
+        self.assertEqual(REGISTRY.get_sample_value("llm_prompt_tokens_total", labels), tokens_before + 120)
+
+    @patch('ai_service.client.chat.completions.create', new_callable=AsyncMock)
+    async def test_generate_evaluation(self, mock_create):
         """Test la génération d'évaluation avec différents conseillers"""
         # Configuration du mock
         mock_response = MagicMock()
         mock_response.choices[0].message.content = "Évaluation test"
+        mock_response.usage = None
         mock_create.return_value = mock_response
 
         # Données de test
@@ -58,7 +97,7 @@ class TestAIService(unittest.TestCase):
         # Test avec différents conseillers
         for advisor_id in range(3):  # Test avec les 3 premiers conseillers
             with self.subTest(advisor_id=advisor_id):
-                result = generate_evaluation(test_history, advisor_id)
+                result = await generate_evaluation(test_history, advisor_id)
                 
                 # Vérifications
                 self.assertEqual(result, "Évaluation test")
@@ -77,11 +116,25 @@ class TestAIService(unittest.TestCase):
                 
             mock_create.reset_mock()
 
-    @patch('ai_service.client.chat.completions.create')
-    def test_error_handling(self, mock_create):
+    @patch('ai_service.client.chat.completions.create', new_callable=AsyncMock)
+    async def test_stream_evaluation(self, mock_create):
+        """Test la génération d'évaluation en flux"""
+        stream = FakeStream(["Bon", None, "jour"])
+        mock_create.return_value = stream
+
+        deltas = [delta async for delta in stream_evaluation(["Jour 1"], 3)]
+
+        self.assertEqual(deltas, ["Bon", "jour"])
+        self.assertTrue(mock_create.call_args[1]['stream'])
+        self.assertTrue(stream.closed)
+
+    @patch('ai_service.client.chat.completions.create', new_callable=AsyncMock)
+    async def test_error_handling(self, mock_create):
         """Test la gestion des erreurs"""
         # Simuler une erreur d'API
         mock_create.side_effect = Exception("API Error")
+        labels = {"kind": "summary", "persona": "none"}
+        errors_before = REGISTRY.get_sample_value("llm_errors_total", labels) or 0
 
         # Test avec des données minimales
         test_answers = {
@@ -94,7 +147,38 @@ class TestAIService(unittest.TestCase):
 
         # Vérifier que l'erreur est gérée correctement
         with self.assertRaises(Exception):
-            generate_summary(test_answers, test_objectifs)
+            await generate_summary(test_answers, test_objectifs)
+        self.assertEqual(REGISTRY.get_sample_value("llm_errors_total", labels), errors_before + 1)
+
+    @patch('ai_service.Config.LLM_RETRY_BASE', 0)
+    @patch('ai_service.client.chat.completions.create', new_callable=AsyncMock)
+    async def test_transient_errors_retried(self, mock_create):
+        """Test les nouvelles tentatives sur délai dépassé, pas sur une autre erreur"""
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = "Évaluation"
+        mock_response.usage = None
+        mock_create.side_effect = [asyncio.TimeoutError(), mock_response]
+        self.assertEqual(await generate_evaluation(["Jour 1"], 1), "Évaluation")
+        self.assertEqual(mock_create.call_count, 2)
+
+        mock_create.reset_mock()
+        mock_create.side_effect = ValueError("requête invalide")
+        with self.assertRaises(ValueError):
+            await generate_evaluation(["Jour 1"], 1)
+        mock_create.assert_called_once()
+
+    @patch('ai_service.Config.LLM_MAX_RETRIES', 0)
+    @patch('ai_service.client.chat.completions.create', new_callable=AsyncMock)
+    async def test_breaker_fails_fast(self, mock_create):
+        """Test qu'une fois le disjoncteur ouvert, OpenAI n'est plus appelé"""
+        mock_create.side_effect = asyncio.TimeoutError()
+        for _ in range(llm_breaker.min_calls):
+            with self.assertRaises(asyncio.TimeoutError):
+                await generate_evaluation(["Jour 1"], 1)
+        mock_create.reset_mock()
+        with self.assertRaises(CircuitOpen):
+            await generate_evaluation(["Jour 1"], 1)
+        mock_create.assert_not_called()
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+from datetime import date, timedelta
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+from models import User, Report, MoodSeries, AsyncSessionLocal, db_session
+from migrations import upgrade
+from analytics import mood_score, build_series, set_day, mood_stats
+from app import app, insert_report, create_access_token
+
+# Jeudi
+TODAY = date(2026, 3, 19)
+
+
+def setUpModule():
+    # Schéma à jour sur la base de test
+    upgrade()
+
+class TestMoodStats(unittest.TestCase):
+    def series(self, start, moods):
+        series = MoodSeries(user_id=0, start_date=start, moods=b"", count=0, total=0.0, total_sq=0.0)
+        for offset, mood in enumerate(moods):
+            if mood is not None:
+                set_day(series, start + timedelta(days=offset), mood)
+        return series
+
+    def test_mood_score(self):
+        """Test la conversion des réponses en score"""
+        self.assertEqual(mood_score({"mood": "Heureux"}), 5.0)
+        self.assertEqual(mood_score('{"mood": "Triste"}'), 1.0)
+        self.assertEqual(mood_score({"mood": 6}), 6.0)
+        self.assertIsNone(mood_score({"mood": "Inconnu"}))
+        self.assertIsNone(mood_score("pas du json"))
+
+    def test_stats(self):
+        """Test les moyennes glissantes, séries, jours de semaine et volatilité"""
+        # Du lundi 9 au jeudi 19 mars, sans rapport le samedi 14 ni le mercredi 18
+        moods = [5, 3, 4, 2, 1, None, 3, 4, 4, None, 5]
+        stats = mood_stats(self.series(date(2026, 3, 9), moods), TODAY, days=7)
+
+        self.assertEqual(stats["from"], "2026-03-13")
+        self.assertEqual(stats["series"]["mood"], [1.0, None, 3.0, 4.0, 4.0, None, 5.0])
+        # Fenêtre de 7 jours finissant le 19 : 1, 3, 4, 4, 5
+        self.assertEqual(stats["series"]["rolling_7"][-1], 3.4)
+        self.assertEqual(stats["summary"], {"count": 9, "mean": 3.44, "std": 1.26})
+        self.assertEqual(stats["streaks"], {"current": 1, "longest": 5})
+        self.assertEqual(stats["weekdays"][0], {"weekday": 0, "mean": 4.5, "count": 2})
+        self.assertEqual(stats["weekdays"][5], {"weekday": 5, "mean": None, "count": 0})
+        # Variations consécutives connues dans la fenêtre : +1, 0
+        self.assertEqual(stats["volatility"], 0.5)
+
+    def test_stats_without_reports(self):
+        """Test la réponse vide d'un utilisateur sans humeur enregistrée"""
+        stats = mood_stats(None, TODAY, days=30)
+        self.assertEqual(stats["summary"]["count"], 0)
+        self.assertEqual(len(stats["series"]["mood"]), 30)
+
+class TestMoodSeries(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        user = User("mooduser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        for offset, mood in enumerate(["Heureux", "Triste", "Fatigué"]):
+            db_session.add(Report(user_id=self.user_id, date=TODAY - timedelta(days=5 - offset),
+                                  answers=json.dumps({"mood": mood}), summary="x"))
+        db_session.commit()
+
+    def tearDown(self):
+        db_session.query(MoodSeries).filter_by(user_id=self.user_id).delete()
+        db_session.query(Report).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    @patch('app.schedule_digest_refresh', new_callable=AsyncMock)
+    async def test_incremental_matches_rebuild(self, mock_refresh):
+        """Test que la série tenue rapport par rapport égale une reconstruction complète"""
+        # Premier rapport : série construite depuis l'historique, puis mises à jour ponctuelles
+        await insert_report(self.user_id, TODAY - timedelta(days=1), {"mood": "Excité"}, "x")
+        await insert_report(self.user_id, TODAY, {"mood": "Frustré"}, "x")
+        await insert_report(self.user_id, TODAY, {"mood": "Heureux"}, "x")
+
+        async with AsyncSessionLocal() as db:
+            stored = (await db.get(MoodSeries, self.user_id))
+            rebuilt = await build_series(db, self.user_id)
+        for column in ("start_date", "moods", "count", "total", "total_sq"):
+            self.assertEqual(getattr(stored, column), getattr(rebuilt, column), column)
+        self.assertEqual(stored.count, 5)
+
+    async def test_concurrent_first_series(self):
+        """Test deux premiers rapports simultanés : la série insérée par l'autre requête est complétée"""
+        import analytics
+        build = analytics.build_series
+
+        async def build_during_other_insert(db, user_id):
+            series = await build(db, user_id)
+            # L'autre requête insère sa série pendant la construction de celle-ci
+            async with AsyncSessionLocal() as other:
+                other.add(await build(other, user_id))
+                await other.commit()
+            return series
+
+        with patch('analytics.build_series', build_during_other_insert):
+            async with AsyncSessionLocal() as db:
+                await analytics.record_mood(db, self.user_id, TODAY, {"mood": "Heureux"})
+                await db.commit()
+        stored = db_session.get(MoodSeries, self.user_id)
+        self.assertEqual((stored.count, stored.total), (4, 14.0))
+
+    @patch('app.date')
+    def test_route(self, mock_date):
+        """Test l'endpoint d'analyse, série construite à la première lecture"""
+        mock_date.today.return_value = TODAY
+        client = TestClient(app)
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(self.user_id)})}"}
+        response = client.get('/analytics/mood', params={"days": 7}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()
+        self.assertEqual(stats["series"]["mood"], [None, 5.0, 1.0, 3.0, None, None, None])
+        self.assertEqual(stats["summary"]["count"], 3)
+        self.assertIsNotNone(db_session.get(MoodSeries, self.user_id))
+
+if __name__ == '__main__':
+    unittest.main()
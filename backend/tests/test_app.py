@@ -1,4 +1,7 @@
 import unittest
+from unittest.mock import patch, AsyncMock
+import asyncio
+import httpx
 from fastapi.testclient import TestClient
 import os
 import sys
@@ -7,7 +10,13 @@ import json
 # Ajouter le répertoire parent au PYTHONPATH
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app
+from app import app, create_access_token
+from migrations import upgrade
+
+
+def setUpModule():
+    # Schéma à jour sur la base de test
+    upgrade()
 
 class TestApp(unittest.TestCase):
     def setUp(self):
@@ -50,12 +59,602 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()['message'], 'User created successfully')
 
+    def test_login_and_goals(self):
+        """Test la connexion puis l'ajout et la lecture d'objectifs"""
+        self.client.post('/register', json={"username": "testuser", "password": "testpassword"})
+        response = self.client.post(
+            '/token',
+            data={"username": "testuser", "password": "testpassword"}
+        )
+        self.assertEqual(response.status_code, 200)
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = self.client.post('/add-goal', json={"objective": {"title": "Courir"}}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        goal_id = response.json()['goal']['id']
+
+        response = self.client.get('/get-goals', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Courir", [g['title'] for g in response.json()])
+
+        response = self.client.delete(f'/delete-goal/{goal_id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_goals_etag_and_compression(self):
+        """Test le GET conditionnel (ETag / 304) et la compression de /get-goals"""
+        self.client.post('/register', json={"username": "testuser", "password": "testpassword"})
+        token = self.client.post('/token', data={"username": "testuser", "password": "testpassword"}).json()['access_token']
+        headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "identity"}
+
+        first = self.client.get('/get-goals', headers=headers)
+        etag = first.headers["ETag"]
+        second = self.client.get('/get-goals', headers={**headers, "If-None-Match": etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+
+        goal_ids = []
+        for i in range(30):
+            response = self.client.post('/add-goal', json={"objective": {"title": f"Objectif numéro {i} à tenir"}}, headers=headers)
+            goal_ids.append(response.json()['goal']['id'])
+
+        third = self.client.get('/get-goals', headers={**headers, "If-None-Match": etag})
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third.headers["ETag"], etag)
+
+        compressed = self.client.get('/get-goals', headers={**headers, "Accept-Encoding": "gzip"})
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(compressed.json(), third.json())
+        # L'ETag de la représentation compressée reste valable pour un GET conditionnel
+        fourth = self.client.get('/get-goals', headers={**headers, "If-None-Match": compressed.headers["ETag"]})
+        self.assertEqual(fourth.status_code, 304)
+
+        for goal_id in goal_ids:
+            self.client.delete(f'/delete-goal/{goal_id}', headers=headers)
+
+    def test_goals_batch(self):
+        """Test les opérations groupées sur les objectifs avec résultat par élément"""
+        self.client.post('/register', json={"username": "testuser", "password": "testpassword"})
+        token = self.client.post('/token', data={"username": "testuser", "password": "testpassword"}).json()['access_token']
+        headers = {"Authorization": f"Bearer {token}"}
+        kept = self.client.post('/add-goal', json={"objective": {"title": "Lire"}}, headers=headers).json()['goal']['id']
+        removed = self.client.post('/add-goal', json={"objective": {"title": "Courir"}}, headers=headers).json()['goal']['id']
+
+        response = self.client.post('/goals/batch', json={"operations": [
+            {"op": "create", "title": "Méditer"},
+            {"op": "create", "title": "Nager", "status": "completed"},
+            {"op": "update", "id": kept, "title": "", "status": "completed"},
+            # Chaîne vide : valeur conservée en base comme dans le résultat
+            {"op": "update", "id": kept, "status": ""},
+            {"op": "delete", "id": removed},
+            {"op": "update", "id": removed, "title": "Marcher"},
+            {"op": "delete", "id": 999999},
+            {"op": "create"},
+        ]}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+
+        self.assertEqual([r['status'] for r in results],
+                         ["created", "created", "updated", "updated", "deleted", "error", "error", "error"])
+        self.assertEqual(results[2]['goal'], {"id": kept, "title": "Lire", "status": "completed"})
+        self.assertEqual(results[3]['goal'], results[2]['goal'])
+
+        active = self.client.get('/get-goals', headers=headers).json()
+        completed = self.client.get('/get-goals', params={"status": "completed"}, headers=headers).json()
+        self.assertEqual([g['title'] for g in active], ["Méditer"])
+        self.assertEqual(sorted(g['title'] for g in completed), ["Lire", "Nager"])
+
+        self.client.post('/goals/batch', json={"operations": [
+            {"op": "delete", "id": g['id']} for g in active + completed
+        ]}, headers=headers)
+
+    def test_metrics(self):
+        """Test l'exposition des métriques au format Prometheus"""
+        self.client.get('/verify-token')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/verify-token",status="401"}', response.text)
+        self.assertIn('cache_hits_total{cache="token"}', response.text)
+        self.assertIn('job_queue_depth', response.text)
+
     def tearDown(self):
         """Nettoyage après les tests"""
         from models import User, db_session
         db_session.query(User).filter_by(username='testuser').delete()
         db_session.commit()
 
+class TestSubmitReport(unittest.IsolatedAsyncioTestCase):
+    answers = {"mood": 6, "q1": "Lu un livre", "q2": "Calme", "q3": "Reposé"}
+
+    def setUp(self):
+        from models import User, db_session
+        from cache import summary_cache
+        from app import generation_limiter
+        summary_cache.clear()
+        generation_limiter.reset()
+        user = User("reportuser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    async def asyncTearDown(self):
+        from jobs import job_queue
+        await job_queue.stop()
+
+    def tearDown(self):
+        from models import User, Report, ReportVector, MoodSeries, Job, db_session
+        for model in (Job, ReportVector, MoodSeries, Report):
+            db_session.query(model).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def count_reports(self):
+        from models import Report, db_session
+        db_session.expire_all()
+        return db_session.query(Report).filter_by(user_id=self.user_id).count()
+
+    async def post(self, client, **headers):
+        return await client.post(
+            '/submit-report',
+            json={"answers": self.answers},
+            headers={**self.headers, **headers}
+        )
+
+    async def test_concurrent_duplicates_coalesced(self):
+        """Test que des soumissions identiques concurrentes donnent un seul appel GPT et une seule ligne"""
+        async def slow_summary(*args):
+            await asyncio.sleep(0.1)
+            return "Résumé"
+
+        transport = httpx.ASGITransport(app=app)
+        with patch('app.generate_summary', new=AsyncMock(side_effect=slow_summary)) as mock_summary:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = await asyncio.gather(*[self.post(client) for _ in range(3)])
+                retry = await self.post(client)
+
+        for response in responses + [retry]:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['summary'], "Résumé")
+        mock_summary.assert_called_once()
+        self.assertEqual(self.count_reports(), 1)
+
+    async def test_idempotency_key_replay(self):
+        """Test le rejeu d'une réponse via l'en-tête Idempotency-Key"""
+        transport = httpx.ASGITransport(app=app)
+        with patch('app.generate_summary', new=AsyncMock(return_value="Résumé")) as mock_summary:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = await self.post(client, **{"Idempotency-Key": "abc"})
+                second = await self.post(client, **{"Idempotency-Key": "abc"})
+
+        self.assertEqual(first.json(), second.json())
+        mock_summary.assert_called_once()
+        self.assertEqual(self.count_reports(), 1)
+
+class TestReportsHistory(unittest.TestCase):
+    def setUp(self):
+        from datetime import date, timedelta
+        from models import User, Report, db_session
+        user = User("historyuser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        start = date(2026, 1, 1)
+        # Deux rapports le même jour pour vérifier le départage par id
+        for i in range(25):
+            db_session.add(Report(user_id=user.id, date=start + timedelta(days=i // 2),
+                                  answers=json.dumps({"mood": i}), summary=f"Résumé {i}"))
+        db_session.commit()
+        self.client = TestClient(app)
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    def tearDown(self):
+        from models import User, Report, ReportVector, MoodSeries, db_session
+        for model in (ReportVector, MoodSeries, Report):
+            db_session.query(model).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def test_keyset_pagination(self):
+        """Test le parcours complet de l'historique page par page, sans doublon ni trou"""
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+            page = self.client.get('/reports', params=params, headers=self.headers).json()
+            seen.extend(page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len({item["id"] for item in seen}), 25)
+        keys = [(item["date"], item["id"]) for item in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(set(seen[0]), {"id", "date", "summary"})
+
+    def test_fields_and_date_range(self):
+        """Test la projection des colonnes et le filtre par dates"""
+        response = self.client.get('/reports', params={
+            "fields": "answers", "from": "2026-01-03", "to": "2026-01-04"
+        }, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        items = response.json()["items"]
+        self.assertEqual(len(items), 4)
+        self.assertEqual({item["date"] for item in items}, {"2026-01-03", "2026-01-04"})
+        self.assertNotIn("summary", items[0])
+        self.assertIn("mood", items[0]["answers"])
+
+        self.assertEqual(self.client.get('/reports', params={"fields": "password"}, headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get('/reports', params={"cursor": "!!"}, headers=self.headers).status_code, 400)
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        from datetime import date
+        from models import User, Report, Evaluation, Goal, db_session
+        self.source, self.target = User("exportuser", "x"), User("importuser", "x")
+        db_session.add_all([self.source, self.target])
+        db_session.commit()
+        db_session.add_all([
+            Report(user_id=self.source.id, date=date(2026, 2, day), answers=json.dumps({"mood": day}),
+                   summary=f"Jour {day}, « calme »\navec \"guillemets\"") for day in range(1, 6)
+        ] + [
+            Evaluation(user_id=self.source.id, date=date(2026, 2, 5), content="Bonne semaine"),
+            Goal(user_id=self.source.id, title="Courir, nager", status="active"),
+            Goal(user_id=self.source.id, title="Lire", status="completed"),
+        ])
+        db_session.commit()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        from models import User, Report, Evaluation, Goal, db_session
+        for user in (self.source, self.target):
+            for model in (Report, Evaluation, Goal):
+                db_session.query(model).filter_by(user_id=user.id).delete()
+            db_session.query(User).filter_by(id=user.id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def headers(self, user):
+        return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    def export(self, user, fmt):
+        response = self.client.get('/export', params={"format": fmt}, headers=self.headers(user))
+        self.assertEqual(response.status_code, 200)
+        return response.text
+
+    def records(self, user):
+        lines = self.export(user, "ndjson").splitlines()
+        return sorted((json.dumps({k: v for k, v in json.loads(line).items() if k != "id"}, sort_keys=True) for line in lines))
+
+    @patch('app.schedule_digest_refresh', new_callable=AsyncMock)
+    @patch('transfer.Config.IMPORT_BATCH_SIZE', 2)
+    @patch('transfer.Config.EXPORT_CHUNK_SIZE', 2)
+    def test_roundtrip(self, mock_refresh):
+        """Test l'export puis le réimport à l'identique, en NDJSON et en CSV"""
+        expected = self.records(self.source)
+        self.assertEqual(len(expected), 8)
+        for fmt in ("ndjson", "csv"):
+            with self.subTest(format=fmt):
+                response = self.client.post('/import', params={"format": fmt},
+                                            content=self.export(self.source, fmt).encode(), headers=self.headers(self.target))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["imported"], {"report": 5, "evaluation": 1, "goal": 2})
+                self.assertEqual(self.records(self.target), expected)
+                self.tearDownTarget()
+        mock_refresh.assert_awaited_with(self.target.id)
+
+    def tearDownTarget(self):
+        from models import Report, Evaluation, Goal, db_session
+        for model in (Report, Evaluation, Goal):
+            db_session.query(model).filter_by(user_id=self.target.id).delete()
+        db_session.commit()
+
+    def test_invalid_import_rolls_back(self):
+        """Test qu'une ligne invalide annule tout l'import"""
+        body = '{"type": "goal", "title": "Méditer"}\n{"type": "report", "date": "hier", "summary": "x"}\n'
+        response = self.client.post('/import', content=body.encode(), headers=self.headers(self.target))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Line 2", response.json()["detail"])
+        self.assertEqual(self.records(self.target), [])
+        self.assertEqual(self.client.get('/export', params={"format": "xml"}, headers=self.headers(self.target)).status_code, 400)
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        from models import User, db_session
+        self.client = TestClient(app)
+        user = User("streamuser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    def tearDown(self):
+        from models import User, Evaluation, db_session
+        db_session.query(Evaluation).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def test_create_advise_stream(self):
+        """Test le flux SSE de l'évaluation puis son enregistrement"""
+        async def fake_stream(*args):
+            for delta in ["Bon", "jour"]:
+                yield delta
+
+        with patch('app.stream_evaluation', new=fake_stream):
+            response = self.client.post('/create-advise/stream', json={"advisor": 2}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        self.assertIn('data: {"delta": "Bon"}', response.text)
+        self.assertIn('event: done', response.text)
+
+        from models import Evaluation, db_session
+        evaluation = db_session.query(Evaluation).filter_by(user_id=self.user_id).one()
+        self.assertEqual(evaluation.content, "Bonjour")
+
+class TestRateLimit(unittest.TestCase):
+    def setUp(self):
+        from models import User, db_session
+        from app import generation_limiter
+        generation_limiter.reset()
+        self.client = TestClient(app)
+        user = User("quotauser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    def tearDown(self):
+        from models import User, Report, ReportVector, MoodSeries, Evaluation, db_session
+        from app import generation_limiter
+        generation_limiter.reset()
+        for model in (Evaluation, ReportVector, MoodSeries, Report):
+            db_session.query(model).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    @patch('app.generate_evaluation', new=AsyncMock(return_value="Évaluation"))
+    @patch('app.find_evaluation', new=AsyncMock(return_value=None))
+    def test_user_quota(self):
+        """Test le 429 avec Retry-After une fois la rafale autorisée consommée par des appels GPT"""
+        from app import generation_limiter
+        for _ in range(int(generation_limiter.capacity)):
+            response = self.client.post('/create-advise', json={"advisor": 1}, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post('/create-advise', json={"advisor": 1}, headers=self.headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+
+    @patch('app.schedule_digest_refresh', new_callable=AsyncMock)
+    @patch('app.generate_summary', new_callable=AsyncMock, return_value="Résumé")
+    @patch('app.generate_evaluation', new_callable=AsyncMock, return_value="Évaluation")
+    def test_known_answers_are_free(self, generate_evaluation, generate_summary, mock_refresh):
+        """Test que l'évaluation enregistrée et le rejeu Idempotency-Key ne consomment pas le quota"""
+        from app import generation_limiter
+        attempts = int(generation_limiter.capacity) + 2
+        for _ in range(attempts):
+            response = self.client.post('/create-advise', json={"advisor": 1}, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+        generate_evaluation.assert_awaited_once()
+
+        headers = {**self.headers, "Idempotency-Key": "quota"}
+        for _ in range(attempts):
+            response = self.client.post('/submit-report', json={"answers": {"mood": 5}}, headers=headers)
+            self.assertEqual(response.status_code, 200)
+        generate_summary.assert_awaited_once()
+
+    def test_llm_saturated(self):
+        """Test qu'un flux est refusé en 429 avant de commencer quand la file GPT est pleine"""
+        from ai_service import llm_limiter
+        with patch.object(llm_limiter, 'active', llm_limiter.limit), patch.object(llm_limiter, 'max_waiting', 0):
+            response = self.client.post('/create-advise/stream', json={"advisor": 1}, headers=self.headers)
+            metrics_text = self.client.get('/metrics').text
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], str(llm_limiter.retry_after))
+        self.assertIn("llm_in_flight", metrics_text)
+        self.assertIn("llm_queue_depth", metrics_text)
+
+class TestCircuitFallback(unittest.TestCase):
+    def setUp(self):
+        from models import User, db_session
+        self.client = TestClient(app)
+        user = User("fallbackuser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    def tearDown(self):
+        from models import User, Evaluation, db_session
+        from ai_service import llm_breaker
+        from app import generation_limiter
+        llm_breaker.reset()
+        generation_limiter.reset()
+        db_session.query(Evaluation).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def open_breaker(self):
+        from ai_service import llm_breaker
+        for _ in range(llm_breaker.min_calls):
+            llm_breaker.record(failed=True)
+
+    def test_last_evaluation_served(self):
+        """Test le repli sur la dernière évaluation quand le disjoncteur est ouvert"""
+        from models import Evaluation, db_session
+        self.open_breaker()
+        response = self.client.post('/create-advise', json={"advisor": 1}, headers=self.headers)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+
+        db_session.add(Evaluation(user_id=self.user_id, content="Ancienne évaluation"))
+        db_session.commit()
+        response = self.client.post('/create-advise', json={"advisor": 1}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["evaluation"], "Ancienne évaluation")
+        self.assertTrue(response.json()["stale"])
+        # Le repli ne consomme pas le quota de générations
+        from app import generation_limiter
+        for _ in range(int(generation_limiter.capacity) + 1):
+            response = self.client.post('/create-advise', json={"advisor": 1}, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+
+        health = self.client.get('/health').json()
+        self.assertEqual(health["status"], "degraded")
+        self.assertEqual(health["llm"]["circuit"]["state"], "open")
+
+class TestEvaluationCache(unittest.TestCase):
+    def setUp(self):
+        from models import User, db_session
+        from app import generation_limiter
+        generation_limiter.reset()
+        self.client = TestClient(app)
+        user = User("personauser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    def tearDown(self):
+        from models import User, Report, Evaluation, db_session
+        from app import generation_limiter
+        generation_limiter.reset()
+        for model in (Report, Evaluation):
+            db_session.query(model).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def advise(self, advisor):
+        return self.client.post('/create-advise', json={"advisor": advisor}, headers=self.headers).json()
+
+    def test_persona_switch_and_eviction(self):
+        """Test qu'un retour à un conseiller déjà consulté, sans nouveau rapport, n'appelle pas GPT"""
+        from datetime import date
+        from models import Report, Evaluation, db_session
+        generate = AsyncMock(side_effect=lambda history, advisor: f"Conseil {advisor}")
+        with patch('app.generate_evaluation', new=generate), patch('evaluations.Config.EVALUATION_CACHE_PER_USER', 2):
+            self.assertEqual(self.advise(1)["evaluation"], "Conseil 1")
+            self.assertEqual(self.advise(2)["evaluation"], "Conseil 2")
+            again = self.advise(1)
+            self.assertEqual((again["evaluation"], again["cached"]), ("Conseil 1", True))
+            self.assertEqual(generate.await_count, 2)
+
+            # Troisième conseiller : le moins récemment servi (2) est évincé
+            self.advise(3)
+            db_session.expire_all()
+            advisors = {e.advisor for e in db_session.query(Evaluation).filter_by(user_id=self.user_id)}
+            self.assertEqual(advisors, {1, 3})
+
+            # Nouveau rapport : l'historique change, l'évaluation est régénérée
+            db_session.add(Report(user_id=self.user_id, date=date.today(), answers="{}", summary="Nouveau jour"))
+            db_session.commit()
+            self.assertNotIn("cached", self.advise(1))
+            self.assertEqual(generate.await_count, 4)
+
+class TestJobs(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        from models import User, db_session
+        user = User("jobuser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+        self.headers = {
+            "Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}",
+            "Prefer": "respond-async"
+        }
+
+    async def asyncTearDown(self):
+        from jobs import job_queue
+        await job_queue.stop()
+
+    def tearDown(self):
+        from models import User, Evaluation, Job, db_session
+        db_session.query(Job).filter_by(user_id=self.user_id).delete()
+        db_session.query(Evaluation).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    async def test_create_advise_in_background(self):
+        """Test la génération d'évaluation en tâche de fond avec suivi via /jobs"""
+        transport = httpx.ASGITransport(app=app)
+        with patch('app.generate_evaluation', new=AsyncMock(return_value="Évaluation")):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post('/create-advise', json={"advisor": 1}, headers=self.headers)
+                self.assertEqual(response.status_code, 202)
+                job_url = response.headers["Location"]
+
+                for _ in range(50):
+                    job = (await client.get(job_url, headers=self.headers)).json()
+                    if job["status"] in ("done", "failed"):
+                        break
+                    await asyncio.sleep(0.02)
+
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["result"]["evaluation"], "Évaluation")
+
+    async def test_job_of_other_user_hidden(self):
+        """Test qu'une tâche inconnue ou d'un autre utilisateur renvoie 404"""
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get('/jobs/inconnu', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_purge_finished_jobs(self):
+        """Test la purge des tâches terminées anciennes, les autres étant conservées"""
+        from datetime import datetime, timedelta
+        from models import Job, db_session
+        from jobs import job_queue
+        old = datetime.utcnow() - timedelta(days=3)
+        for job_id, status, updated_at in (
+            ("purge-done", "done", old), ("purge-failed", "failed", old),
+            ("purge-recent", "done", datetime.utcnow()), ("purge-pending", "pending", old)
+        ):
+            db_session.add(Job(
+                id=job_id, user_id=self.user_id, kind="digest", status=status, payload="{}", updated_at=updated_at
+            ))
+        db_session.commit()
+
+        self.assertEqual(await job_queue.purge(), 2)
+        db_session.expire_all()
+        remaining = {job.id for job in db_session.query(Job).filter_by(user_id=self.user_id)}
+        self.assertEqual(remaining, {"purge-recent", "purge-pending"})
+
+    async def test_recovery_runs_each_job_once(self):
+        """Test la reprise par plusieurs workers : une exécution par tâche, tâches vivantes laissées à leur worker"""
+        from datetime import datetime, timedelta
+        from models import Job, db_session
+        from jobs import JobQueue
+        old = datetime.utcnow() - timedelta(hours=1)
+        for job_id, status, updated_at in (
+            ("recover-pending", "pending", old), ("recover-stale", "running", old),
+            ("recover-alive", "running", datetime.utcnow())
+        ):
+            db_session.add(Job(
+                id=job_id, user_id=self.user_id, kind="digest", status=status, payload="{}", updated_at=updated_at
+            ))
+        db_session.commit()
+
+        handler = AsyncMock(return_value={})
+        workers = [JobQueue(2, 100) for _ in range(3)]
+        for worker in workers:
+            worker.register("digest", handler)
+        try:
+            for worker in workers:
+                await worker.recover()
+        finally:
+            for worker in workers:
+                await worker.stop()
+
+        self.assertEqual(handler.await_count, 2)
+        db_session.expire_all()
+        statuses = {job.id: job.status for job in db_session.query(Job).filter_by(user_id=self.user_id)}
+        self.assertEqual(statuses, {"recover-pending": "done", "recover-stale": "done", "recover-alive": "running"})
+
 if __name__ == '__main__':
     unittest.main()
         
\ No newline at end of file
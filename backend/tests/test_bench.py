@@ -0,0 +1,65 @@
+import unittest
+import os
+import sys
+import httpx
+from openai import AsyncOpenAI, InternalServerError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench.fake_openai import FakeSettings, create_app
+from bench.loadtest import Sample, summarize, compare
+
+
+def fake_client(**settings):
+    transport = httpx.ASGITransport(app=create_app(FakeSettings(latency=0, stream_interval=0, **settings)))
+    return AsyncOpenAI(
+        api_key="bench",
+        base_url="http://fake/v1",
+        http_client=httpx.AsyncClient(transport=transport),
+        max_retries=0
+    )
+
+class TestFakeOpenAI(unittest.IsolatedAsyncioTestCase):
+    async def test_completion_and_stream(self):
+        """Test la compatibilité du faux serveur avec le SDK OpenAI"""
+        client = fake_client(tokens=5)
+        messages = [{"role": "user", "content": "Bonjour"}]
+        response = await client.chat.completions.create(model="gpt-4", messages=messages)
+        self.assertTrue(response.choices[0].message.content)
+        self.assertEqual(response.usage.completion_tokens, 5)
+
+        stream = await client.chat.completions.create(
+            model="gpt-4", messages=messages, stream=True, stream_options={"include_usage": True}
+        )
+        pieces, usage = [], None
+        async for chunk in stream:
+            if chunk.choices:
+                pieces.append(chunk.choices[0].delta.content or "")
+            usage = chunk.usage or usage
+        self.assertEqual(len([piece for piece in pieces if piece]), 5)
+        self.assertEqual(usage.completion_tokens, 5)
+
+    async def test_error_injection(self):
+        """Test les erreurs simulées"""
+        client = fake_client(error_rate=1.0)
+        with self.assertRaises(InternalServerError):
+            await client.chat.completions.create(model="gpt-4", messages=[])
+
+class TestReport(unittest.TestCase):
+    def test_summarize_and_compare(self):
+        """Test les percentiles, le débit et la détection de régression"""
+        samples = [Sample("goals", 200, i / 1000, 0) for i in range(1, 101)] + [Sample("advise", 500, 1.0, 0)]
+        results = summarize(samples, elapsed=10)
+        self.assertEqual(results["goals"]["count"], 100)
+        self.assertEqual(results["goals"]["throughput"], 10)
+        self.assertAlmostEqual(results["goals"]["p50_ms"], 50.5)
+        self.assertAlmostEqual(results["goals"]["p99_ms"], 99.01)
+        self.assertEqual(results["advise"]["error_rate"], 1)
+        self.assertEqual(results["all"]["count"], 101)
+
+        self.assertEqual(compare(results, results, 0.2), [])
+        slower = {op: {**r, "p95_ms": r["p95_ms"] * 2} for op, r in results.items()}
+        self.assertEqual(len(compare(slower, results, 0.2)), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import TTLCache, SharedStore
+
+class TestTTLCache(unittest.TestCase):
+    def test_hit_and_miss_counters(self):
+        """Test les compteurs de hits et de misses"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_lru_eviction(self):
+        """Test l'éviction de l'entrée la moins récemment utilisée"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_expiration(self):
+        """Test l'expiration bornée par le ttl de l'entrée"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        with patch('cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1, ttl=5)
+            cache.set("b", 2, ttl=-1)
+        with patch('cache.time.monotonic', return_value=106.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate(self):
+        """Test l'invalidation explicite"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set(1, "user")
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+
+class TestSharedStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        patcher = patch('cache.shared_store', SharedStore(os.path.join(self.tmpdir, 'shared.sqlite')))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Deux caches du même espace de noms : deux workers
+        self.first = TTLCache(maxsize=10, ttl=60, shared="t")
+        self.second = TTLCache(maxsize=10, ttl=60, shared="t")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hit_across_workers(self):
+        """Test qu'une entrée écrite par un worker sert les autres"""
+        self.first.set((1, "clé"), {"summary": "Résumé"})
+        self.assertEqual(self.second.get((1, "clé")), {"summary": "Résumé"})
+        self.assertEqual(self.second.stats(), {"size": 1, "hits": 1, "misses": 0})
+        self.assertIsNone(TTLCache(maxsize=10, ttl=60, shared="autre").get((1, "clé")))
+
+    def test_invalidate_and_expiration(self):
+        """Test l'invalidation commune et l'expiration des entrées partagées"""
+        self.first.set("a", 1)
+        self.first.invalidate("a")
+        self.assertIsNone(self.second.get("a"))
+
+        with patch('cache.time.time', return_value=0):
+            self.first.set("b", 2, ttl=10)
+        self.assertIsNone(self.second.get("b"))
+
+if __name__ == '__main__':
+    unittest.main()
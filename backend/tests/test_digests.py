@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+import asyncio
+from datetime import date, timedelta
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import User, Report, Digest, db_session
+from migrations import upgrade
+from digests import week_start, month_start, refresh_digests, build_history
+
+# Mercredi : semaine en cours depuis le lundi 16 mars, mois en cours depuis le 1er mars
+TODAY = date(2026, 3, 18)
+
+
+def setUpModule():
+    # Schéma à jour sur la base de test
+    upgrade()
+
+class TestDigests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        user = User("digestuser", "x")
+        db_session.add(user)
+        db_session.commit()
+        self.user_id = user.id
+
+        day = date(2026, 1, 5)
+        while day <= TODAY:
+            db_session.add(Report(user_id=self.user_id, date=day, answers="{}", summary=f"Jour {day:%m-%d}"))
+            day += timedelta(days=1)
+        db_session.commit()
+
+    def tearDown(self):
+        db_session.query(Digest).filter_by(user_id=self.user_id).delete()
+        db_session.query(Report).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def test_periods(self):
+        """Test le calcul des débuts de semaine et de mois"""
+        self.assertEqual(week_start(TODAY), date(2026, 3, 16))
+        self.assertEqual(month_start(TODAY), date(2026, 3, 1))
+
+    @patch('digests.generate_digest', new_callable=AsyncMock, return_value="Bilan")
+    async def test_refresh_is_incremental(self, mock_digest):
+        """Test la construction des résumés manquants, une seule fois"""
+        built = await refresh_digests(self.user_id, today=TODAY)
+        self.assertEqual(built, {"weeks": 10, "months": 2})
+        self.assertEqual(mock_digest.call_count, 12)
+
+        built = await refresh_digests(self.user_id, today=TODAY)
+        self.assertEqual(built, {"weeks": 0, "months": 0})
+
+        # La semaine suivante, seule la semaine du 16 mars est à résumer
+        built = await refresh_digests(self.user_id, today=TODAY + timedelta(days=7))
+        self.assertEqual(built, {"weeks": 1, "months": 0})
+
+    @patch('digests.generate_digest', new_callable=AsyncMock, return_value="Bilan")
+    async def test_concurrent_refreshes_coalesce(self, mock_digest):
+        """Test que des constructions simultanées pour un utilisateur ne paient chaque période qu'une fois"""
+        results = await asyncio.gather(*[refresh_digests(self.user_id, today=TODAY) for _ in range(3)])
+        self.assertEqual(results, [{"weeks": 10, "months": 2}] * 3)
+        self.assertEqual(mock_digest.call_count, 12)
+
+    @patch('digests.generate_digest', new_callable=AsyncMock, return_value="Bilan")
+    async def test_existing_period_skipped(self, mock_digest):
+        """Test qu'une période déjà résumée (par un autre worker) n'est pas regénérée"""
+        from digests import save_digest
+        self.assertTrue(await save_digest(self.user_id, 'week', date(2026, 1, 5), ["Jour"]))
+        self.assertFalse(await save_digest(self.user_id, 'week', date(2026, 1, 5), ["Jour"]))
+        self.assertEqual(mock_digest.call_count, 1)
+
+    @patch('digests.generate_digest', new_callable=AsyncMock, return_value="Bilan")
+    async def test_history_is_bounded(self, mock_digest):
+        """Test que l'historique combine mois, semaines et jours sans recouvrement"""
+        await refresh_digests(self.user_id, today=TODAY)
+        history = await build_history(self.user_id, today=TODAY)
+
+        self.assertEqual(history[:2], ["Mois de 2026-01 : Bilan", "Mois de 2026-02 : Bilan"])
+        self.assertEqual(history[2:4], ["Semaine du 2026-03-02 : Bilan", "Semaine du 2026-03-09 : Bilan"])
+        self.assertEqual(len(history), 7)
+        self.assertTrue(history[4].startswith("Jour 03-16"))
+
+    @patch('digests.generate_digest', new_callable=AsyncMock, return_value="Bilan")
+    async def test_backfill_stops_at_history_window(self, mock_digest):
+        """Test qu'un long journal ne résume que les périodes que build_history peut lire"""
+        day = date(2024, 3, 1)
+        while day < date(2026, 1, 5):
+            db_session.add(Report(user_id=self.user_id, date=day, answers="{}", summary=f"Jour {day:%m-%d}"))
+            day += timedelta(days=1)
+        db_session.commit()
+
+        with patch('digests.Config.DIGEST_MONTHS', 6):
+            built = await refresh_digests(self.user_id, today=TODAY)
+            history = await build_history(self.user_id, today=TODAY)
+        # Semaines du lundi 1er septembre 2025 au 9 mars 2026, mois de septembre à février
+        self.assertEqual(built, {"weeks": 28, "months": 6})
+        self.assertEqual(mock_digest.call_count, 34)
+        self.assertEqual(history[0], "Mois de 2025-09 : Bilan")
+        self.assertEqual(len(history), 11)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import shutil
+import tempfile
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engines import build_engine, engine_options
+import models
+
+
+class TestEngineFactory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.url = f"sqlite:///{os.path.join(self.tmpdir, 'engines.sqlite')}"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_sqlite_pragmas(self):
+        """Test les pragmas SQLite appliqués à chaque connexion"""
+        engine = build_engine(self.url, 'test-sqlite')
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+            self.assertEqual(conn.execute(text("PRAGMA synchronous")).scalar(), 1)  # NORMAL
+            self.assertEqual(conn.execute(text("PRAGMA busy_timeout")).scalar(), 5000)
+        engine.dispose()
+
+    def test_async_sqlite_pragmas(self):
+        """Test les pragmas côté aiosqlite, sans pool"""
+        import asyncio
+        engine = build_engine('sqlite+aiosqlite' + self.url[len('sqlite'):], 'test-aiosqlite', is_async=True)
+
+        async def check():
+            async with engine.connect() as conn:
+                return (await conn.execute(text("PRAGMA synchronous"))).scalar()
+
+        self.assertEqual(asyncio.run(check()), 1)
+        self.assertTrue(issubclass(engine.sync_engine.pool.__class__, NullPool))
+        asyncio.run(engine.dispose())
+
+    def test_dialect_options(self):
+        """Test le pool et les réglages choisis par dialecte"""
+        memory = engine_options(make_url('sqlite://'), is_async=False)
+        self.assertIs(memory['poolclass'], StaticPool)
+
+        sync_pg = engine_options(make_url('postgresql://u@db/app'), is_async=False)
+        self.assertTrue(sync_pg['pool_pre_ping'])
+        self.assertEqual(sync_pg['pool_size'], 5)
+        self.assertEqual(sync_pg['connect_args'], {'options': '-c statement_timeout=30000'})
+
+        async_pg = engine_options(make_url('postgresql+asyncpg://u@db/app'), is_async=True)
+        self.assertEqual(async_pg['connect_args'], {'server_settings': {'statement_timeout': '30000'}})
+
+class FakeRequest:
+    def __init__(self, method, token="t"):
+        self.method = method
+        self.headers = {"authorization": f"Bearer {token}"}
+
+class TestReplicaRouting(unittest.TestCase):
+    def tearDown(self):
+        models.recent_writers.clear()
+
+    def test_without_replica(self):
+        """Test que tout reste sur le primaire sans réplique"""
+        self.assertFalse(models.reads_from_replica(FakeRequest("GET")))
+
+    @patch('models.Config.DATABASE_REPLICA_URI', 'postgresql://replica/app')
+    def test_reads_follow_writes(self):
+        """Test les GET sur la réplique, sauf juste après une écriture du même utilisateur"""
+        self.assertTrue(models.reads_from_replica(FakeRequest("GET", "a")))
+        self.assertFalse(models.reads_from_replica(FakeRequest("POST", "a")))
+        self.assertFalse(models.reads_from_replica(FakeRequest("GET", "a")))
+        self.assertTrue(models.reads_from_replica(FakeRequest("GET", "b")))
+
+    @patch('models.Config.DATABASE_REPLICA_URI', 'postgresql://replica/app')
+    def test_stickiness_shared_across_workers(self):
+        """Test qu'un GET servi par un autre worker que le POST lit aussi le primaire"""
+        from cache import TTLCache, SharedStore
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with patch('cache.shared_store', SharedStore(os.path.join(tmpdir, 'shared.sqlite'))):
+            workers = [TTLCache(maxsize=10, ttl=5, shared="writer") for _ in range(2)]
+            with patch('models.recent_writers', workers[0]):
+                self.assertFalse(models.reads_from_replica(FakeRequest("POST", "a")))
+            with patch('models.recent_writers', workers[1]):
+                self.assertFalse(models.reads_from_replica(FakeRequest("GET", "a")))
+                self.assertTrue(models.reads_from_replica(FakeRequest("GET", "b")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from datetime import date
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, select, text, tuple_
+from models import Report, Goal, Evaluation
+from migrations import upgrade, MIGRATIONS
+
+LEGACY_DB = os.path.join(os.path.dirname(__file__), '..', 'instance', 'database.sqlite')
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        """Copie d'une base créée par l'ancien schéma SQL brut"""
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'legacy.sqlite')
+        shutil.copy(LEGACY_DB, path)
+        self.engine = create_engine(f'sqlite:///{path}')
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO reports (user_id, date, answers, summary) "
+                "VALUES (1, '2026-10-18 00:00:00.000000', '{}', 'Écrit par l''ORM DateTime')"
+            ))
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def plan(self, statement):
+        compiled = statement.compile(self.engine, compile_kwargs={"literal_binds": True})
+        with self.engine.connect() as conn:
+            return " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+
+    def test_upgrade_is_idempotent(self):
+        """Test l'application unique de chaque migration"""
+        self.assertEqual(upgrade(self.engine), [m[0] for m in MIGRATIONS])
+        self.assertEqual(upgrade(self.engine), [])
+
+    def test_fresh_schema_never_reuses_ids(self):
+        """Test qu'une base neuve, comme l'ancien schéma, ne réattribue pas l'id d'un rapport supprimé"""
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir, 'fresh.sqlite')}")
+        upgrade(engine)
+        with engine.begin() as conn:
+            for table in ('users', 'reports', 'evaluations', 'goals'):
+                ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = :t"), {"t": table}).scalar()
+                self.assertIn("AUTOINCREMENT", ddl)
+            conn.execute(text("INSERT INTO users (username, password_hash) VALUES ('u', 'x')"))
+            insert = text("INSERT INTO reports (user_id, date, answers, summary, version) VALUES (1, '2026-10-18', '{}', 's', 1)")
+            first = conn.execute(insert).lastrowid
+            conn.execute(text("DELETE FROM reports WHERE id = :id"), {"id": first})
+            self.assertGreater(conn.execute(insert).lastrowid, first)
+        engine.dispose()
+
+    def test_report_vectors_follow_their_report(self):
+        """Test la purge des vecteurs orphelins et la suppression du vecteur avec son rapport"""
+        upgrade(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM schema_version WHERE version = 11"))
+            conn.execute(text("DROP TRIGGER reports_vectors_delete"))
+            report_id = conn.execute(text("SELECT MAX(id) FROM reports")).scalar()
+            for vector_id in (report_id, report_id + 1000):
+                conn.execute(text("INSERT INTO report_vectors (report_id, user_id, vector) VALUES (:id, 1, x'00')"),
+                             {"id": vector_id})
+        self.assertEqual(upgrade(self.engine), [11])
+        with self.engine.begin() as conn:
+            self.assertEqual(conn.execute(text("SELECT report_id FROM report_vectors")).scalars().all(), [report_id])
+            conn.execute(text("DELETE FROM reports WHERE id = :id"), {"id": report_id})
+            self.assertEqual(conn.execute(text("SELECT count(*) FROM report_vectors")).scalar(), 0)
+
+    def test_dates_unified(self):
+        """Test la normalisation des dates en 'YYYY-MM-DD'"""
+        upgrade(self.engine)
+        with self.engine.connect() as conn:
+            lengths = conn.execute(text("SELECT DISTINCT length(date) FROM reports")).scalars().all()
+            self.assertEqual(lengths, [10])
+            found = conn.execute(select(Report.id).filter_by(user_id=1, date=date(2026, 10, 18))).all()
+            self.assertEqual(len(found), 1)
+
+    def test_query_plans_use_indexes(self):
+        """Test que les requêtes des routes deviennent des recherches par index"""
+        upgrade(self.engine)
+        today = date(2026, 10, 18)
+
+        self.assertIn("USING INDEX ix_reports_user_date (user_id=? AND date=?)",
+                      self.plan(select(Report).filter_by(user_id=1, date=today)))
+        self.assertIn("USING INDEX ix_reports_user_date (user_id=? AND date>?)",
+                      self.plan(select(Report).filter(Report.user_id == 1, Report.date > today)))
+        self.assertIn("USING INDEX ix_goals_user_status (user_id=? AND status=?)",
+                      self.plan(select(Goal).filter_by(user_id=1, status='active')))
+        self.assertIn("USING INDEX ix_evaluations_user_advisor (user_id=?)",
+                      self.plan(select(Evaluation).filter_by(user_id=1)))
+        self.assertIn("USING INDEX ix_evaluations_user_advisor (user_id=? AND advisor=?)",
+                      self.plan(select(Evaluation).filter_by(user_id=1, advisor=2, fingerprint="f")))
+
+        # Page suivante de /reports : recherche par index, sans tri temporaire
+        page = self.plan(select(Report.id, Report.date, Report.summary)
+                         .filter(Report.user_id == 1, tuple_(Report.date, Report.id) < tuple_(today, 10))
+                         .order_by(Report.date.desc(), Report.id.desc()).limit(21))
+        self.assertIn("USING INDEX ix_reports_user_date (user_id=? AND date<?)", page)
+        self.assertNotIn("TEMP B-TREE", page)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from passlib.context import CryptContext
+import passwords
+from passwords import hash_password, verify_and_update, PasswordHashingBusy
+
+class TestPasswords(unittest.IsolatedAsyncioTestCase):
+    async def test_hash_and_verify(self):
+        """Test le hachage puis la vérification dans le pool dédié"""
+        hashed = await hash_password("secret")
+        valid, new_hash = await verify_and_update("secret", hashed)
+        self.assertTrue(valid)
+        self.assertIsNone(new_hash)
+
+        valid, _ = await verify_and_update("mauvais", hashed)
+        self.assertFalse(valid)
+
+    async def test_rehash_when_cost_changes(self):
+        """Test le ré-hachage transparent quand le coût bcrypt change"""
+        old_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+        old_hash = old_context.hash("secret")
+
+        valid, new_hash = await verify_and_update("secret", old_hash)
+        self.assertTrue(valid)
+        self.assertIsNotNone(new_hash)
+        self.assertNotEqual(old_hash.split('$')[2], new_hash.split('$')[2])
+
+    async def test_overload_rejected(self):
+        """Test le rejet quand la file d'attente est pleine"""
+        with patch('passwords.Config.PASSWORD_HASH_MAX_PENDING', 0):
+            with self.assertRaises(PasswordHashingBusy):
+                await hash_password("secret")
+        self.assertEqual(passwords.pending(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
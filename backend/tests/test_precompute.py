@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+from datetime import date, datetime, time
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, create_access_token
+from migrations import upgrade
+import precompute
+
+
+def setUpModule():
+    upgrade()
+
+class TestPrecompute(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        from models import User, Report, Evaluation, db_session
+        self.user_ids = []
+        for name in ("nightowl1", "nightowl2"):
+            user = User(name, "x")
+            db_session.add(user)
+            db_session.flush()
+            db_session.add(Evaluation(user_id=user.id, content="Ancienne", advisor=2, last_report_id=0))
+            db_session.add(Evaluation(
+                user_id=user.id, content="Plus ancienne", advisor=1, last_report_id=0,
+                last_used_at=datetime(2020, 1, 1)
+            ))
+            db_session.add(Report(user_id=user.id, date=date.today(), answers="{}", summary="Journée"))
+            self.user_ids.append(user.id)
+        db_session.commit()
+
+    def tearDown(self):
+        from models import User, Report, Evaluation, PrecomputeRun, db_session
+        for model in (Report, Evaluation):
+            db_session.query(model).filter(model.user_id.in_(self.user_ids)).delete()
+        db_session.query(User).filter(User.id.in_(self.user_ids)).delete()
+        db_session.query(PrecomputeRun).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def evaluations(self):
+        from models import Evaluation, db_session
+        db_session.expire_all()
+        return {
+            e.user_id: e for e in db_session.query(Evaluation).filter(Evaluation.user_id.in_(self.user_ids))
+        }
+
+    def test_window(self):
+        """Test la fenêtre horaire, y compris à cheval sur minuit"""
+        self.assertTrue(precompute.in_window(time(2, 0), "01:00-06:00"))
+        self.assertFalse(precompute.in_window(time(6, 0), "01:00-06:00"))
+        self.assertTrue(precompute.in_window(time(23, 30), "22:00-05:00"))
+        self.assertFalse(precompute.in_window(time(12, 0), "22:00-05:00"))
+
+    @patch('precompute.generate_evaluation', new_callable=AsyncMock, return_value="Bilan de la nuit")
+    async def test_resume_after_interruption(self, mock_generate):
+        """Test la reprise au point de contrôle après une passe interrompue en fin de fenêtre"""
+        # La fenêtre se ferme après le premier lot d'un utilisateur
+        clock = iter([datetime(2026, 1, 1, 2), datetime(2026, 1, 1, 7)])
+        first = await precompute.run(batch_size=1, clock=lambda: next(clock))
+        self.assertEqual((first["processed"], first["finished"]), (1, False))
+        self.assertEqual(self.evaluations()[self.user_ids[0]].source, 'precomputed')
+        self.assertEqual(self.evaluations()[self.user_ids[1]].source, 'live')
+
+        second = await precompute.run(batch_size=1, force=True)
+        self.assertEqual(second["run"], first["run"])
+        self.assertTrue(second["finished"])
+        evaluation = self.evaluations()[self.user_ids[1]]
+        self.assertEqual((evaluation.source, evaluation.advisor, evaluation.content), ('precomputed', 2, "Bilan de la nuit"))
+        # Les utilisateurs déjà à jour ne sont plus candidats
+        self.assertEqual(await precompute.candidates(0, 10), [])
+
+    @patch('precompute.generate_evaluation', new_callable=AsyncMock, return_value="Bilan de la nuit")
+    async def test_create_advise_serves_fresh_result(self, mock_generate):
+        """Test que /create-advise répond avec l'évaluation précalculée tant qu'aucun rapport n'est arrivé"""
+        await precompute.run(force=True)
+        user_id = self.user_ids[0]
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+        transport = httpx.ASGITransport(app=app)
+        with patch('app.generate_evaluation', new_callable=AsyncMock, return_value="Bilan du soir") as live:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post('/create-advise', json={"advisor": 2}, headers=headers)
+                self.assertEqual(response.json(), {
+                    "message": "Evaluation created successfully",
+                    "evaluation": "Bilan de la nuit",
+                    "cached": True,
+                    "precomputed": True
+                })
+                live.assert_not_called()
+
+                # Autre conseiller : génération à la demande
+                response = await client.post('/create-advise', json={"advisor": 1}, headers=headers)
+                self.assertEqual(response.json()["evaluation"], "Bilan du soir")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ratelimit import ConcurrencyLimiter, TokenBucketLimiter, LLMBusy, RateLimited
+
+
+class TestConcurrencyLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_bounded_queue(self):
+        """Test les places limitées, la file FIFO bornée et le rejet au-delà"""
+        limiter = ConcurrencyLimiter(limit=1, max_waiting=1, timeout=1, retry_after=3)
+        order = []
+
+        async def call(name):
+            async with limiter.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await limiter.acquire()
+        waiter = asyncio.create_task(call("b"))
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.waiting(), 1)
+        with self.assertRaises(LLMBusy) as ctx:
+            await limiter.acquire()
+        self.assertEqual(ctx.exception.retry_after, 3)
+
+        limiter.release()
+        await waiter
+        self.assertEqual(order, ["b"])
+        self.assertEqual((limiter.in_flight(), limiter.waiting()), (0, 0))
+
+    async def test_wait_timeout(self):
+        """Test le rejet d'une attente trop longue sans perte de place"""
+        limiter = ConcurrencyLimiter(limit=1, max_waiting=5, timeout=0.01, retry_after=1)
+        await limiter.acquire()
+        with self.assertRaises(LLMBusy):
+            await limiter.acquire()
+        self.assertEqual(limiter.waiting(), 0)
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), 0.1)
+        self.assertEqual(limiter.in_flight(), 1)
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_refill(self):
+        """Test la rafale autorisée, le délai annoncé puis la recharge"""
+        limiter = TokenBucketLimiter(capacity=2, rate=0.5)
+        with patch('ratelimit.time.monotonic', return_value=100.0):
+            limiter.consume("a")
+            limiter.consume("a")
+            with self.assertRaises(RateLimited) as ctx:
+                limiter.consume("a")
+            limiter.consume("b")  # seaux indépendants par utilisateur
+        self.assertEqual(ctx.exception.retry_after, 2)
+        with patch('ratelimit.time.monotonic', return_value=102.0):
+            limiter.consume("a")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from resilience import CircuitBreaker, CircuitOpen, backoff_delays
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('resilience.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_ratio=0.5, min_calls=4, window=60, cooldown=30)
+
+    def test_opens_on_failure_ratio(self):
+        """Test l'ouverture au-delà du taux d'échec, une fois assez d'appels observés"""
+        for failed in (True, True, False):
+            self.breaker.record(failed)
+        self.breaker.check()  # trois appels : pas encore d'avis
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, "open")
+        with self.assertRaises(CircuitOpen) as ctx:
+            self.breaker.check()
+        self.assertEqual(ctx.exception.retry_after, 30)
+
+    def test_old_failures_expire(self):
+        """Test que seuls les appels de la fenêtre comptent"""
+        for _ in range(3):
+            self.breaker.record(True)
+        self.now += 61
+        for _ in range(4):
+            self.breaker.record(False)
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_half_open_trial(self):
+        """Test l'appel d'essai unique après la pause, puis la fermeture ou la réouverture"""
+        for _ in range(4):
+            self.breaker.record(True)
+        self.now += 31
+        self.breaker.fail_fast()
+        self.breaker.check()
+        self.assertEqual(self.breaker.state, "half_open")
+        with self.assertRaises(CircuitOpen):
+            self.breaker.check()  # un seul essai à la fois
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, "open")
+
+        self.now += 31
+        self.breaker.check()
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.snapshot()["state"], "closed")
+
+class TestBackoff(unittest.TestCase):
+    def test_capped_jitter(self):
+        """Test les délais exponentiels plafonnés"""
+        with patch('resilience.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual(list(backoff_delays(4, 0.5, 2)), [0.5, 1, 2, 2])
+
+if __name__ == '__main__':
+    unittest.main()
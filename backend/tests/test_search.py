@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+import json
+from datetime import date, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, create_access_token, insert_report
+from migrations import upgrade
+from search import stem, query_terms, highlight
+
+DAYS = [
+    ("Réunion interminable au bureau, dossier urgent", "Très fatiguée en rentrant"),
+    ("Randonnée en montagne sous le soleil", "Les jambes fatiguées mais heureux"),
+    ("Soirée cinéma avec des amis", "Beaucoup rire"),
+]
+
+
+def setUpModule():
+    upgrade()
+
+class TestStemming(unittest.TestCase):
+    def test_inflections_share_a_stem(self):
+        """Test la racinisation : genre, nombre, accents et terminaisons verbales ramenés à une racine"""
+        self.assertEqual({stem(word) for word in ("fatigue", "fatiguée", "Fatigués")}, {"fatigu"})
+        self.assertEqual(stem("marcher"), stem("marché"))
+        self.assertEqual(stem("réunions"), stem("reunion"))
+        self.assertEqual(query_terms("Une journée de fatigue, la fatigue"), ["journ", "fatigu"])
+
+    def test_highlight_escapes_html(self):
+        """Test l'extrait : termes surlignés, reste du texte échappé"""
+        snippet = highlight("Dossier <b>urgent</b> & fatigue", query_terms("urgences"))
+        self.assertEqual(snippet, "Dossier &lt;b&gt;<mark>urgent</mark>&lt;/b&gt; &amp; fatigue")
+
+    def test_highlight_matches_whole_stems(self):
+        """Test l'extrait : une racine ne surligne pas les mots qui commencent seulement par elle"""
+        self.assertEqual(highlight("Merci, la mer mercredi", query_terms("mer")), "Merci, la <mark>mer</mark> mercredi")
+
+class TestSearch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        from models import User, Report, db_session
+        self.user_ids = []
+        for username in ("searchuser", "othersearchuser"):
+            user = User(username, "x")
+            db_session.add(user)
+            db_session.flush()
+            self.user_ids.append(user.id)
+        # Historique antérieur à l'index : indexé à la première recherche
+        for user_id in self.user_ids:
+            for offset, (summary, mood) in enumerate(DAYS[:2]):
+                db_session.add(Report(
+                    user_id=user_id, date=date.today() - timedelta(days=10 - offset),
+                    answers=json.dumps({"mood": mood}), summary=summary
+                ))
+        db_session.commit()
+        self.client = TestClient(app)
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(self.user_ids[0])})}"}
+
+    def tearDown(self):
+        from models import User, Report, ReportVector, MoodSeries, db_session
+        for user_id in self.user_ids:
+            for model in (ReportVector, MoodSeries, Report):
+                db_session.query(model).filter_by(user_id=user_id).delete()
+            db_session.query(User).filter_by(id=user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    def indexed(self):
+        from models import db_session
+        return db_session.execute(
+            text("SELECT count(*) FROM report_search WHERE report_search MATCH :owner"),
+            {"owner": f"owner:u{self.user_ids[0]}"}
+        ).scalar()
+
+    @patch('app.schedule_digest_refresh', new_callable=AsyncMock)
+    async def test_search_answers_and_summaries(self, mock_refresh):
+        """Test la recherche : formes fléchies, réponses et résumés, rapports de l'utilisateur seulement"""
+        response = self.client.get('/search', params={"q": "fatigue"}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        items = response.json()["items"]
+        self.assertEqual(len(items), 2)
+        self.assertEqual(
+            sorted(item["snippet"].split("<mark>")[1].split("</mark>")[0] for item in items), ["fatiguée", "fatiguées"]
+        )
+        self.assertEqual(self.indexed(), 2)
+
+        items = self.client.get('/search', params={"q": "bureau urgence"}, headers=self.headers).json()["items"]
+        self.assertEqual([item["date"] for item in items], [(date.today() - timedelta(days=10)).isoformat()])
+        self.assertEqual(self.client.get('/search', params={"q": "dans les"}, headers=self.headers).json()["items"], [])
+
+        # Rapport soumis : indexé dans la même transaction
+        await insert_report(self.user_ids[0], date.today(), {"mood": "Heureux", "q1": "", "q2": "", "q3": ""}, DAYS[2][0])
+        self.assertEqual(self.indexed(), 3)
+        items = self.client.get('/search', params={"q": "cinéma"}, headers=self.headers).json()["items"]
+        self.assertEqual([item["date"] for item in items], [date.today().isoformat()])
+
+    @patch('app.schedule_digest_refresh', new_callable=AsyncMock)
+    async def test_search_matches_whole_stems(self, mock_refresh):
+        """Test la recherche : un terme ne trouve pas les mots qui commencent seulement par sa racine"""
+        await insert_report(self.user_ids[0], date.today(), {"mood": "Merci", "q1": "", "q2": "", "q3": ""},
+                            "Mercredi au château")
+        for query in ("mer", "chat"):
+            self.assertEqual(self.client.get('/search', params={"q": query}, headers=self.headers).json()["items"], [])
+        items = self.client.get('/search', params={"q": "mercredi"}, headers=self.headers).json()["items"]
+        self.assertEqual([item["date"] for item in items], [date.today().isoformat()])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+import json
+from datetime import date, timedelta
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app, create_access_token, insert_report
+from migrations import upgrade
+from similarity import UserIndex, embed, embed_report, tokens, indexes, load_index, record_report
+
+DAYS = [
+    "Longue randonnée en montagne sous le soleil, les jambes fatiguées mais heureux",
+    "Réunion interminable au bureau, dossier urgent et migraine le soir",
+    "Soirée cinéma avec des amis puis pizza, beaucoup rire",
+    "Randonnée en forêt le matin, pique-nique au bord du lac, soleil",
+]
+
+
+def setUpModule():
+    upgrade()
+
+class TestEmbedding(unittest.TestCase):
+    def test_tokens_and_vector(self):
+        """Test la vectorisation : mots vides ignorés, vecteur float32 déterministe"""
+        self.assertEqual(tokens("Une journée à la montagne avec des amis"), ["journée", "montagne", "amis"])
+        vector = embed("montagne montagne soleil", 64)
+        self.assertEqual(vector.dtype, np.float32)
+        self.assertEqual(np.count_nonzero(vector), 2)
+        np.testing.assert_array_equal(vector, embed("soleil montagne montagne", 64))
+
+    def test_normalization_is_cached(self):
+        """Test le top-k sur plusieurs milliers de rapports, la matrice normalisée n'étant recalculée qu'après un ajout"""
+        rng = np.random.default_rng(0)
+        index = UserIndex(512)
+        vectors = rng.random((5000, 512), dtype=np.float32) * (rng.random((5000, 512)) < 0.05)
+        index.append(np.arange(1, 4001), vectors[:4000])
+        index.search(vectors[0], 10)
+        unit = index._unit
+        self.assertEqual(index.search(vectors[42], 10)[0][0], 43)
+        self.assertIs(index._unit, unit)
+
+        index.append(np.arange(1, 5001), vectors)
+        self.assertEqual(index.search(vectors[4242], 10)[0][0], 4243)
+        self.assertIsNot(index._unit, unit)
+        self.assertEqual(index._unit.shape, (5000, 512))
+
+
+class TestSimilarDays(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        from models import User, Report, db_session
+        user = User("similaruser", "x")
+        db_session.add(user)
+        db_session.flush()
+        # Historique antérieur à l'index : vectorisé à la première recherche
+        for offset, summary in enumerate(DAYS[:3]):
+            db_session.add(Report(
+                user_id=user.id, date=date.today() - timedelta(days=10 - offset),
+                answers=json.dumps({"mood": "Heureux"}), summary=summary
+            ))
+        db_session.commit()
+        self.user_id = user.id
+        self.client = TestClient(app)
+        self.headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    def tearDown(self):
+        from models import User, Report, ReportVector, MoodSeries, db_session
+        indexes.clear()
+        for model in (ReportVector, MoodSeries, Report):
+            db_session.query(model).filter_by(user_id=self.user_id).delete()
+        db_session.query(User).filter_by(id=self.user_id).delete()
+        db_session.commit()
+        db_session.remove()
+
+    @patch('app.schedule_digest_refresh', new_callable=AsyncMock)
+    async def test_days_like_today(self, mock_refresh):
+        """Test les jours proches du rapport du jour, l'index étant complété à la soumission"""
+        from models import ReportVector, db_session
+        response = self.client.get('/reports/similar', params={"q": "bureau urgent"}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["items"][0]["summary"], DAYS[1])
+        self.assertEqual(db_session.query(ReportVector).filter_by(user_id=self.user_id).count(), 3)
+
+        response = self.client.get('/reports/similar', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+        await insert_report(self.user_id, date.today(), {"mood": "Heureux", "q1": "", "q2": "", "q3": ""}, DAYS[3])
+        self.assertEqual(db_session.query(ReportVector).filter_by(user_id=self.user_id).count(), 4)
+        items = self.client.get('/reports/similar', params={"k": 2}, headers=self.headers).json()["items"]
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[0]["summary"], DAYS[0])
+        self.assertGreater(items[0]["score"], items[1]["score"])
+
+    async def test_record_report_is_idempotent(self):
+        """Test l'enregistrement répété du vecteur d'un rapport : remplacé, jamais dupliqué"""
+        from models import Report, ReportVector, AsyncSessionLocal, db_session
+        async with AsyncSessionLocal() as db:
+            report = (await db.execute(select(Report).filter_by(user_id=self.user_id))).scalars().first()
+            await record_report(db, report)
+            await db.commit()
+            report.summary = DAYS[3]
+            await record_report(db, report)
+            await db.commit()
+        rows = db_session.query(ReportVector).filter_by(user_id=self.user_id).all()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].vector, embed(DAYS[3] + "\nHeureux").tobytes())
+
+    async def test_index_follows_deletes(self):
+        """Test la matrice en mémoire après suppression d'un rapport puis insertion sous un id antérieur"""
+        from models import Report, AsyncSessionLocal, db_session
+
+        async def loaded():
+            async with AsyncSessionLocal() as db:
+                index = await load_index(db, self.user_id)
+                await db.commit()
+            return index
+
+        ids = [int(i) for i in (await loaded()).ids]
+        self.assertEqual(len(ids), 3)
+        db_session.query(Report).filter_by(id=ids[1]).delete()
+        db_session.commit()
+        self.assertEqual(list((await loaded()).ids), [ids[0], ids[2]])
+
+        # Id réattribué (base créée sans AUTOINCREMENT) : la matrice est reconstruite
+        answers = json.dumps({"mood": "Heureux"})
+        db_session.add(Report(id=ids[1], user_id=self.user_id, date=date.today(), answers=answers, summary=DAYS[3]))
+        db_session.commit()
+        index = await loaded()
+        self.assertEqual(list(index.ids), ids)
+        np.testing.assert_array_equal(index.vector(ids[1]), embed_report(DAYS[3], answers))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import codecs
+import csv
+import io
+import json
+from datetime import date
+from sqlalchemy import select, insert
+from models import Report, Evaluation, Goal, ReplicaSessionLocal
+from config import Config
+
+# Export / import du journal d'un utilisateur : un enregistrement par ligne, toutes tables confondues.
+# Les id exportés sont informatifs : l'import attribue de nouveaux identifiants.
+
+TABLES = {
+    "report": (Report.__table__, ("id", "date", "answers", "summary")),
+    "evaluation": (Evaluation.__table__, ("id", "date", "content")),
+    "goal": (Goal.__table__, ("id", "title", "status")),
+}
+CSV_COLUMNS = ["type", "id", "date", "title", "status", "answers", "summary", "content"]
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+class InvalidRecord(ValueError):
+    def __init__(self, line: int, reason: str):
+        super().__init__(f"Line {line}: {reason}")
+
+
+def to_record(kind: str, row) -> dict:
+    record = {"type": kind}
+    for name, value in row._mapping.items():
+        record[name] = value.isoformat() if isinstance(value, date) else value
+    return record
+
+def format_rows(fmt: str, kind: str, rows) -> str:
+    records = [to_record(kind, row) for row in rows]
+    if fmt == "ndjson":
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, CSV_COLUMNS, lineterminator="\n").writerows(records)
+    return buffer.getvalue()
+
+async def export_records(user_id: int, fmt: str):
+    """Produit l'export par paquets de EXPORT_CHUNK_SIZE lignes lues via un curseur côté serveur"""
+    if fmt == "csv":
+        yield ",".join(CSV_COLUMNS) + "\n"
+    # Session propre au flux (celle de la requête est fermée avant l'envoi du corps), sur la réplique si présente
+    async with ReplicaSessionLocal() as db:
+        for kind, (table, columns) in TABLES.items():
+            result = await db.stream(
+                select(*[table.c[name] for name in columns])
+                .where(table.c.user_id == user_id)
+                .order_by(table.c.id)
+                .execution_options(yield_per=Config.EXPORT_CHUNK_SIZE)
+            )
+            async for rows in result.partitions():
+                yield format_rows(fmt, kind, rows)
+
+
+async def read_lines(chunks):
+    # Découpe le corps reçu morceau par morceau, sans le charger entièrement
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def parse_records(fmt: str, lines):
+    number = 0
+    if fmt == "ndjson":
+        async for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise InvalidRecord(number, "invalid JSON")
+            if not isinstance(record, dict):
+                raise InvalidRecord(number, "expected an object")
+            yield number, record
+        return
+
+    header, pending = None, []
+    async for line in lines:
+        number += 1
+        pending.append(line)
+        text = "\n".join(pending)
+        # Nombre impair de guillemets : champ entre guillemets qui continue sur la ligne suivante
+        if text.count('"') % 2:
+            continue
+        pending = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = values
+            continue
+        yield number, dict(zip(header, values))
+    if pending:
+        raise InvalidRecord(number, "unterminated quoted field")
+
+def to_values(user_id: int, line: int, record: dict):
+    kind = record.get("type")
+    if kind not in TABLES:
+        raise InvalidRecord(line, f"unknown type {kind!r}")
+    table, columns = TABLES[kind]
+    values = {"user_id": user_id, "version": 1}
+    for name in columns[1:]:
+        value = record.get(name)
+        if value in (None, ""):
+            column = table.c[name]
+            if column.default is not None and column.default.is_scalar:
+                value = column.default.arg
+            elif not column.nullable:
+                raise InvalidRecord(line, f"missing {name}")
+            else:
+                value = None
+        elif name == "date":
+            try:
+                value = date.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise InvalidRecord(line, f"invalid date {value!r}")
+        elif isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        values[name] = value
+    return kind, values
+
+async def import_records(db, user_id: int, fmt: str, chunks) -> dict:
+    """Insère les enregistrements par lots (executemany) ; la validation et le commit restent à l'appelant"""
+    batches = {kind: [] for kind in TABLES}
+    counts = {kind: 0 for kind in TABLES}
+
+    async def flush(kind):
+        if batches[kind]:
+            await db.execute(insert(TABLES[kind][0]), batches[kind])
+            counts[kind] += len(batches[kind])
+            batches[kind] = []
+
+    async for line, record in parse_records(fmt, read_lines(chunks)):
+        kind, values = to_values(user_id, line, record)
+        batches[kind].append(values)
+        if len(batches[kind]) >= Config.IMPORT_BATCH_SIZE:
+            await flush(kind)
+    for kind in TABLES:
+        await flush(kind)
+    return counts
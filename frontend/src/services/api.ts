@@ -125,6 +125,30 @@ export const deleteObjective = async (id: string): Promise<void> => {
   }
 };
 
+export type GoalBatchOperation =
+  | { op: 'create'; title: string; status?: string }
+  | { op: 'update'; id: number; title?: string; status?: string }
+  | { op: 'delete'; id: number };
+
+export interface GoalBatchResult {
+  op: GoalBatchOperation['op'];
+  status: 'created' | 'updated' | 'deleted' | 'error';
+  goal?: Objective;
+  id?: number;
+  detail?: string;
+}
+
+// Plusieurs créations / modifications / suppressions en une seule requête et une seule transaction
+export const batchObjectives = async (operations: GoalBatchOperation[]): Promise<GoalBatchResult[]> => {
+  try {
+    const { data } = await api.post<{ results: GoalBatchResult[] }>('/goals/batch', { operations });
+    return data.results;
+  } catch (error) {
+    console.error('Erreur lors de la mise à jour groupée des objectifs', error);
+    throw error;
+  }
+};
+
 
 export const submitReport = async (answers: Omit<DailyAnswers, 'perso'>): Promise<Report> => {
   const { data } = await api.post<Report>('/submit-report', { 
@@ -145,6 +169,63 @@ export const getTodayReport = async (): Promise<Report | null> => {
   return data;
 };
 
+export interface ReportHistoryItem {
+  id: number;
+  date: string;
+  summary?: string;
+  answers?: DailyAnswers;
+}
+
+export interface ReportHistoryPage {
+  items: ReportHistoryItem[];
+  next_cursor: string | null;
+}
+
+// Historique paginé par curseur : passer le next_cursor de la page précédente
+export const fetchReportHistory = async (params: {
+  cursor?: string;
+  limit?: number;
+  fields?: Array<'summary' | 'answers'>;
+  from?: string;
+  to?: string;
+} = {}): Promise<ReportHistoryPage> => {
+  const { fields, ...rest } = params;
+  const { data } = await api.get<ReportHistoryPage>('/reports', {
+    params: { ...rest, ...(fields ? { fields: fields.join(',') } : {}) }
+  });
+  return data;
+};
+
+export interface SimilarDay {
+  id: number;
+  date: string;
+  summary: string;
+  score: number;
+}
+
+// Jours proches du rapport du jour (ou d'une date, ou d'un texte libre)
+export const fetchSimilarDays = async (params: {
+  k?: number;
+  date?: string;
+  q?: string;
+} = {}): Promise<SimilarDay[]> => {
+  const { data } = await api.get<{ items: SimilarDay[] }>('/reports/similar', { params });
+  return data.items;
+};
+
+export interface SearchResult {
+  id: number;
+  date: string;
+  snippet: string; // HTML échappé, termes trouvés entre <mark>
+  score: number;
+}
+
+// Recherche plein texte dans les résumés et les réponses, résultats les plus pertinents d'abord
+export const searchReports = async (q: string, limit?: number): Promise<SearchResult[]> => {
+  const { data } = await api.get<{ items: SearchResult[] }>('/search', { params: { q, limit } });
+  return data.items;
+};
+
 
 // Fonction utilitaire pour vérifier si un token est expiré
 export const isTokenExpired = (token: string): boolean => {